@@ -0,0 +1,102 @@
+"""
+This module keeps every node's nodes_within up to date with its code. Edits are collected
+until the user stops typing for ANALYSIS_DELAY, then the edited nodes are analyzed on a
+worker thread (see CodeAnalysis.py) and the symbols are handed back to the GUI thread.
+Nodes the canvas shows for the first time, loaded or pasted, are analyzed the same way.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, QTimer, Signal
+from CodeAnalysis import StatementCache
+
+
+#how long after the last edit the code is analyzed (milliseconds)
+ANALYSIS_DELAY = 300
+
+
+class AnalysisService(QObject):
+    nodeAnalyzed = Signal(object)#node id, after its nodes_within changed
+    analyzed = Signal(object, int, object)#node id, version, symbols, from the worker
+
+    def __init__(self, canvas, delay=ANALYSIS_DELAY):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.pending = set()#ids of nodes edited since the last analysis
+        self.version = 0#bumped for every code sent, so a result is never taken for a later one
+        self.versions = {}#node id -> version of the code sent to the worker last
+        #node id -> the node sent, the canvas may show another level of sub-graphs by the time it's analyzed
+        self.sent = {}
+        self.caches = {}#node id -> StatementCache, only used on the worker
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analysis")
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+        self.analyzed.connect(self.apply)
+
+    def schedule(self, node_id):
+        """analyze a node once the user stops typing, every edit restarts the wait"""
+        self.pending.add(node_id)
+        self.timer.start()
+
+    def scheduleNew(self, nodes):
+        """analyze the nodes that were never sent to the worker, like the nodes of a
+        project that was loaded or nodes that were pasted"""
+        new = [node.id for node in nodes if node.id not in self.versions and node.id not in self.pending]
+        if new:
+            self.pending.update(new)
+            self.timer.start()
+
+    def forget(self, nodes):
+        """drop what is kept for nodes removed from the graph"""
+        for node in nodes:
+            self.pending.discard(node.id)
+            self.versions.pop(node.id, None)
+            self.sent.pop(node.id, None)
+            self.caches.pop(node.id, None)
+
+    def reset(self):
+        """forget every node, the project was replaced. Results still on their way are dropped"""
+        self.timer.stop()
+        self.pending = set()
+        self.versions = {}
+        self.sent = {}
+        self.caches = {}
+
+    def flush(self):
+        """send the code of the pending nodes to the worker"""
+        pending, self.pending = self.pending, set()
+        for node_id in pending:
+            node = self.canvas.model.nodes.get(node_id)
+            if node is None:
+                continue
+            self.version += 1
+            self.versions[node_id] = self.version
+            self.sent[node_id] = node
+            self.worker.submit(self.analyze, node_id, self.version, node.code)
+
+    def analyze(self, node_id, version, source):
+        """runs on the worker thread"""
+        if self.versions.get(node_id) != version:
+            return#edited again or removed since it was sent
+        cache = self.caches.get(node_id)
+        if cache is None:
+            cache = self.caches[node_id] = StatementCache()
+        symbols = cache.analyze(source)
+        try:
+            self.analyzed.emit(node_id, version, symbols)
+        except RuntimeError:
+            pass#the service was deleted while we were analyzing
+
+    def apply(self, node_id, version, symbols):
+        if self.versions.get(node_id) != version:
+            return#the node was edited again, a newer analysis is on its way
+        node = self.sent.pop(node_id, None)
+        if node is None:
+            return
+        node.nodes_within = symbols
+        self.nodeAnalyzed.emit(node_id)
+
+    def shutdown(self):
+        self.timer.stop()
+        self.worker.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,127 @@
+"""
+This module packs a selection of nodes, and the edges between them, into the payload the
+canvas puts on the clipboard, and unpacks it into new nodes of a graph. The payload is laid
+out like a project archive (see ProjectArchive.py), compressed after the header:
+
+    header      magic, format version, node/edge/class counts, where the selection was
+    classes     the node class names, each a u16 length and utf-8 bytes
+    node table  one record per node: position relative to the selection, class index,
+                lengths of the node's text, code and sub-graph
+    edge table  one (source index, dest index) record per edge, into the node table
+    blob area   the utf-8 text and code of every node, and the sub-graph of containers as
+                a JSON project, back to back
+
+Node ids aren't stored, pasted nodes (and the nodes of their sub-graphs) get new ones from
+GraphModel.newId. The payload only
+holds bytes, so it can be pasted into another running instance. It does not import Qt.
+"""
+
+import json, struct, zlib
+from GraphModel import GraphModel, Node
+
+
+MIME_TYPE = "application/x-nodebook-nodes"
+MAGIC = b"NBKC"
+FORMAT_VERSION = 1
+#zlib level of the payload, the fastest one already shrinks code a lot
+COMPRESSION = 1
+
+# magic, version, node count, edge count, class count, x and y of the selection's top left
+HEADER = struct.Struct("<4sHIIHdd")
+CLASS_LENGTH = struct.Struct("<H")
+# x, y relative to the top left, class index, text length, code length, sub-graph length
+NODE_RECORD = struct.Struct("<ddHIII")
+# source index, dest index
+EDGE_RECORD = struct.Struct("<II")
+
+
+def internalEdges(nodes):
+    """the edges whose both ends are among the nodes"""
+    ids = {node.id for node in nodes}
+    return [edge for node in nodes for edge in node.output_pin.edges.values() if edge.dest.node.id in ids]
+
+
+def packNodes(nodes):
+    """the payload of nodes of a model and the edges between them"""
+    nodes = list(nodes)
+    index = {node.id: i for i, node in enumerate(nodes)}
+    left = min((node.x for node in nodes), default=0.0)
+    top = min((node.y for node in nodes), default=0.0)
+    class_index = {}
+    node_table = bytearray()
+    blobs = []
+    for node in nodes:
+        text = node.text.encode("utf-8")
+        code = node.rawCode()#archived code is copied without being decoded
+        subgraph = b""
+        if node.subgraph is not None:
+            subgraph = json.dumps(node.subgraph.toDict(), separators=(",", ":")).encode("utf-8")
+        node_table += NODE_RECORD.pack(node.x - left, node.y - top,
+                                       class_index.setdefault(node.class_name, len(class_index)),
+                                       len(text), len(code), len(subgraph))
+        blobs.append(text)
+        blobs.append(code)
+        blobs.append(subgraph)
+    edges = internalEdges(nodes)
+    edge_table = b"".join(EDGE_RECORD.pack(index[edge.source.node.id], index[edge.dest.node.id]) for edge in edges)
+    classes = b"".join(CLASS_LENGTH.pack(len(encoded)) + encoded
+                       for encoded in (name.encode("utf-8") for name in class_index))
+    body = b"".join([classes, bytes(node_table), edge_table] + blobs)
+    return (HEADER.pack(MAGIC, FORMAT_VERSION, len(nodes), len(edges), len(class_index), left, top)
+            + zlib.compress(body, COMPRESSION))
+
+
+def payloadOrigin(payload):
+    """where the top left of the packed nodes was when they were copied"""
+    if len(payload) < HEADER.size or payload[:4] != MAGIC:
+        raise ValueError("the clipboard doesn't hold NodeBook nodes")
+    return HEADER.unpack_from(payload)[5:]
+
+
+def unpackNodes(model, payload, x=None, y=None):
+    """add the nodes of a payload to a model, with new ids, their top left at x, y or
+    where they were copied from. Returns the new nodes and the keys of their edges"""
+    payloadOrigin(payload)
+    magic, version, node_count, edge_count, class_count, left, top = HEADER.unpack_from(payload)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"the nodes were copied from a newer version of NodeBook (format {version})")
+    left = left if x is None else x
+    top = top if y is None else y
+    #everything is decoded before the model is changed, a damaged payload changes nothing
+    try:
+        body = zlib.decompress(payload[HEADER.size:])
+        offset = 0
+        class_names = []
+        for _ in range(class_count):
+            length, = CLASS_LENGTH.unpack_from(body, offset)
+            offset += CLASS_LENGTH.size
+            class_names.append(body[offset:offset + length].decode("utf-8"))
+            offset += length
+        node_end = offset + node_count * NODE_RECORD.size
+        edge_end = node_end + edge_count * EDGE_RECORD.size
+        records = list(NODE_RECORD.iter_unpack(body[offset:node_end]))
+        edge_records = list(EDGE_RECORD.iter_unpack(body[node_end:edge_end]))
+        offset = edge_end
+        decoded = []
+        for node_x, node_y, class_index, text_length, code_length, subgraph_length in records:
+            text = body[offset:offset + text_length].decode("utf-8")
+            offset += text_length
+            code = body[offset:offset + code_length].decode("utf-8")
+            offset += code_length
+            subgraph = json.loads(body[offset:offset + subgraph_length]) if subgraph_length else None
+            offset += subgraph_length
+            decoded.append((text, code, class_names[class_index], left + node_x, top + node_y, subgraph))
+        if offset != len(body) or any(source >= node_count or dest >= node_count for source, dest in edge_records):
+            raise ValueError("the payload doesn't match its tables")
+    except (zlib.error, struct.error, UnicodeDecodeError, IndexError) as error:
+        raise ValueError(f"the clipboard holds damaged NodeBook nodes: {error}") from error
+
+    nodes = []
+    for text, code, class_name, node_x, node_y, subgraph in decoded:
+        node = Node(text=text, code=code, node_number=model.newId(), class_name=class_name, x=node_x, y=node_y)
+        if subgraph is not None:
+            node.subgraph = GraphModel().loadDict(subgraph, model.newId)
+        nodes.append(model.addNode(node))
+    edge_keys = [model.connect(nodes[source].output_pin, nodes[dest].input_pin).key()
+                 for source, dest in edge_records]
+    return nodes, edge_keys
@@ -0,0 +1,169 @@
+"""
+This module finds the variables, functions and classes defined in a node's code, which
+the node lists in nodes_within. The code is split into its top level statements without
+parsing it, and every statement is parsed on its own with ast. The symbols of each
+statement are cached by its text, so after an edit only the statements that changed are
+parsed again. It does not import Qt.
+"""
+
+import ast, re
+
+
+VARIABLE = "variable"
+FUNCTION = "function"
+CLASS = "class"
+
+#top level lines starting with these continue the statement before them
+CONTINUATION = re.compile(r"(else|elif|except|finally)\b")
+#the line a run of decorators ends with
+DECORATED = re.compile(r"(async\s+def|def|class)\b")
+#syntax errors that mean the statement continues on a later top level line, like an
+#unclosed bracket or a triple quoted string with unindented lines in it
+UNFINISHED = ("was never closed", "unterminated", "unexpected EOF", "EOF while")
+
+
+class Symbol:
+    """A variable, function or class defined in a node's code. Lines are 1 based, and
+    the symbols defined inside a function or class are its children"""
+    __slots__ = ("kind", "name", "line", "end_line", "children")
+
+    def __init__(self, kind, name, line, end_line, children=()):
+        self.kind = kind
+        self.name = name
+        self.line = line
+        self.end_line = end_line
+        self.children = list(children)
+
+    def shifted(self, offset):
+        """a copy of the symbol moved down by offset lines"""
+        if offset == 0:
+            return self
+        return Symbol(self.kind, self.name, self.line + offset, self.end_line + offset,
+                      [child.shifted(offset) for child in self.children])
+
+    def __repr__(self):
+        return f"Symbol({self.kind}, {self.name!r}, {self.line})"
+
+
+def splitStatements(source):
+    """split code into (first line index, text) spans, one per top level statement.
+    Blank and comment lines go with the statement before them"""
+    lines = source.splitlines(keepends=True)
+    spans = []
+    start = None
+    decorators = False#the span so far is only decorators, and the lines continuing them
+    for index, line in enumerate(lines):
+        stripped = line.lstrip()
+        if not stripped or stripped[0] == "#" or line[0] in " \t":
+            continue
+        if start is not None:
+            if decorators:
+                decorators = not DECORATED.match(stripped)
+                continue
+            if stripped[0] in ")]}" or CONTINUATION.match(stripped):
+                continue
+            spans.append((start, "".join(lines[start:index])))
+        start = index
+        decorators = stripped[0] == "@"
+    if start is not None:
+        spans.append((start, "".join(lines[start:])))
+    return spans
+
+
+def symbolsOf(statements, seen=None):
+    """the symbols defined by a list of ast statements, in order. A name assigned more
+    than once is listed at its first assignment"""
+    seen = set() if seen is None else seen
+    symbols = []
+
+    def add(kind, name, node, children=()):
+        if kind == VARIABLE:
+            if name in seen:
+                return
+            seen.add(name)
+        symbols.append(Symbol(kind, name, node.lineno, node.end_lineno, children))
+
+    for statement in statements:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add(FUNCTION, statement.name, statement, symbolsOf(statement.body))
+        elif isinstance(statement, ast.ClassDef):
+            add(CLASS, statement.name, statement, symbolsOf(statement.body))
+        elif isinstance(statement, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        add(VARIABLE, name.id, statement)
+        elif isinstance(statement, (ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try)):
+            #definitions inside compound statements, like `if __name__ == ...` or `try: import`
+            for body in ("body", "orelse", "finalbody"):
+                symbols.extend(symbolsOf(getattr(statement, body, []), seen))
+            for handler in getattr(statement, "handlers", []):
+                symbols.extend(symbolsOf(handler.body, seen))
+    return symbols
+
+
+class StatementCache:
+    """Analyzes one node's code. Keeps the symbols of the statements of the last version
+    it analyzed, keyed by their text, so the next version only parses what changed"""
+    def __init__(self):
+        self.statements = {}#statement text -> symbols with lines relative to it, None if it doesn't parse
+        self.parsed = 0#statements parsed by the last analysis, for tests and profiling
+        self.errors = []#1 based lines of the statements that don't parse
+
+    def parse(self, text, statements):
+        """symbols of a statement, None if it doesn't parse and False if it looks like it
+        continues after its text. The result is kept in statements"""
+        if text in self.statements:
+            result = statements[text] = self.statements[text]
+            return result
+        result = statements[text] = self.parseText(text)
+        return result
+
+    def parseText(self, text):
+        self.parsed += 1
+        try:
+            symbols = symbolsOf(ast.parse(text).body)
+        except SyntaxError as error:
+            if any(message in str(error.msg) for message in UNFINISHED):
+                return False#it may continue in the next statement
+            symbols = None
+        except ValueError:
+            symbols = None#null bytes
+        return symbols
+
+    def analyze(self, source):
+        """the symbols defined in the code, with lines counted from the top of it"""
+        self.parsed = 0
+        self.errors = []
+        spans = splitStatements(source)
+        statements = {}
+        symbols = []
+        variables = set()
+        index = 0
+        while index < len(spans):
+            start, text = spans[index]
+            result = self.parse(text, statements)
+            #a statement that doesn't end where the split thought it does is parsed
+            #together with the ones after it, taking twice as many each try
+            end = index
+            step = 1
+            while result is False and end + 1 < len(spans):
+                end = min(end + step, len(spans) - 1)
+                step *= 2
+                text = "".join(span[1] for span in spans[index:end + 1])
+                result = self.parse(text, statements)
+            if result is None or result is False:
+                #only this statement is broken, like a bracket that is still being typed
+                self.errors.append(start + 1)
+                index += 1
+                continue
+            for symbol in result:
+                if symbol.kind == VARIABLE:
+                    if symbol.name in variables:
+                        continue
+                    variables.add(symbol.name)
+                symbols.append(symbol.shifted(start))
+            index = end + 1
+        self.statements = statements
+        return symbols
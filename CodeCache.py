@@ -0,0 +1,118 @@
+"""
+This module caches the compiled code of nodes. A node's code is compiled once to a code
+object, keyed by a hash of its source and of the interpreter's cache tag, and kept in
+memory and, like __pycache__, in a directory next to the project. Workers in other
+processes are sent the marshalled code instead of the source. It does not import Qt.
+"""
+
+import hashlib, importlib.util, marshal, os, sys, threading
+
+
+CACHE_DIR_NAME = "__nbcache__"
+#marshalled code is only valid for the interpreter that wrote it
+MAGIC = importlib.util.MAGIC_NUMBER
+
+
+def codeKey(filename, source):
+    key = hashlib.sha256(sys.implementation.cache_tag.encode("ascii"))
+    key.update(filename.encode("utf-8") + b"\0")
+    key.update(source.encode("utf-8"))
+    return key.hexdigest()
+
+
+class CompiledCode:
+    """A node's code object and its marshalled bytes"""
+    __slots__ = ("key", "code", "data")
+
+    def __init__(self, key, code, data):
+        self.key = key
+        self.code = code
+        self.data = data
+
+
+class CodeCache:
+    """Compiled code of every node, one entry per node id. A node whose source changed
+    gets a new key, and its old entry is dropped from memory and disk"""
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.entries = {}#node id -> CompiledCode
+        self.stale = {}#node id -> key of the code it had before it was edited
+        self.lock = threading.Lock()
+        self.compiled = 0#how many times code had to be compiled, for tests and profiling
+
+    def setDirectory(self, directory):
+        """persist compiled code in a directory, or only in memory with None"""
+        with self.lock:
+            self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".bin")
+
+    def get(self, node_id, source):
+        """the CompiledCode of a node's source. Raises SyntaxError if it doesn't compile"""
+        filename = f"<node {node_id}>"
+        key = codeKey(filename, source)
+        with self.lock:
+            entry = self.entries.get(node_id)
+            if entry is not None and entry.key == key:
+                return entry
+            stale_key = entry.key if entry is not None else self.stale.pop(node_id, None)
+            entry = self.load(key)
+            if entry is None:
+                code = compile(source, filename, "exec")
+                self.compiled += 1
+                entry = CompiledCode(key, code, marshal.dumps(code))
+                self.store(entry)
+            self.entries[node_id] = entry
+            if stale_key is not None and stale_key != key:
+                self.remove(stale_key)
+            return entry
+
+    def invalidate(self, node_id):
+        """forget a node's compiled code when its source is edited. The file stays until
+        the node is compiled again, in case the edit is reverted"""
+        with self.lock:
+            entry = self.entries.pop(node_id, None)
+            if entry is not None:
+                self.stale[node_id] = entry.key
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if data[:len(MAGIC)] != MAGIC:
+            return None
+        data = data[len(MAGIC):]
+        try:
+            return CompiledCode(key, marshal.loads(data), data)
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def store(self, entry):
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self.path(entry.key) + ".tmp"
+            with open(temp_path, "wb") as file:
+                file.write(MAGIC + entry.data)
+            os.replace(temp_path, self.path(entry.key))
+        except OSError:
+            pass#the cache is only an optimization, a read only project still runs
+
+    def remove(self, key):
+        if self.directory is None:
+            return
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.stale = {}
@@ -29,14 +29,22 @@ class ContextMenu(QMenu):
         self.addAction(self.select_all_action)
         self.addAction(self.undo_action)
         self.addAction(self.redo_action)
+        #every menu undoes and redoes the canvas's history, whatever was clicked
+        self.undo_action.triggered.connect(lambda: self.canvas.undo())
+        self.redo_action.triggered.connect(lambda: self.canvas.redo())
 
     
     def setActionsEnabled(self, delete_enabled=False, copy_enabled=False, 
                             paste_enabled=False, cut_enabled=False, select_all_enabled=False,
-                            undo_enabled=False, redo_enabled=False):
+                            undo_enabled=None, redo_enabled=None):
         # set the enabled state of the actions based on the context of the right-click,
         # for example, if the user right-clicks on a node, the delete action should be enabled
         # if the user right-clicks on a blank space, the delete action should be disabled
+        # undo and redo follow the canvas's history unless they are given
+        if undo_enabled is None:
+            undo_enabled = self.canvas is not None and self.canvas.history.canUndo()
+        if redo_enabled is None:
+            redo_enabled = self.canvas is not None and self.canvas.history.canRedo()
         self.delete_action.setEnabled(delete_enabled)
         self.copy_action.setEnabled(copy_enabled)
         self.paste_action.setEnabled(paste_enabled)
@@ -57,13 +65,43 @@ class NodeContextMenu(ContextMenu):
         super().__init__(canvas)
         self.node = node
         self.canvas = canvas
-        self.setActionsEnabled(delete_enabled=True, copy_enabled=True)
+        self.setActionsEnabled(delete_enabled=True, copy_enabled=True, cut_enabled=True,
+                               paste_enabled=canvas.canPaste(), select_all_enabled=True)
+        #runs the node and the nodes it depends on
+        self.run_action = QAction("Run")
+        self.insertAction(self.cut_action, self.run_action)
+        self.insertSeparator(self.cut_action)
+        self.duplicate_action = QAction("Duplicate")
+        self.disconnect_action = QAction("Disconnect")
+        self.insertAction(self.select_all_action, self.duplicate_action)
+        self.insertAction(self.select_all_action, self.disconnect_action)
+        #a container shows its sub-graph in place of the canvas's level
+        self.open_action = QAction("Open Sub-graph")
+        self.group_action = QAction("Group Into Sub-graph")
+        self.insertAction(self.cut_action, self.open_action)
+        self.insertAction(self.select_all_action, self.group_action)
         self.connectActionsToMethods()
 
+    def targets(self):
+        """the model nodes the actions apply to: the whole selection when the clicked
+        node is part of it, otherwise only the clicked node"""
+        if self.node.id in self.canvas.selection:
+            return self.canvas.selectedNodes()
+        return [self.node.node]
+
     def connectActionsToMethods(self):
-        # print("NodeContextMenu.connect_actions_to_methods canvas", self.canvas) 
-        # connect the actions to the appropriate methods in Node.py
-        self.delete_action.triggered.connect(lambda: self.canvas.deleteNodeAndEdges(self.node))
+        # connect the actions to the appropriate methods of the canvas, they work on the
+        # nodes of the model so that selected nodes scrolled out of view are included
+        self.run_action.triggered.connect(lambda: self.canvas.runNodes([self.node]))
+        self.delete_action.triggered.connect(lambda: self.canvas.deleteNodes(self.targets()))
+        self.duplicate_action.triggered.connect(lambda: self.canvas.duplicateNodes(self.targets()))
+        self.disconnect_action.triggered.connect(lambda: self.canvas.disconnectNodes(self.targets()))
+        self.open_action.triggered.connect(lambda: self.canvas.enterSubgraph(self.node.node))
+        self.group_action.triggered.connect(lambda: self.canvas.groupNodes(self.targets()))
+        self.copy_action.triggered.connect(lambda: self.canvas.copy(self.targets()))
+        self.cut_action.triggered.connect(lambda: self.canvas.cut(self.targets()))
+        self.paste_action.triggered.connect(lambda: self.canvas.paste())
+        self.select_all_action.triggered.connect(self.canvas.selectAll)
         # self.copy_action.triggered.connect(self.canvas.copy_node)
 
 
@@ -78,4 +116,27 @@ class EdgeContextMenu(ContextMenu):
     def connectActionsToMethods(self):
         # connect the actions to the appropriate methods in Edge.py
         self.delete_action.triggered.connect(lambda: self.canvas.deleteEdge(self.edge))
-    
\ No newline at end of file
+    
+
+
+class CanvasContextMenu(ContextMenu):
+    def __init__(self, canvas=None, scene_pos=None):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.scene_pos = scene_pos#where the menu was opened, pasted nodes go there
+        self.setActionsEnabled(select_all_enabled=True, delete_enabled=bool(canvas.selection),
+                               copy_enabled=bool(canvas.selection), cut_enabled=bool(canvas.selection),
+                               paste_enabled=canvas.canPaste())
+        self.up_action = QAction("Up One Level")
+        self.up_action.setEnabled(bool(canvas.levels))
+        self.insertAction(self.cut_action, self.up_action)
+        self.connectActionsToMethods()
+
+    def connectActionsToMethods(self):
+        # delete, copy and cut work on the selection, there is no node under the mouse
+        self.up_action.triggered.connect(self.canvas.leaveSubgraph)
+        self.select_all_action.triggered.connect(self.canvas.selectAll)
+        self.delete_action.triggered.connect(lambda: self.canvas.deleteNodes(self.canvas.selectedNodes()))
+        self.copy_action.triggered.connect(lambda: self.canvas.copy())
+        self.cut_action.triggered.connect(lambda: self.canvas.cut())
+        self.paste_action.triggered.connect(lambda: self.canvas.paste(self.scene_pos))
@@ -1,23 +1,84 @@
 from PySide6.QtWidgets import QGraphicsItem
-from PySide6.QtCore import Qt, QLineF, QPointF, QSizeF, QRectF
-from PySide6.QtGui import QPolygonF
+from PySide6.QtCore import Qt, QLineF, QPointF, QRectF
+from PySide6.QtGui import QPolygonF, QPen, QBrush
 from ContextMenu import EdgeContextMenu
+from PerfMonitor import timed, PAINT
+from Trace import CANVAS
 # from Node import Node
 import math
 
+
+ARROW_SIZE = 20
+#the tips of an edge stop this far from the centers of its pins, at the border of the node
+TIP_OFFSET = 10
+PEN_WIDTH = 1
+#how far the arrow heads reach outside the rectangle between the tips
+EDGE_MARGIN = (PEN_WIDTH + ARROW_SIZE) / 2.0
+EDGE_PEN = QPen(Qt.GlobalColor.black, PEN_WIDTH)
+EDGE_BRUSH = QBrush(Qt.GlobalColor.black)
+
+
+def arrowHead(tip, angle_a, angle_b):
+    """closed triangle with its point at tip, always wound the same way so the arrow heads
+    of many edges can be filled as one path"""
+    a = tip + QPointF(math.sin(angle_a) * ARROW_SIZE, math.cos(angle_a) * ARROW_SIZE)
+    b = tip + QPointF(math.sin(angle_b) * ARROW_SIZE, math.cos(angle_b) * ARROW_SIZE)
+    if (a.x() - tip.x()) * (b.y() - tip.y()) - (a.y() - tip.y()) * (b.x() - tip.x()) < 0:
+        a, b = b, a
+    return QPolygonF([tip, a, b, tip])
+
+
+class EdgeGeometry:
+    """What drawing an edge needs, computed once after one of its ends moved instead of on
+    every paint: the line between its pins, shortened so the tips touch the nodes, its two
+    arrow heads and its bounding rectangle. Edges too short to draw have no arrow heads"""
+    __slots__ = ("ends", "line", "source_arrow", "dest_arrow", "rect")
+
+    def __init__(self, source, dest):
+        self.ends = (source.x(), source.y(), dest.x(), dest.y())
+        line = QLineF(source, dest)
+        length = line.length()
+        if length > 2 * TIP_OFFSET:
+            offset = QPointF(line.dx() * TIP_OFFSET / length, line.dy() * TIP_OFFSET / length)
+            self.line = QLineF(source + offset, dest - offset)
+        else:
+            self.line = QLineF(source, source)
+        self.rect = QRectF(self.line.p1(), self.line.p2()).normalized().adjusted(
+            -EDGE_MARGIN, -EDGE_MARGIN, EDGE_MARGIN, EDGE_MARGIN)
+        if length <= 2 * TIP_OFFSET:
+            self.source_arrow = self.dest_arrow = None
+            return
+        angle = math.atan2(-line.dy(), line.dx())
+        self.source_arrow = arrowHead(self.line.p1(), angle + math.pi / 3, angle + math.pi - math.pi / 3)
+        self.dest_arrow = arrowHead(self.line.p2(), angle - math.pi / 3, angle - math.pi + math.pi / 3)
+
+    def moved(self, source, dest):
+        """whether the pins are no longer where the geometry was computed for"""
+        return self.ends != (source.x(), source.y(), dest.x(), dest.y())
+
+    def drawable(self):
+        return self.source_arrow is not None
+
+
 class Edge(QGraphicsItem):
+    """Graphic representation of a GraphModel.Edge. The end points are computed from the
+    model, so an edge can be drawn even when the node at one of its ends has no item.
+    Only used when the canvas doesn't draw its edges with an EdgeLayer (see EdgeLayer.py)"""
     # The Type attribute is used to distinguish between different types of items in the scene.
     Type = QGraphicsItem.UserType + 2
 
-    def __init__(self, sourcePin, destPin, canvas):
+    def __init__(self, edge, canvas):
         super().__init__()
 
         self.canvas = canvas       
-        self.source = sourcePin
-        self.dest = destPin
-        
-        self.source.addEdge(self)
-        self.dest.addEdge(self)
+        self.bind(edge)
+
+    def bind(self, edge):
+        """show another edge of the model, used when the canvas recycles items"""
+        self.edge = edge
+        self.source = edge.source
+        self.dest = edge.dest
+        self.geometry = None
         self.adjust()
 
     def sourceNode(self):
@@ -26,23 +87,22 @@ class Edge(QGraphicsItem):
     def destNode(self):
         return self.dest
 
+    def key(self):
+        """the (source node id, dest node id) key the graph indexes this edge by"""
+        return self.edge.key()
+
     def adjust(self):
         if not self.source or not self.dest:
             return
-        
-        line = QLineF(self.mapFromItem(self.source, 0, 0), self.mapFromItem(self.dest, 0, 0))
-        length = line.length()
+        source = self.canvas.pinScenePos(self.source)
+        dest = self.canvas.pinScenePos(self.dest)
+        if self.geometry is not None and not self.geometry.moved(source, dest):
+            return
 
         # tell Qt that the item is about to change, and that it should be redrawn.
         self.prepareGeometryChange()
-        
-        #make the tip of the edge touch the border of the node, not from center of the node to center
-        if length > 20:
-            edgeOffset = QPointF((line.dx() * 10) / length, (line.dy() * 10) / length)
-            self.sourcePoint = line.p1() + edgeOffset
-            self.destPoint = line.p2() - edgeOffset
-        else:
-            self.sourcePoint = self.destPoint = line.p1()
+        #edge items stay at the origin of the scene, scene and item coordinates are the same
+        self.geometry = EdgeGeometry(source, dest)
 
 
     #override
@@ -50,75 +110,32 @@ class Edge(QGraphicsItem):
         return Edge.Type
     
     def boundingRect(self):
-        if not self.source or not self.dest:
+        if self.geometry is None:
             return QRectF()
-
-        penWidth = 1
-        arrowSize = 20
-        extra = (penWidth + arrowSize) / 2.0
-
-        return QRectF(
-            self.sourcePoint, 
-            QSizeF(
-                self.destPoint.x() - self.sourcePoint.x(), 
-                self.destPoint.y() - self.sourcePoint.y()
-                )).normalized().adjusted(-extra, -extra, extra, extra)
+        return self.geometry.rect
     
     #override
+    @timed(PAINT)
     def paint(self, painter, option, widget):
-
-        if not self.source or not self.dest:
-            return
-        line = QLineF(self.sourcePoint, self.destPoint)
-
-        if line.length() == 0.0:
+        geometry = self.geometry
+        if geometry is None or not geometry.drawable():
             return
 
-        # Draw the line itself
-        painter.setPen(Qt.PenStyle.SolidLine)
-        painter.setBrush(Qt.GlobalColor.black)
-        painter.drawLine(line)
-
-        # Draw the arrows
-        arrowSize = 20
-        angle = math.atan2(-line.dy(), line.dx())
-        
-        sourceArrowP1 = self.sourcePoint + QPointF(
-            math.sin(angle + math.pi / 3) * arrowSize,
-            math.cos(angle + math.pi / 3) * arrowSize
-        )
-
-        sourceArrowP2 = self.sourcePoint + QPointF(
-            math.sin(angle + math.pi - math.pi / 3) * arrowSize,
-            math.cos(angle + math.pi - math.pi / 3) * arrowSize
-        )
-
-        destArrowP1 = self.destPoint + QPointF(
-            math.sin(angle - math.pi / 3) * arrowSize,
-            math.cos(angle - math.pi / 3) * arrowSize
-        )
-
-        destArrowP2 = self.destPoint + QPointF(
-            math.sin(angle - math.pi + math.pi / 3) * arrowSize,
-            math.cos(angle - math.pi + math.pi / 3) * arrowSize
-        )
-
-        painter.setBrush(Qt.GlobalColor.black)
-        painter.drawPolygon(QPolygonF([line.p1(), sourceArrowP1, sourceArrowP2]))
-        painter.drawPolygon(QPolygonF([line.p2(), destArrowP1, destArrowP2]))
+        painter.setPen(EDGE_PEN)
+        painter.setBrush(EDGE_BRUSH)
+        painter.drawLine(geometry.line)
+        painter.drawPolygon(geometry.source_arrow)
+        painter.drawPolygon(geometry.dest_arrow)
 
     def mousePressEvent(self, event):
-        print("NodeGraphic.mousePressEvent")
+        CANVAS.debug("Edge.mousePressEvent")
         if event.button() == Qt.RightButton:
-            print("Right click on edge")
-            context_menu = EdgeContextMenu(canvas = self.canvas, edge = self)
+            CANVAS.debug("Right click on edge")
+            context_menu = EdgeContextMenu(canvas = self.canvas, edge = self.edge)
             context_menu.exec(event.screenPos())
         else:
             super().mousePressEvent(event)
 
     def toDict(self):
         # print(f"Edge.to_dict: source: {self.source.parent.id}, dest: {self.dest.parent.id}")
-        return {
-            "source_node_id": self.source.parent.id,
-            "dest_node_id": self.dest.parent.id
-        }
\ No newline at end of file
+        return self.edge.toDict()
\ No newline at end of file
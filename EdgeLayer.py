@@ -0,0 +1,184 @@
+"""
+This module draws every edge of the graph with one item. The EdgeLayer keeps the
+EdgeGeometry of each edge (see Edge.py), computed the first time the edge is drawn and
+again only after one of its ends moved, and paints the edges in the exposed part of the
+scene with one drawLines call and one path of arrow heads per style, instead of painting
+an Edge item per edge. The edges to draw are found through the canvas's edge index.
+"""
+
+import math
+from PySide6.QtWidgets import QGraphicsItem
+from PySide6.QtCore import Qt, QRectF
+from PySide6.QtGui import QPainterPath
+from Edge import EdgeGeometry, EDGE_PEN, EDGE_BRUSH
+from PerfMonitor import timed, PAINT
+
+
+DEFAULT_STYLE = "default"
+#style name -> (pen of the lines, brush of the arrow heads)
+STYLES = {DEFAULT_STYLE: (EDGE_PEN, EDGE_BRUSH)}
+#below this zoom the arrow heads are only a few pixels big, just the lines are drawn
+ARROW_MIN_SCALE = 0.3
+#the bounding rectangle grows by at least this much, so it rarely changes while dragging
+GROWTH = 1000.0
+
+
+def segmentDistance(x, y, line):
+    """distance from a point to a QLineF"""
+    x1, y1, x2, y2 = line.x1(), line.y1(), line.x2(), line.y2()
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+    return math.hypot(x - x1 - t * dx, y - y1 - t * dy)
+
+
+class EdgeLayer(QGraphicsItem):
+    """Draws the edges of the canvas's model, it has no item per edge. It takes no mouse
+    buttons and has an empty shape, so clicks reach the items under it and the view, which
+    finds the edge under the mouse with edgeAt"""
+    Type = QGraphicsItem.UserType + 3
+
+    def __init__(self, canvas):
+        super().__init__()
+        self.canvas = canvas
+        self.geometry = {}#edge key -> EdgeGeometry, of the edges drawn since they last moved
+        self.styles = {}#edge key -> style name, edges not in it are drawn in DEFAULT_STYLE
+        self.bounds = QRectF()
+        self.setZValue(-1)#under the nodes
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        #paint gets the exposed rectangle, so only the edges in it are drawn
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    #override
+    def type(self):
+        return EdgeLayer.Type
+
+    def boundingRect(self):
+        return self.bounds
+
+    def shape(self):
+        return QPainterPath()
+
+    @staticmethod
+    def toRect(rect):
+        x1, y1, x2, y2 = rect
+        return QRectF(x1, y1, x2 - x1, y2 - y1)
+
+    def include(self, rect):
+        """grow the bounding rectangle to contain an (x1, y1, x2, y2) rectangle"""
+        rect = self.toRect(rect)
+        if self.bounds.contains(rect):
+            return
+        self.prepareGeometryChange()
+        self.bounds = self.bounds.united(rect.adjusted(-GROWTH, -GROWTH, GROWTH, GROWTH))
+
+    def reset(self):
+        """forget every edge's geometry and fit the bounding rectangle to the edge index,
+        after the model was replaced"""
+        self.geometry = {}
+        self.styles = {}
+        rects = self.canvas.edge_index.rects.values()
+        self.prepareGeometryChange()
+        if rects:
+            self.bounds = self.toRect((min(rect[0] for rect in rects), min(rect[1] for rect in rects),
+                                       max(rect[2] for rect in rects), max(rect[3] for rect in rects)))
+        else:
+            self.bounds = QRectF()
+        self.update()
+
+    def edgeGeometry(self, key):
+        """the geometry of an edge, computed if it moved since it was last drawn"""
+        geometry = self.geometry.get(key)
+        if geometry is None:
+            edge = self.canvas.model.edges.get(key)
+            if edge is None:
+                return None
+            geometry = self.geometry[key] = EdgeGeometry(self.canvas.pinScenePos(edge.source),
+                                                         self.canvas.pinScenePos(edge.dest))
+        return geometry
+
+    def edgeChanged(self, edge):
+        """an edge was added or one of its ends may have moved, called after the canvas
+        indexed it. Its geometry is computed again when it is next drawn"""
+        key = edge.key()
+        geometry = self.geometry.get(key)
+        if geometry is not None:
+            if not geometry.moved(self.canvas.pinScenePos(edge.source), self.canvas.pinScenePos(edge.dest)):
+                return
+            del self.geometry[key]
+            self.update(geometry.rect)
+        rect = self.canvas.edge_index.rects.get(key)
+        if rect is not None:
+            self.include(rect)
+            self.update(self.toRect(rect))
+
+    def edgeRemoved(self, key):
+        """called before the canvas removes the edge from its index"""
+        geometry = self.geometry.pop(key, None)
+        self.styles.pop(key, None)
+        if geometry is not None:
+            self.update(geometry.rect)
+        elif key in self.canvas.edge_index:
+            self.update(self.toRect(self.canvas.edge_index.rects[key]))
+
+    def setStyle(self, key, style=DEFAULT_STYLE):
+        """draw an edge with one of the STYLES"""
+        if style == DEFAULT_STYLE:
+            self.styles.pop(key, None)
+        else:
+            self.styles[key] = style
+        geometry = self.geometry.get(key)
+        if geometry is not None:
+            self.update(geometry.rect)
+
+    def clear(self):
+        self.geometry = {}
+        self.styles = {}
+        self.prepareGeometryChange()
+        self.bounds = QRectF()
+
+    def edgeAt(self, pos, distance):
+        """the model edge nearest to a scene position, if one is closer than distance"""
+        x, y = pos.x(), pos.y()
+        found = None
+        for key in self.canvas.edge_index.query(x - distance, y - distance, x + distance, y + distance):
+            geometry = self.edgeGeometry(key)
+            if geometry is None or not geometry.drawable():
+                continue
+            key_distance = segmentDistance(x, y, geometry.line)
+            if key_distance <= distance:
+                found, distance = key, key_distance
+        return self.canvas.model.edges.get(found) if found is not None else None
+
+    #override
+    @timed(PAINT)
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        keys = self.canvas.edge_index.query(exposed.left(), exposed.top(), exposed.right(), exposed.bottom())
+        arrows = option.levelOfDetailFromTransform(painter.worldTransform()) >= ARROW_MIN_SCALE
+        lines = {}#style -> lines
+        heads = {}#style -> path of arrow heads
+        cached = self.geometry
+        for key in keys:
+            geometry = cached.get(key) or self.edgeGeometry(key)
+            if geometry is None or not geometry.drawable():
+                continue
+            style = self.styles.get(key, DEFAULT_STYLE)
+            style_lines = lines.get(style)
+            if style_lines is None:
+                style_lines = lines[style] = []
+                path = heads[style] = QPainterPath()
+                #overlapping arrow heads fill instead of cancelling out
+                path.setFillRule(Qt.FillRule.WindingFill)
+            style_lines.append(geometry.line)
+            if arrows:
+                path = heads[style]
+                path.addPolygon(geometry.source_arrow)
+                path.addPolygon(geometry.dest_arrow)
+        for style, style_lines in lines.items():
+            pen, brush = STYLES[style]
+            painter.setPen(pen)
+            painter.drawLines(style_lines)
+            if arrows:
+                painter.setBrush(brush)
+                painter.drawPath(heads[style])
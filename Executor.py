@@ -0,0 +1,187 @@
+"""
+This module runs the graph. A node's code is executed with the results of the nodes
+connected to its input pin in a list named `inputs`, and whatever it leaves in a variable
+named `result` is passed on along its output pin. Nodes are scheduled as soon as everything
+upstream of them has finished, so independent branches run at the same time on a thread
+or process pool. Failures and cycles are reported per node. With a ResultCache, nodes whose
+code and inputs are unchanged since they last ran are served from it. Code is compiled
+once per edit through a CodeCache. It does not import Qt.
+"""
+
+import marshal, multiprocessing, os, time, traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from ResultCache import nodeKey, resultDigest
+from CodeCache import CodeCache
+
+
+#what happened to a node in a run
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"#something upstream of it failed, or the run was cancelled
+CYCLE = "cycle"#it is on a cycle, or downstream of one
+
+#kinds of pool the nodes run on. Threads share the results without copying them, processes
+#use every core for pure python code but their inputs and results have to be picklable
+THREADS = "threads"
+PROCESSES = "processes"
+
+
+def runCode(node_id, code, inputs):
+    """run one node's compiled code, in the worker. Process workers get it marshalled.
+    Returns its result, the result's digest and how long it took"""
+    start = time.perf_counter()
+    if isinstance(code, bytes):
+        code = marshal.loads(code)
+    namespace = {"__name__": "__nodebook__", "inputs": inputs}
+    exec(code, namespace)
+    result = namespace.get("result")
+    return result, resultDigest(result), time.perf_counter() - start
+
+
+class NodeResult:
+    """The outcome of running one node"""
+    __slots__ = ("node_id", "status", "value", "error", "duration", "digest", "cached")
+
+    def __init__(self, node_id, status, value=None, error=None, duration=0.0, digest=None, cached=False):
+        self.node_id = node_id
+        self.status = status
+        self.value = value
+        self.error = error#the formatted exception or reason, if it didn't succeed
+        self.duration = duration
+        self.digest = digest#hash of the value, see ResultCache.resultDigest
+        self.cached = cached#the value came from the cache, the node didn't run
+
+    def succeeded(self):
+        return self.status == SUCCEEDED
+
+    def __repr__(self):
+        return f"NodeResult({self.node_id}, {self.status})"
+
+
+class Plan:
+    """The part of a graph that is run: the target nodes and everything upstream of them,
+    or the whole graph. It copies what the run needs from the model, so the graph can be
+    edited while the plan runs on another thread."""
+    def __init__(self, model, targets=None):
+        if targets is None:
+            nodes = list(model.nodes.values())
+        else:
+            included = {}
+            for target in targets:
+                for node in model.walk(target, downstream=False):
+                    included[node.id] = node
+            nodes = list(included.values())
+        self.code = {node.id: node.code for node in nodes}
+        #upstream node ids, in the order the node receives their results in `inputs`
+        self.inputs = {node.id: [pin.node.id for pin in node.input_pin.edges] for node in nodes}
+        self.outputs = {node.id: [pin.node.id for pin in node.output_pin.edges if pin.node.id in self.code]
+                        for node in nodes}
+
+    def __len__(self):
+        return len(self.code)
+
+
+class Executor:
+    """Runs plans on a pool of `workers` threads or processes. The pool is kept between
+    runs, so process workers are only started once"""
+    def __init__(self, workers=None, mode=PROCESSES, cache=None, code_cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.cache = cache#ResultCache or None
+        self.code_cache = code_cache if code_cache is not None else CodeCache()
+        self.pool = None
+        self.cancelled = False
+
+    def setMode(self, mode, workers=None):
+        if mode == self.mode and (workers is None or workers == self.workers):
+            return
+        self.shutdown()
+        self.mode = mode
+        self.workers = workers or self.workers
+
+    def getPool(self):
+        if self.pool is None:
+            if self.mode == PROCESSES:
+                #forking a process that runs Qt threads isn't safe, workers are started fresh
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="node")
+        return self.pool
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def cancel(self):
+        """nodes that haven't started are skipped, the running ones finish"""
+        self.cancelled = True
+
+    def run(self, plan, callback=None, use_cache=True):
+        """run a plan, returns node id -> NodeResult. callback is called with every
+        NodeResult as soon as it is known, on the thread that called run.
+        Without use_cache every node runs, and the cache is refreshed with the results"""
+        self.cancelled = False
+        results = {}
+        waiting = {id: len(inputs) for id, inputs in plan.inputs.items()}
+        ready = deque(id for id, count in waiting.items() if count == 0)
+        running = {}#future -> (node id, cache key)
+        pool = self.getPool()
+
+        def finish(result):
+            results[result.node_id] = result
+            if callback is not None:
+                callback(result)
+            for id in plan.outputs[result.node_id]:
+                waiting[id] -= 1
+                if waiting[id] == 0:
+                    ready.append(id)
+
+        while ready or running:
+            while ready:
+                id = ready.popleft()
+                failed = [upstream for upstream in plan.inputs[id] if not results[upstream].succeeded()]
+                if failed:
+                    finish(NodeResult(id, SKIPPED, error=f"upstream node {failed[0]} did not succeed"))
+                elif self.cancelled:
+                    finish(NodeResult(id, SKIPPED, error="the run was cancelled"))
+                else:
+                    upstream = [results[upstream_id] for upstream_id in plan.inputs[id]]
+                    key = nodeKey(plan.code[id], [result.digest for result in upstream])
+                    entry = None
+                    if use_cache and key is not None and self.cache is not None:
+                        entry = self.cache.get(key)
+                    if entry is not None:
+                        finish(NodeResult(id, SUCCEEDED, value=entry[0], digest=entry[1], cached=True))
+                        continue
+                    try:
+                        compiled = self.code_cache.get(id, plan.code[id])
+                    except (SyntaxError, ValueError) as error:
+                        finish(NodeResult(id, FAILED, error="".join(traceback.format_exception_only(error))))
+                        continue
+                    code = compiled.data if self.mode == PROCESSES else compiled.code
+                    inputs = [result.value for result in upstream]
+                    running[pool.submit(runCode, id, code, inputs)] = (id, key)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                id, key = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    value, digest, duration = future.result()
+                    if key is not None and self.cache is not None:
+                        self.cache.put(key, value, digest)
+                    finish(NodeResult(id, SUCCEEDED, value=value, duration=duration, digest=digest))
+                else:
+                    finish(NodeResult(id, FAILED, error="".join(traceback.format_exception(error))))
+
+        #nodes that never became ready are waiting on a cycle
+        for id in plan.code:
+            if id not in results:
+                result = results[id] = NodeResult(id, CYCLE, error="the node is on a cycle, or downstream of one")
+                if callback is not None:
+                    callback(result)
+        return results
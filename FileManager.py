@@ -3,78 +3,286 @@ This module implements functions for managing project files. Like saving work, l
 and creating new projects.
 """
 
-import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict
 from PySide6 import QtWidgets
-from Edge import Edge
+from PySide6.QtCore import QObject, QTimer, Qt, Signal
+from GraphModel import GraphModel, Node, saveProjectFile
+from ProjectReader import ProjectReader
+from ProjectArchive import ARCHIVE_EXTENSION, loadArchive, releaseArchive, saveArchive
+from ProjectJournal import ProjectJournal, saveChanges
+from Trace import FILES, DEBUG
+
+
+#time the loader may spend per event loop tick (seconds)
+LOAD_TICK_BUDGET = 0.03
+#how often the changes to the open project are written to its journal (milliseconds)
+AUTOSAVE_INTERVAL = 5000
+PROJECT_FILTERS = "NodeBook Projects (*.nbk);;JSON Files (*.json)"
+
+_save_executor = None
+
+def saveExecutor():
+    """the worker thread saves run on, one at a time in the order they were made"""
+    global _save_executor
+    if _save_executor is None:
+        _save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+    return _save_executor
+
+
+class ProjectLoader(QObject):
+    """Loads a project file into the canvas across event loop ticks.
+    Every tick reads and decodes records from the file for LOAD_TICK_BUDGET and hands
+    them to the canvas in one chunk, so the window keeps painting and the progress
+    dialog can cancel the load. Cancelling puts back the graph that was open before."""
+    finished = Signal(bool)#True if the project was loaded, False if it was cancelled
+
+    def __init__(self, canvas, file_path, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.file_path = file_path
+        self.file = None
+        self.records = None
+        self.pending_edges = []#edges whose nodes haven't been read yet
+        self.previous_model = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.loadChunk)
+        self.progress = None
+
+    def start(self):
+        self.previous_model = self.canvas.rootModel()
+        self.file = open(self.file_path, "r")
+        reader = ProjectReader(self.file)
+        self.reader = reader
+        self.records = iter(reader)
+        self.progress = QtWidgets.QProgressDialog("Loading project...", "Cancel", 0, max(reader.size, 1), self.canvas)
+        self.progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress.setMinimumDuration(500)
+        self.progress.canceled.connect(self.cancel)
+        self.canvas.beginLoad()
+        self.timer.start()
+
+    def loadChunk(self):
+        deadline = time.perf_counter() + LOAD_TICK_BUDGET
+        nodes = []
+        done = False
+        try:
+            while time.perf_counter() < deadline:
+                record = next(self.records, None)
+                if record is None:
+                    done = True
+                    break
+                key, value = record
+                if key == "nodes":
+                    nodes.append(Node.fromDict(value))
+                elif key == "edges":
+                    self.pending_edges.append((value["source_node_id"], value["dest_node_id"]))
+        except (KeyError, TypeError, ValueError) as error:#a malformed record, or bad JSON
+            self.fail(error)
+            return
+        try:
+            self.addChunk(nodes)
+        except (KeyError, ValueError) as error:
+            self.fail(error)
+            return
+        self.progress.setValue(min(self.reader.bytesRead(), self.progress.maximum() - 1))
+        if done:
+            if self.pending_edges:
+                self.fail(f"{len(self.pending_edges)} edges connect nodes that are not in the project")
+            else:
+                self.finish(True)
+
+    def addChunk(self, nodes):
+        self.canvas.loadNodes(nodes)
+        #edges are added once both of their nodes are in the graph
+        nodes_by_id = self.canvas.model.nodes
+        ready, waiting = [], []
+        for edge in self.pending_edges:
+            if edge[0] in nodes_by_id and edge[1] in nodes_by_id:
+                ready.append(edge)
+            else:
+                waiting.append(edge)
+        self.pending_edges = waiting
+        if ready:
+            self.canvas.loadEdges(ready)
+
+    def cancel(self):
+        self.finish(False)
+
+    def fail(self, error):
+        self.finish(False)
+        QtWidgets.QMessageBox.warning(self.canvas, "Open Project", f"Could not load {self.file_path}: {error}")
+
+    def finish(self, loaded):
+        self.timer.stop()
+        self.file.close()
+        self.progress.canceled.disconnect(self.cancel)
+        self.progress.reset()
+        if loaded:
+            self.canvas.endLoad()
+            FILES.info("project loaded: %s", self.file_path)
+        else:
+            self.canvas.cancelLoad(self.previous_model)
+        self.previous_model = None
+        self.finished.emit(loaded)
+
 
 class FileManager:
+    """Opens and saves projects. Once a project has a file, the changes made to it are
+    appended to the file's journal every AUTOSAVE_INTERVAL on a worker thread, and saving
+    to the same file again folds the journal into it, see ProjectJournal."""
     def __init__(self, canvas = None):
         self.canvas = canvas
+        self.loader = None
+        self.project_path = None#file the open project was loaded from or last saved to
+        self.pending_save = None#(future, model, changes) of the save running on the worker
+        self.save_error = None#why the last save that finished failed, None if it didn't
+        self.autosave_timer = QTimer(canvas)
+        self.autosave_timer.setInterval(AUTOSAVE_INTERVAL)
+        self.autosave_timer.timeout.connect(self.autosave)
+
+    def setProjectPath(self, file_path):
+        self.project_path = file_path
+        self.canvas.runner.setProjectPath(file_path)
+        if file_path:
+            self.autosave_timer.start()
+        else:
+            self.autosave_timer.stop()
+
+    def checkPendingSave(self, wait=False):
+        """returns True if no save is running on the worker. The changes of a save that
+        couldn't append them to the journal are marked as changed again, so the next save
+        retries them"""
+        if self.pending_save is None:
+            return True
+        future, model, changes = self.pending_save
+        if not future.done() and not wait:
+            return False
+        self.pending_save = None
+        error = future.exception()
+        if error is not None:
+            FILES.warning("autosave failed: %s", error)
+            if changes is not None and model is self.canvas.rootModel():
+                model.restoreChanges(changes)
+        else:
+            #the changes are in the journal even if it couldn't be compacted
+            error = future.result()
+            if error is not None:
+                FILES.warning("compacting the journal failed: %s", error)
+        self.save_error = error
+        return True
+
+    def autosave(self, compact=False):
+        """append the changes made since the last save to the project's journal. Only the
+        changed records are collected here, the file is written on the worker thread"""
+        if self.project_path is None or self.loader is not None:
+            return
+        if not self.checkPendingSave(wait=compact):
+            return#the previous save is still being written, these changes go in the next one
+        model = self.canvas.rootModel()#the sub-graphs are saved with their containers
+        changes = model.takeChanges() if model.isDirty() else None
+        if changes is not None and ProjectJournal(self.project_path).needsCompaction():
+            compact = True
+        if changes is None and not compact:
+            return
+        if compact and self.project_path.endswith(ARCHIVE_EXTENSION):
+            #the archive is replaced, which windows refuses while our nodes still map it
+            releaseArchive(model, self.project_path)
+        future = saveExecutor().submit(saveChanges, self.project_path, changes, compact)
+        self.pending_save = (future, model, changes)
+
+    def flush(self):
+        """write the pending changes and wait for them, before the project is closed"""
+        self.autosave()
+        self.checkPendingSave(wait=True)
 
-    
     def loadProject(self):
         # open a window to select the file path 
-        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(None, "Open Project", "", "JSON Files (*.json)")
-        if file_path:
-            with open(file_path, "r") as file:
-                project = json.load(file)
-                self.loadProjectFromDict(project)
+        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(None, "Open Project", "", PROJECT_FILTERS)
+        if not file_path:
+            return
+        self.flush()
+        if file_path.endswith(ARCHIVE_EXTENSION):
+            #archives only read their tables up front, they don't need the chunked loader
+            try:
+                model = loadArchive(file_path)
+                ProjectJournal(file_path).replay(model)
+            except (OSError, ValueError, KeyError) as error:
+                QtWidgets.QMessageBox.warning(self.canvas, "Open Project", f"Could not load {file_path}: {error}")
+                return
+            self.canvas.setModel(model)
+            self.setProjectPath(file_path)
+            FILES.info("project loaded: %s", file_path)
+        else:
+            self.loader = ProjectLoader(self.canvas, file_path, parent=self.canvas)
+            self.loader.finished.connect(self.loaderFinished)
+            self.loader.start()
+
+    def loaderFinished(self, loaded):
+        file_path = self.loader.file_path
+        self.loader.deleteLater()
+        self.loader = None
+        if not loaded:
+            return
+        journal = ProjectJournal(file_path)
+        if journal.exists():
+            #changes autosaved after the file was last written
+            model = self.canvas.model
+            try:
+                journal.replay(model)
+            except (KeyError, ValueError) as error:
+                QtWidgets.QMessageBox.warning(self.canvas, "Open Project", f"Could not apply the autosaved changes of {file_path}: {error}")
+            self.canvas.setModel(model)
+        self.setProjectPath(file_path)
 
     def loadProjectFromDict(self, project: Dict[str, Any]):
-        # clear the canvas
-        self.canvas.scene.clear()
-        self.canvas.nodes = []
-        self.canvas.edges = []
-
-        # create the nodes
-        for node_dict in project["nodes"]:
-            node = self.canvas.createNode(node_dict)
-            # node.nodes_within = self.create_nodes_within(node_dict["nodes_within"], node)
-            # print("load project node:", node.getId())
-            self.canvas.nodes.append(node)
-            self.canvas.scene.addItem(node)
-
-        # create the edges
-        # print("project edges:", project["edges"])
-        for edge_dict in project["edges"]:
-            # print("edge_dict:", edge_dict)
-            source_node = self.canvas.getNodeById(edge_dict["source_node_id"])
-            dest_node = self.canvas.getNodeById(edge_dict["dest_node_id"])
-            source_pin = source_node.outputPin()
-            dest_pin = dest_node.inputPin()
-            edge = Edge(source_pin, dest_pin, self.canvas)
-            self.canvas.edges.append(edge)
-            self.canvas.scene.addItem(edge)
-        print("project loaded")
-        print("looking at node id, for duplicates")
-        for node in self.canvas.nodes:
-            print("node id:", node.getId())
-        
-        print("looking at edge source and dest node id, for duplicates")
-        for edge in self.canvas.edges:
-            print("edge source node id:", edge.sourceNode().getId())
-            print("edge dest node id:", edge.destNode().getId())
-
-
-    def saveProject(self):
-        #create a list of dictionarie of the nodes
-        print("save project nodes:", len(self.canvas.nodes))
-        print("save project edges:", len(self.canvas.edges))
-        result_nodes = []
-        for node in self.canvas.nodes:
-            result_nodes.append(node.toDict())
-
-        print("result:", result_nodes)
-
-        #create a list of dictionaries of the edges
-        result_edges = []
-        for edge in self.canvas.edges:
-            result_edges.append(edge.toDict())
-
-        # open a window to select the file path and set the name to save the project
-        file_path, _ = QtWidgets.QFileDialog.getSaveFileName(None, "Save Project", "", "JSON Files (*.json)")
-        if file_path:
-            with open(file_path, "w") as file:
-                json.dump({"nodes": result_nodes, "edges": result_edges}, file, indent=4)
-                print("Project saved to:", file_path)
\ No newline at end of file
+        # build the graph without Qt first, then the canvas creates the items that show it
+        model = GraphModel.fromDict(project)
+        self.canvas.setModel(model)
+        FILES.info("project loaded: %d nodes, %d edges", len(model.nodes), len(model.edges))
+        if FILES.enabled(DEBUG):
+            #look for duplicate ids
+            for node in model.nodes.values():
+                FILES.debug("node id: %s", node.getId())
+            for edge in model.edges.values():
+                FILES.debug("edge source node id: %s, dest node id: %s",
+                            edge.sourceNode().getId(), edge.destNode().getId())
+
+
+    def saveProject(self, file_path=None):
+        """save the project to file_path, or to a file the user picks"""
+        FILES.debug("save project: %d nodes, %d edges", len(self.canvas.rootModel().nodes), len(self.canvas.rootModel().edges))
+
+        if not file_path:
+            # open a window to select the file path and set the name to save the project
+            file_path, _ = QtWidgets.QFileDialog.getSaveFileName(None, "Save Project", "", PROJECT_FILTERS)
+        if not file_path:
+            return
+        if file_path == self.project_path:
+            #only the changes are written, and the worker folds the journal into the file
+            self.autosave(compact=True)
+            self.checkPendingSave(wait=True)
+            if self.save_error is not None:
+                QtWidgets.QMessageBox.warning(self.canvas, "Save Project", f"Could not save {file_path}: {self.save_error}")
+                return
+            FILES.info("project saved to: %s", file_path)
+            return
+
+        self.checkPendingSave(wait=True)
+        model = self.canvas.rootModel()
+        try:
+            if file_path.endswith(ARCHIVE_EXTENSION):
+                #code that was never opened is copied from the old archive without decoding it
+                saveArchive(model, file_path)
+            else:
+                saveProjectFile(model, file_path)
+        except (OSError, ValueError) as error:
+            QtWidgets.QMessageBox.warning(self.canvas, "Save Project", f"Could not save {file_path}: {error}")
+            return
+        #the whole project is in the file now, an older journal next to it is stale
+        ProjectJournal(file_path).discard()
+        model.markClean()
+        self.setProjectPath(file_path)
+        FILES.info("project saved to: %s", file_path)
@@ -0,0 +1,487 @@
+"""
+This module implements the data model of the node graph: nodes, their pins and the edges
+between them. It does not import Qt, so projects can be loaded, edited, saved and traversed
+by batch tools without a QApplication. The graphics items in Node.py, Pin.py and Edge.py
+are thin views bound to these records.
+"""
+
+import json, os, time, random
+from collections import deque
+from typing import Any, Dict
+
+
+#size of a node before its view has measured the code editor
+NODE_WIDTH = 266.0
+NODE_HEIGHT = 202.0
+
+
+def randomId():
+    """Generate a time based random id for a node"""
+    return int(time.time() * 1000) + random.randint(1, 1000)
+
+
+class Node:
+    """Base Node class. Holds the node's data (code, position, pins) as plain attributes.
+    The code of a node loaded from a project archive stays in the archive until it is read,
+    and code being typed in an editor is only copied out of it when it is read."""
+    __slots__ = ("id", "text", "_code", "code_ref", "code_source", "class_name", "x", "y", "width", "height",
+                 "input_pin", "output_pin", "previous_node", "next_node",
+                 "nodes_within", "syntax_tree", "subgraph")
+
+    def __init__(self, text="", code="", node_number=0, class_name="NodeGraphic", x=0.0, y=0.0):
+        self.previous_node = None
+        self.next_node = None
+        self.nodes_within = []#variables, functions and classes defined in the code, see CodeAnalysis.py
+        self.subgraph = None#the GraphModel inside the node when it is a container, see GraphModel.setSubgraph
+        self.syntax_tree = None
+        self._code = code
+        self.code_ref = None#(archive, offset, length) of the code while it is not loaded
+        self.code_source = None#returns the code while an editor holds a newer version of it
+        self.id = node_number
+        self.text = text
+        self.class_name = class_name
+        self.x = x
+        self.y = y
+        self.width = NODE_WIDTH
+        self.height = NODE_HEIGHT
+        self.input_pin = Pin(self, "input")
+        self.output_pin = Pin(self, "output")
+
+    @property
+    def code(self):
+        if self.code_source is not None:
+            source, self.code_source = self.code_source, None
+            self._code = source()
+        if self._code is None and self.code_ref is not None:
+            archive, offset, length = self.code_ref
+            self._code = archive.read(offset, length)
+        return self._code
+
+    @code.setter
+    def code(self, code):
+        self._code = code
+        self.code_ref = None
+        self.code_source = None
+
+    def setCodeSource(self, source):
+        """the code was changed in an editor, source() returns it when it is read"""
+        self.code_source = source
+        self.code_ref = None
+
+    def rawCode(self):
+        """the code encoded as utf-8, copied from the archive if it was never changed"""
+        if self.code_ref is not None:
+            archive, offset, length = self.code_ref
+            return archive.raw(offset, length)
+        return (self.code or "").encode("utf-8")
+
+    def setCode(self, code):
+        self.code = code
+
+    def getCode(self):
+        return self.code
+
+    def setId(self, id):
+        self.id = id
+
+    def getId(self):
+        return self.id
+
+    def setPreviousNode(self, node):
+        self.previous_node = node
+
+    def getPreviousNode(self):
+        return self.previous_node
+
+    def setNextNode(self, node):
+        self.next_node = node
+
+    def getNextNode(self):
+        return self.next_node
+
+    def addNodeWithin(self, node):
+        self.nodes_within.append(node)
+
+    def removeNodeWithin(self, node):
+        self.nodes_within.remove(node)
+
+    def getNodesWithin(self):
+        return self.nodes_within
+
+    def setPos(self, x, y):
+        self.x = x
+        self.y = y
+
+    def pos(self):
+        return (self.x, self.y)
+
+    def isContainer(self):
+        return self.subgraph is not None
+
+    def toDict(self):
+        node_dict = {
+            "id": self.id,
+            "text": self.text,
+            "code": self.code,
+            "class_name": self.class_name,
+            "x": float(self.x),
+            "y": float(self.y),
+        }
+        #nodes_within isn't saved, it is analyzed from the code again
+        if self.subgraph is not None:
+            node_dict["subgraph"] = self.subgraph.toDict()
+        return node_dict
+
+    @classmethod
+    def fromDict(cls, dict, new_id=None):
+        """create a node from a dictionary, (used to load a saved project). new_id gives
+        it and the nodes of its sub-graph new ids instead of the saved ones"""
+        node = cls(text=dict["text"], code=dict["code"], node_number=dict["id"] if new_id is None else new_id(),
+                   class_name=dict["class_name"], x=dict["x"], y=dict["y"])
+        if dict.get("subgraph") is not None:
+            node.subgraph = GraphModel().loadDict(dict["subgraph"], new_id)
+        return node
+
+
+class Pin:
+    """One end of an edge. Every node has an input pin and an output pin."""
+    __slots__ = ("node", "pin_type", "edges")
+
+    def __init__(self, node, pin_type):
+        self.node = node
+        self.pin_type = pin_type
+        self.edges = {}#pin at the other end of the edge -> edge
+
+    def otherEnd(self, edge):
+        """the pin at the other end of the edge"""
+        return edge.dest if edge.source is self else edge.source
+
+
+class Edge:
+    """A directed connection from an output pin to an input pin."""
+    __slots__ = ("source", "dest")
+
+    def __init__(self, source, dest):
+        self.source = source
+        self.dest = dest
+
+    def sourceNode(self):
+        return self.source.node
+
+    def destNode(self):
+        return self.dest.node
+
+    def key(self):
+        """the (source node id, dest node id) key the graph indexes this edge by"""
+        return (self.source.node.id, self.dest.node.id)
+
+    def toDict(self):
+        return {
+            "source_node_id": self.source.node.id,
+            "dest_node_id": self.dest.node.id
+        }
+
+
+class GraphModel:
+    """This class stores the nodes and edges of a graph.
+    Nodes are indexed by id and edges by their (source id, dest id) key, and every pin keeps
+    its own adjacency, so mutations and queries are O(1) or O(degree).
+    The graph also tracks which nodes and edges changed since it was last saved, see takeChanges.
+    A container node holds a graph of its own, its sub-graph. A change inside a sub-graph
+    marks the container as changed in the graph above, and the ids of the nodes of the
+    whole tree are handed out by the root graph, so they are unique across levels."""
+    def __init__(self):
+        self.nodes = {}#node id -> node
+        self.edges = {}#edge key -> edge
+        self.next_id = None#lowest id newId may hand out, found the first time it is called
+        self.parent = None#(graph, container node) when this is the sub-graph of a node
+        #ids and keys of what was added, changed or removed since the last save
+        self.changed_nodes = set()
+        self.removed_nodes = set()
+        self.changed_edges = set()
+        self.removed_edges = set()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def addNode(self, node):
+        if node.id in self.nodes:
+            raise ValueError(f"A node with id {node.id} already exists")
+        self.nodes[node.id] = node
+        if node.subgraph is not None:
+            node.subgraph.parent = (self, node)
+        self.reserveIds(node)
+        self.touch(node)
+        return node
+
+    def root(self):
+        """the graph at the top of the tree of sub-graphs this one is in"""
+        graph = self
+        while graph.parent is not None:
+            graph = graph.parent[0]
+        return graph
+
+    def allNodes(self):
+        """every node of the graph and of the sub-graphs inside it"""
+        for node in self.nodes.values():
+            yield node
+            if node.subgraph is not None:
+                yield from node.subgraph.allNodes()
+
+    def newId(self):
+        """an id no node of the tree of graphs has, reserved so the next call returns
+        another one. Ids are handed out counting up from above the highest one in use, so
+        adding many nodes costs O(1) each and never collides, and the ids of removed nodes
+        aren't reused while undo may put them back"""
+        root = self.root()
+        if root is not self:
+            return root.newId()
+        if self.next_id is None:
+            self.next_id = max((node.id for node in self.allNodes() if type(node.id) is int), default=0) + 1
+        while self.next_id in self.nodes:
+            self.next_id += 1
+        self.next_id += 1
+        return self.next_id - 1
+
+    def reserveIds(self, node):
+        """keep newId above the ids of a node added with an id of its own, and of its sub-graph"""
+        root = self.root()
+        if root.next_id is None:
+            return
+        nodes = [node] if node.subgraph is None else [node, *node.subgraph.allNodes()]
+        for added in nodes:
+            if type(added.id) is int and added.id >= root.next_id:
+                root.next_id = added.id + 1
+
+    def setSubgraph(self, node, subgraph):
+        """make a node of this graph a container of subgraph, or a plain node if it is None"""
+        if node.subgraph is not None:
+            node.subgraph.parent = None
+        node.subgraph = subgraph
+        if subgraph is not None:
+            subgraph.parent = (self, node)
+            self.reserveIds(node)
+        self.touch(node)
+
+    def createNode(self, class_name="NodeGraphic", text="", code="", x=0.0, y=0.0, node_id=None):
+        """create a new node with an unused id and add it to the graph"""
+        if node_id is None:
+            node_id = self.newId()
+        return self.addNode(Node(text=text, code=code, node_number=node_id,
+                                 class_name=class_name, x=x, y=y))
+
+    def removeNode(self, node):
+        """removes the node and every edge connected to it, the removed edges are returned"""
+        removed = list(node.input_pin.edges.values()) + list(node.output_pin.edges.values())
+        for edge in removed:
+            self.disconnect(edge)
+        if self.nodes.get(node.id) is node:
+            del self.nodes[node.id]
+            self.changed_nodes.discard(node.id)
+            self.removed_nodes.add(node.id)
+            self.touchParent()
+        return removed
+
+    def getNodeById(self, id):
+        return self.nodes.get(id)
+
+    @staticmethod
+    def orient(pin_a, pin_b):
+        """edges always go from an output pin to an input pin, whichever pin the
+        connection was started on"""
+        if pin_a.pin_type == pin_b.pin_type:
+            raise ValueError("Cannot connect two pins of the same type")
+        if pin_a.pin_type == "input":
+            return pin_b, pin_a
+        return pin_a, pin_b
+
+    def findEdge(self, pin_a, pin_b):
+        """returns the edge connecting the two pins, or None"""
+        return pin_a.edges.get(pin_b)
+
+    def connect(self, pin_a, pin_b):
+        """connect two pins, returns the new edge or None if they are already connected"""
+        source, dest = self.orient(pin_a, pin_b)
+        if dest in source.edges:
+            return None
+        edge = Edge(source, dest)
+        source.edges[dest] = edge
+        dest.edges[source] = edge
+        self.edges[edge.key()] = edge
+        self.changed_edges.add(edge.key())
+        self.removed_edges.discard(edge.key())
+        self.touchParent()
+        return edge
+
+    def connectIds(self, source_id, dest_id):
+        """connect the output pin of one node to the input pin of another"""
+        return self.connect(self.nodes[source_id].output_pin, self.nodes[dest_id].input_pin)
+
+    def disconnect(self, edge):
+        edge.source.edges.pop(edge.dest, None)
+        edge.dest.edges.pop(edge.source, None)
+        if self.edges.get(edge.key()) is edge:
+            del self.edges[edge.key()]
+            self.changed_edges.discard(edge.key())
+            self.removed_edges.add(edge.key())
+            self.touchParent()
+
+    def clear(self):
+        self.removed_nodes.update(self.nodes)
+        self.removed_edges.update(self.edges)
+        self.nodes = {}
+        self.edges = {}
+        self.changed_nodes = set()
+        self.changed_edges = set()
+
+    # change tracking
+
+    def touch(self, node):
+        """mark a node as changed, its views call this when its code or position changes"""
+        self.changed_nodes.add(node.id)
+        self.removed_nodes.discard(node.id)
+        if self.parent is not None:
+            self.touchParent()
+
+    def touchParent(self):
+        """a sub-graph is saved with its container, which changes with it"""
+        if self.parent is not None:
+            graph, container = self.parent
+            if graph.nodes.get(container.id) is container:
+                graph.touch(container)
+
+    def isDirty(self):
+        return bool(self.changed_nodes or self.removed_nodes or self.changed_edges or self.removed_edges)
+
+    def markClean(self):
+        self.changed_nodes = set()
+        self.removed_nodes = set()
+        self.changed_edges = set()
+        self.removed_edges = set()
+
+    def takeChanges(self):
+        """the records of everything that changed since the last call, as a dict that
+        applyChanges can replay on a copy of the graph as it was then. Costs O(changes)"""
+        changes = {
+            "nodes": [self.nodes[id].toDict() for id in self.changed_nodes],
+            "removed_nodes": list(self.removed_nodes),
+            "edges": [self.edges[key].toDict() for key in self.changed_edges],
+            "removed_edges": [list(key) for key in self.removed_edges],
+        }
+        self.markClean()
+        return changes
+
+    def restoreChanges(self, changes):
+        """mark the records of changes taken with takeChanges as changed again, when
+        they could not be saved"""
+        for id in [node["id"] for node in changes["nodes"]] + changes["removed_nodes"]:
+            if id in self.nodes:
+                self.touch(self.nodes[id])
+            else:
+                self.removed_nodes.add(id)
+        for edge in changes["edges"] + changes["removed_edges"]:
+            key = tuple(edge) if isinstance(edge, list) else (edge["source_node_id"], edge["dest_node_id"])
+            if key in self.edges:
+                self.changed_edges.add(key)
+            else:
+                self.removed_edges.add(key)
+
+    def applyChanges(self, changes):
+        """replay records taken with takeChanges"""
+        for source_id, dest_id in changes["removed_edges"]:
+            edge = self.edges.get((source_id, dest_id))
+            if edge is not None:
+                self.disconnect(edge)
+        for id in changes["removed_nodes"]:
+            if id in self.nodes:
+                self.removeNode(self.nodes[id])
+        for node_dict in changes["nodes"]:
+            node = self.nodes.get(node_dict["id"])
+            if node is None:
+                self.addNode(Node.fromDict(node_dict))
+            else:
+                node.text = node_dict["text"]
+                node.code = node_dict["code"]
+                node.class_name = node_dict["class_name"]
+                node.setPos(node_dict["x"], node_dict["y"])
+                subgraph = node_dict.get("subgraph")
+                self.setSubgraph(node, GraphModel().loadDict(subgraph) if subgraph is not None else None)
+        for edge_dict in changes["edges"]:
+            self.connectIds(edge_dict["source_node_id"], edge_dict["dest_node_id"])
+
+    # traversal
+
+    def successors(self, node):
+        return [pin.node for pin in node.output_pin.edges]
+
+    def predecessors(self, node):
+        return [pin.node for pin in node.input_pin.edges]
+
+    def walk(self, start, downstream=True):
+        """breadth first walk from a node along the direction of the edges (or against it)"""
+        neighbours = self.successors if downstream else self.predecessors
+        seen = {start.id}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            yield node
+            for other in neighbours(node):
+                if other.id not in seen:
+                    seen.add(other.id)
+                    queue.append(other)
+
+    def topologicalOrder(self):
+        """Kahn's algorithm. Returns the nodes in dependency order and the nodes that could
+        not be ordered because they are on, or downstream of, a cycle"""
+        in_degree = {id: len(node.input_pin.edges) for id, node in self.nodes.items()}
+        queue = deque(node for node in self.nodes.values() if in_degree[node.id] == 0)
+        order = []
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for pin in node.output_pin.edges:
+                in_degree[pin.node.id] -= 1
+                if in_degree[pin.node.id] == 0:
+                    queue.append(pin.node)
+        blocked = [node for node in self.nodes.values() if in_degree[node.id] > 0]
+        return order, blocked
+
+    # serialization
+
+    def toDict(self):
+        return {
+            "nodes": [node.toDict() for node in self.nodes.values()],
+            "edges": [edge.toDict() for edge in self.edges.values()],
+        }
+
+    def loadDict(self, project: Dict[str, Any], new_id=None):
+        """replace the contents of the graph with a saved project. new_id, a function
+        returning unused ids, gives the nodes new ids instead of the saved ones"""
+        self.clear()
+        ids = {}#saved id -> id of the node
+        for node_dict in project["nodes"]:
+            node = self.addNode(Node.fromDict(node_dict, new_id))
+            ids[node_dict["id"]] = node.id
+        for edge_dict in project["edges"]:
+            self.connectIds(ids[edge_dict["source_node_id"]], ids[edge_dict["dest_node_id"]])
+        self.markClean()
+        return self
+
+    @classmethod
+    def fromDict(cls, project: Dict[str, Any]):
+        return cls().loadDict(project)
+
+
+def loadProjectFile(file_path):
+    """read a project file into a new GraphModel"""
+    with open(file_path, "r") as file:
+        return GraphModel.fromDict(json.load(file))
+
+
+def saveProjectFile(model, file_path):
+    """the file is written next to the old one and swapped in, so a crash while saving
+    doesn't lose the project"""
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(model.toDict(), file, indent=4)
+    os.replace(temp_path, file_path)
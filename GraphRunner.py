@@ -0,0 +1,81 @@
+"""
+This module connects the execution engine (Executor.py) to the canvas. A run is planned
+on the GUI thread and executed on a background thread, which reports every node's result
+back through a signal. Results are cached between runs, see ResultCache.py, and compiled
+code is cached next to the project, see CodeCache.py.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, QStandardPaths, Signal
+from Executor import Executor, Plan, PROCESSES
+from ResultCache import ResultCache
+from CodeCache import CodeCache, CACHE_DIR_NAME
+
+
+class GraphRunner(QObject):
+    """Runs the canvas' graph, or part of it, without blocking the GUI. One run at a time"""
+    nodeFinished = Signal(object)#NodeResult, delivered on the GUI thread
+    finished = Signal(object)#node id -> NodeResult of the whole run
+
+    def __init__(self, canvas, mode=PROCESSES, workers=None):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.cache = ResultCache()
+        self.code_cache = CodeCache()
+        self.executor = Executor(workers=workers, mode=mode, cache=self.cache, code_cache=self.code_cache)
+        self.mode = mode#applied when the next run starts
+        self.scheduler = ThreadPoolExecutor(max_workers=1, thread_name_prefix="runner")
+        self.running = None#future of the run in progress
+
+    def isRunning(self):
+        return self.running is not None and not self.running.done()
+
+    def run(self, nodes=None, use_cache=True):
+        """run the given model nodes and everything upstream of them, or the whole graph.
+        Only nodes whose code or inputs changed are executed, unless use_cache is False.
+        Returns False if a run is already in progress"""
+        if self.isRunning():
+            return False
+        self.executor.setMode(self.mode)
+        plan = Plan(self.canvas.model, nodes)
+        self.running = self.scheduler.submit(self.execute, plan, use_cache)
+        return True
+
+    def execute(self, plan, use_cache):
+        """runs on the scheduler thread"""
+        results = self.executor.run(plan, callback=self.nodeFinished.emit, use_cache=use_cache)
+        self.finished.emit(results)
+
+    def setDiskCache(self, enabled):
+        """keep results in the user's cache directory too, so they survive a restart"""
+        directory = None
+        if enabled:
+            location = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+            directory = os.path.join(location, "results")
+        self.scheduler.submit(self.cache.setDirectory, directory)
+
+    def setProjectPath(self, project_path):
+        """compiled code is kept in a directory next to the project file, in memory only
+        for a project that hasn't been saved"""
+        directory = None
+        if project_path:
+            directory = os.path.join(os.path.dirname(os.path.abspath(project_path)), CACHE_DIR_NAME)
+        self.code_cache.setDirectory(directory)
+
+    def codeEdited(self, node_id):
+        self.code_cache.invalidate(node_id)
+
+    def clearCache(self):
+        self.scheduler.submit(self.cache.clear)
+
+    def setMode(self, mode):
+        self.mode = mode
+
+    def cancel(self):
+        self.executor.cancel()
+
+    def shutdown(self):
+        self.executor.cancel()
+        self.scheduler.shutdown(wait=True)
+        self.executor.shutdown()
@@ -0,0 +1,123 @@
+"""
+This module tokenizes code one line at a time for the syntax highlighter, carrying the
+pygments lexer state from the end of one line to the start of the next. It does not
+import Qt, so it can also run in a worker thread or a batch tool.
+"""
+
+import threading
+from collections import OrderedDict
+from pygments.lexers import PythonLexer
+from pygments.token import Error, Whitespace, _TokenType
+
+
+#the state at the start of a document
+ROOT_STATE = 0
+
+
+class LineLexer:
+    """Wraps a pygments RegexLexer so a line can be lexed starting from any lexer state.
+    Lexer states (pygments state stacks) are interned to small ints, which is what
+    QSyntaxHighlighter stores per block. Lexed lines are cached by (entry state, text).
+    The cache and the state table are locked, so a worker thread can lex with the same
+    LineLexer the GUI thread highlights from."""
+    def __init__(self, lexer=None, cache_size=20000):
+        self.lexer = lexer or PythonLexer()
+        self.stacks = [("root",)]#state id -> state stack
+        self.state_ids = {("root",): ROOT_STATE}#state stack -> state id
+        self.cache = OrderedDict()#(state id, text) -> (tokens, state id at the end of the line)
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+
+    def stateId(self, stack):
+        with self.lock:
+            state = self.state_ids.get(stack)
+            if state is None:
+                state = self.state_ids[stack] = len(self.stacks)
+                self.stacks.append(stack)
+            return state
+
+    def peek(self, text, state=ROOT_STATE):
+        """the cached result of lex(), or None if the line hasn't been lexed in that state"""
+        with self.lock:
+            return self.cache.get((state if 0 <= state < len(self.stacks) else ROOT_STATE, text))
+
+    def lex(self, text, state=ROOT_STATE):
+        """Returns the (token type, value) pairs of a line and the state the next line
+        starts in. States that are unknown (like Qt's -1 for the first block) start at root"""
+        if state < 0 or state >= len(self.stacks):
+            state = ROOT_STATE
+        key = (state, text)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+                return cached
+        tokens, stack = self.lexLine(text, self.stacks[state])
+        result = (tokens, self.stateId(stack))
+        with self.lock:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def lexLine(self, text, stack):
+        """Same loop as pygments' RegexLexer.get_tokens_unprocessed, but it starts from
+        the given state stack and returns the stack it ends in, so a string or bracket
+        left open carries on to the next line."""
+        tokendefs = self.lexer._tokens
+        statestack = list(stack)
+        statetokens = tokendefs[statestack[-1]]
+        tokens = []
+        #the lexer rules expect every line to end with a newline
+        line = text + "\n"
+        end = len(line)
+        pos = 0
+        while pos < end:
+            for rexmatch, action, new_state in statetokens:
+                m = rexmatch(line, pos)
+                if m:
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            tokens.append((action, m.group()))
+                        else:
+                            tokens.extend((ttype, value) for _, ttype, value in action(self.lexer, m))
+                    pos = m.end()
+                    if new_state is not None:
+                        if isinstance(new_state, tuple):
+                            for state in new_state:
+                                if state == "#pop":
+                                    if len(statestack) > 1:
+                                        statestack.pop()
+                                elif state == "#push":
+                                    statestack.append(statestack[-1])
+                                else:
+                                    statestack.append(state)
+                        elif isinstance(new_state, int):
+                            if abs(new_state) >= len(statestack):
+                                del statestack[1:]
+                            else:
+                                del statestack[new_state:]
+                        elif new_state == "#push":
+                            statestack.append(statestack[-1])
+                        statetokens = tokendefs[statestack[-1]]
+                    break
+            else:
+                if line[pos] == "\n":
+                    # at EOL, reset state to "root"
+                    statestack = ["root"]
+                    statetokens = tokendefs["root"]
+                    tokens.append((Whitespace, "\n"))
+                else:
+                    tokens.append((Error, line[pos]))
+                pos += 1
+        #drop the newline we added from the last token
+        ttype, value = tokens[-1]
+        if len(value) > 1:
+            tokens[-1] = (ttype, value[:-1])
+        else:
+            tokens.pop()
+        return tokens, tuple(statestack)
+
+    def clearCache(self):
+        with self.lock:
+            self.cache.clear()
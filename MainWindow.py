@@ -4,6 +4,8 @@ from ObjectLibraryDock import ObjectLibraryDock
 from ProjectHierarchyDock import ProjectHierarchyDock
 from NodeCanvas import NodeCanvas
 from FileManager import FileManager
+from Executor import PROCESSES, THREADS
+from RenderQuality import ADAPTIVE, ALWAYS_FAST, ALWAYS_FULL
 
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self):
@@ -30,6 +32,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.node_canvas = NodeCanvas()
         central_layout.addWidget(self.node_canvas)
+        self.project_hierarchy_dock.setCanvas(self.node_canvas)
         central_layout.setContentsMargins(0, 0, 0, 0)
 
         self.setCentralWidget(central_widget)
@@ -40,6 +43,7 @@ class MainWindow(QtWidgets.QMainWindow):
         file_menu = menubar.addMenu("File")
         edit_menu = menubar.addMenu("Edit")
         view_menu = menubar.addMenu("View")
+        run_menu = menubar.addMenu("Run")
         help_menu = menubar.addMenu("Help")
         # Add actions to the file menu
         new_action = QtGui.QAction("New", self)
@@ -49,11 +53,161 @@ class MainWindow(QtWidgets.QMainWindow):
         self.file_man = FileManager(canvas=self.node_canvas) 
         # Connect to the FileManager methods
         open_action.triggered.connect(self.file_man.loadProject)
-        save_action.triggered.connect(self.file_man.saveProject)
+        save_action.triggered.connect(lambda: self.file_man.saveProject())
 
         file_menu.addAction(new_action)
         file_menu.addAction(open_action)
         file_menu.addAction(save_action)
+
+        # Add actions to the edit menu, they work on the canvas's selection
+        undo_action = QtGui.QAction("Undo", self)
+        undo_action.setShortcut(QtGui.QKeySequence.StandardKey.Undo)
+        undo_action.triggered.connect(self.node_canvas.undo)
+        redo_action = QtGui.QAction("Redo", self)
+        redo_action.setShortcut(QtGui.QKeySequence.StandardKey.Redo)
+        redo_action.triggered.connect(self.node_canvas.redo)
+        def updateHistoryActions():
+            #every level of sub-graphs has a history of its own
+            history = self.node_canvas.history
+            undo_action.setEnabled(history.canUndo())
+            undo_action.setText(f"Undo {history.undoLabel()}".strip())
+            redo_action.setEnabled(history.canRedo())
+            redo_action.setText(f"Redo {history.redoLabel()}".strip())
+        self.node_canvas.historyChanged.connect(updateHistoryActions)
+        updateHistoryActions()
+        edit_menu.addAction(undo_action)
+        edit_menu.addAction(redo_action)
+        edit_menu.addSeparator()
+        #the clipboard holds nodes in a format other instances can paste, see Clipboard.py
+        cut_action = QtGui.QAction("Cut", self)
+        cut_action.setShortcut(QtGui.QKeySequence.StandardKey.Cut)
+        cut_action.triggered.connect(lambda: self.node_canvas.cut())
+        copy_action = QtGui.QAction("Copy", self)
+        copy_action.setShortcut(QtGui.QKeySequence.StandardKey.Copy)
+        copy_action.triggered.connect(lambda: self.node_canvas.copy())
+        paste_action = QtGui.QAction("Paste", self)
+        paste_action.setShortcut(QtGui.QKeySequence.StandardKey.Paste)
+        paste_action.triggered.connect(lambda: self.node_canvas.paste())
+        edit_menu.addAction(cut_action)
+        edit_menu.addAction(copy_action)
+        edit_menu.addAction(paste_action)
+        edit_menu.addSeparator()
+        select_all_action = QtGui.QAction("Select All", self)
+        select_all_action.setShortcut(QtGui.QKeySequence.StandardKey.SelectAll)
+        select_all_action.triggered.connect(self.node_canvas.selectAll)
+        delete_action = QtGui.QAction("Delete", self)
+        delete_action.setShortcut(QtGui.QKeySequence.StandardKey.Delete)
+        delete_action.triggered.connect(lambda: self.node_canvas.deleteNodes(self.node_canvas.selectedNodes()))
+        duplicate_action = QtGui.QAction("Duplicate", self)
+        duplicate_action.setShortcut(QtGui.QKeySequence("Ctrl+D"))
+        duplicate_action.triggered.connect(lambda: self.node_canvas.duplicateNodes(self.node_canvas.selectedNodes()))
+        disconnect_action = QtGui.QAction("Disconnect", self)
+        disconnect_action.triggered.connect(lambda: self.node_canvas.disconnectNodes(self.node_canvas.selectedNodes()))
+        edit_menu.addAction(select_all_action)
+        edit_menu.addAction(delete_action)
+        edit_menu.addAction(duplicate_action)
+        edit_menu.addAction(disconnect_action)
+        group_action = QtGui.QAction("Group Into Sub-graph", self)
+        group_action.setShortcut(QtGui.QKeySequence("Ctrl+G"))
+        group_action.triggered.connect(lambda: self.node_canvas.groupNodes(self.node_canvas.selectedNodes()))
+        edit_menu.addAction(group_action)
+
+        # Add actions to the view menu
+        virtualize_action = QtGui.QAction("Virtualized Canvas", self)
+        virtualize_action.setCheckable(True)
+        virtualize_action.toggled.connect(self.node_canvas.setVirtualized)
+        self.node_canvas.virtualizedChanged.connect(virtualize_action.setChecked)
+        view_menu.addAction(virtualize_action)
+        batched_edges_action = QtGui.QAction("Batched Edge Drawing", self)
+        batched_edges_action.setCheckable(True)
+        batched_edges_action.setChecked(self.node_canvas.batched_edges)
+        batched_edges_action.toggled.connect(self.node_canvas.setBatchedEdges)
+        view_menu.addAction(batched_edges_action)
+        #double clicking a container shows its sub-graph, this goes back up
+        up_action = QtGui.QAction("Up One Level", self)
+        up_action.setShortcut(QtGui.QKeySequence("Alt+Up"))
+        up_action.triggered.connect(self.node_canvas.leaveSubgraph)
+        view_menu.addAction(up_action)
+        self.level_label = QtWidgets.QLabel()
+        self.statusBar().addWidget(self.level_label)
+        def updateLevel():
+            up_action.setEnabled(bool(self.node_canvas.levels))
+            self.level_label.setText(" > ".join(["Project"] + self.node_canvas.levelNames()))
+        self.node_canvas.levelChanged.connect(updateLevel)
+        updateLevel()
+        #lower quality while panning, zooming and dragging, the active level is shown in the status bar
+        quality_menu = view_menu.addMenu("Render Quality")
+        quality_group = QtGui.QActionGroup(self)
+        quality = self.node_canvas.quality
+        for setting, label in ((ADAPTIVE, "Adaptive"), (ALWAYS_FAST, "Fast While Interacting"),
+                               (ALWAYS_FULL, "Always Full Quality")):
+            action = QtGui.QAction(label, self)
+            action.setCheckable(True)
+            action.setChecked(setting == quality.setting)
+            action.triggered.connect(lambda checked, setting=setting: quality.setSetting(setting))
+            quality_group.addAction(action)
+            quality_menu.addAction(action)
+        self.quality_label = QtWidgets.QLabel()
+        self.statusBar().addPermanentWidget(self.quality_label)
+        quality.modeChanged.connect(lambda mode: self.quality_label.setText(f"Render quality: {mode}"))
+        self.quality_label.setText(f"Render quality: {quality.mode}")
+        view_menu.addSeparator()
+        perf_overlay_action = QtGui.QAction("Performance Overlay", self)
+        perf_overlay_action.setShortcut(QtGui.QKeySequence("F12"))
+        perf_overlay_action.setCheckable(True)
+        perf_overlay_action.toggled.connect(self.node_canvas.perf.setOverlay)
+        view_menu.addAction(perf_overlay_action)
+        record_trace_action = QtGui.QAction("Record Performance Trace", self)
+        record_trace_action.setCheckable(True)
+        record_trace_action.toggled.connect(self.recordTrace)
+        view_menu.addAction(record_trace_action)
+
+        # Add actions to the run menu
+        run_all_action = QtGui.QAction("Run All", self)
+        run_all_action.setShortcut(QtGui.QKeySequence("F5"))
+        run_all_action.triggered.connect(lambda: self.node_canvas.runNodes())
+        rerun_all_action = QtGui.QAction("Run All Without Cache", self)
+        rerun_all_action.setShortcut(QtGui.QKeySequence("Shift+F5"))
+        rerun_all_action.triggered.connect(lambda: self.node_canvas.runNodes(use_cache=False))
+        cancel_run_action = QtGui.QAction("Cancel Run", self)
+        cancel_run_action.triggered.connect(self.node_canvas.runner.cancel)
+        #threads share results between nodes without copying them, processes use every core
+        processes_action = QtGui.QAction("Run Nodes in Separate Processes", self)
+        processes_action.setCheckable(True)
+        processes_action.setChecked(self.node_canvas.runner.mode == PROCESSES)
+        processes_action.toggled.connect(lambda checked: self.node_canvas.runner.setMode(PROCESSES if checked else THREADS))
+        disk_cache_action = QtGui.QAction("Cache Results on Disk", self)
+        disk_cache_action.setCheckable(True)
+        disk_cache_action.toggled.connect(self.node_canvas.runner.setDiskCache)
+        clear_cache_action = QtGui.QAction("Clear Result Cache", self)
+        clear_cache_action.triggered.connect(self.node_canvas.runner.clearCache)
+        run_menu.addAction(run_all_action)
+        run_menu.addAction(rerun_all_action)
+        run_menu.addAction(cancel_run_action)
+        run_menu.addSeparator()
+        run_menu.addAction(processes_action)
+        run_menu.addAction(disk_cache_action)
+        run_menu.addAction(clear_cache_action)
+
+    def recordTrace(self, recording):
+        """start recording a performance trace, or stop and save it"""
+        perf = self.node_canvas.perf
+        if recording:
+            perf.startRecording()
+            return
+        perf.stopRecording()
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Performance Trace", "trace.json",
+                                                        "Chrome Trace (*.json)")
+        if path:
+            perf.saveTrace(path)
+
+    #override
+    def closeEvent(self, event):
+        #changes made since the last autosave are written before the window goes away
+        self.file_man.flush()
+        self.node_canvas.runner.shutdown()
+        self.node_canvas.analyzer.shutdown()
+        super().closeEvent(event)
     
 if __name__ == "__main__":
     import sys
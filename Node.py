@@ -1,113 +1,84 @@
-# from Pin import PinGraphic        
-import ast, time, random, astor
 from PySide6.QtWidgets import (
     QGraphicsItem, QGraphicsProxyWidget, 
     QVBoxLayout, QPlainTextEdit, QWidget,
     QGraphicsSceneContextMenuEvent)
 
-from PySide6.QtGui import QBrush, QColor, QPainter
-from PySide6.QtCore import QRectF, Qt
+from PySide6.QtGui import QBrush, QColor, QPainter, QFont, QPen, QKeySequence, QTextCursor
+from PySide6.QtCore import QRectF, Qt, QTimer
+from GraphModel import Node, randomId
 from Pin import PinGraphic
 from PygmentsHighlighter import PygmentsHighlighter
 from ContextMenu import NodeContextMenu
+from Executor import SUCCEEDED, FAILED, SKIPPED, CYCLE
+from PerfMonitor import timed, PAINT
+from Trace import CANVAS
+from UndoStack import textDelta
 
 
+#view scales at which a node switches level of detail. Above SCALE_READABLE the live code
+#editor is shown, above SCALE_SMALL a cached picture of it, and below that just a titled box
+SCALE_READABLE = 0.6
+SCALE_SMALL = 0.25
+#outline drawn around a node after it was run, see Executor.py
+RUN_COLORS = {
+    SUCCEEDED: QColor(60, 170, 80),
+    FAILED: QColor(210, 50, 50),
+    SKIPPED: QColor(150, 150, 150),
+    CYCLE: QColor(230, 140, 20),
+}
+CACHED_COLOR = QColor(70, 130, 200)#succeeded without running, the result was cached
+RUN_OUTLINE = 3
 
 
-# What is a node in the context of my program?
-# A node is a container of other nodes
+def blockText(block):
+    """the text of a block the way toPlainText has it"""
+    return block.text().replace("\u2028", "\n").replace("\xa0", " ")
 
-# Each node can parse the code it contains, and build the visual representation of the 
-# code contained in the node
 
-# each node will have a code editor and a run button
-
-# each node will be able to switch between text and visual representation of the code
-
-#different node types will be subclasses of the node class
-# to start there will be a variable node, a function node, a class node
-
-# each node will have a list of nodes that it contains
-
-# each node will have a reference to the previous node and the next node, if they exist
-#
-class Node:
-    """Base Node class. """
-    def __init__(self, text="", code="", canvas=None, node_number=0):
-        self.previous_node = None
-        self.next_node = None 
-        # TODO: self.nodes_within = []
-        self.syntax_tree = None
-        self.code = code
+class CodeEditor(QPlainTextEdit):
+    """The editor of a node. Its document keeps no undo history of its own, the canvas
+    keeps one for the whole graph (see UndoStack.py) and undo and redo go to it"""
+    def __init__(self, canvas):
+        super().__init__()
         self.canvas = canvas
-        self.id = node_number
-        self.text = text
-
-    def setCode(self, code):
-        self.code = code
-    
-    def getCode(self):
-        return self.code
-    
-    def setId(self, id):
-        self.id = id
-
-    def getId(self):
-        return self.id
-    
-    def setPreviousNode(self, node):
-        self.previous_node = node
-    
-    def getPreviousNode(self):
-        return self.previous_node
-    
-    def setNextNode(self, node):
-        self.next_node = node
-
-    def getNextNode(self):
-        return self.next_node
-    
-    def addNodeWithin(self, node):
-        self.nodes.append(node)
-    
-    def removeNodeWithin(self, node):
-        self.nodes.remove(node)
+        self.document().setUndoRedoEnabled(False)
 
-    def getNodesWithin(self):
-        return self.nodes_within
-    
-    # def parseCode(self):
-    #     self.syntax_tree = ast.parse(self.code)
-    #     # make a node for variable, function, class, and add it to the nodes_within list
-    #     for node in self.syntax_tree.body:
-    #         print("node:", node)
-    #         str_rep = astor.to_source(node).strip()
-    #         self.nodes_within.append(Node(code=str_rep))
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Undo):
+            self.canvas.undo()
+        elif event.matches(QKeySequence.StandardKey.Redo):
+            self.canvas.redo()
+        else:
+            super().keyPressEvent(event)
 
 
-    def toDict(self):
-        return {
-            "id": self.id,
-            "text": self.text,
-            "code": self.code_editor.toPlainText(),
-            "class_name": self.__class__.__name__,
-            "x": float(self.pos().x()),
-            "y": float(self.pos().y()),
-        }
-        # TODO:"nodes_within": [node.to_dict() for node in self.nodes_within],
-    
-
-class NodeGraphic(QGraphicsItem, Node):
-    """Graphic representation of a node. """
+class NodeGraphic(QGraphicsItem):
+    """Graphic representation of a node. The node's data lives in a GraphModel.Node,
+    this item only displays it and writes edits back to it."""
     # # The Type attribute is used to distinguish between different types of items in the scene.
     Type = QGraphicsItem.UserType + 1
-    def __init__(self, scene, text="", canvas=None):
+    # levels of detail, see detailLevelForScale
+    DETAIL_BOX = 0
+    DETAIL_PIXMAP = 1
+    DETAIL_FULL = 2
+    def __init__(self, scene, text="", canvas=None, node=None):
         super().__init__()
-        self.text = text
+        if node is None:
+            #the canvas's model hands out ids that can't collide, see GraphModel.newId
+            node_id = canvas.model.newId() if canvas is not None else self.randomId()
+            node = Node(text=text, code=text, node_number=node_id,
+                        class_name=self.__class__.__name__)
+        self.node = node
         self.canvas = canvas
-        self.id = self.randomId()
         self.scene = scene
-        print("NodeGraphic.__init__ node made")
+        #the code is put in the editor the first time the node is shown, see loadEditor
+        self.editor_loaded = False
+        self.lines = []#the code in the editor, a line per block, see codeChanged
+        #nodes start as boxes, the canvas sets the level of detail when the node is added
+        self.detail_level = NodeGraphic.DETAIL_BOX
+        #picture of the editor drawn instead of the proxy widget when zoomed out
+        self.snapshot = None
+        CANVAS.debug("NodeGraphic.__init__ node made")
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
@@ -120,9 +91,11 @@ class NodeGraphic(QGraphicsItem, Node):
         self.layout.setSpacing(0)
 
         # Add a code editor to the node
-        self.code_editor = QPlainTextEdit()#TODO: make custom node for Syntax highlighting
-        self.code_editor.setPlainText(self.text)
+        self.code_editor = CodeEditor(canvas)#TODO: make custom node for Syntax highlighting
         self.code_editor.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.code_editor.document().contentsChange.connect(self.codeChanged)
+        #document revision of the last edit, formatting by the highlighter doesn't change it
+        self.revision = self.code_editor.document().revision()
         # print("reading code from file")
         # # Load syntax.py into the editor for demo purposes
         # infile = open('D:\\Programming Projects\\node_programming\\syntax_experiments\\Syntax.py', 'r')
@@ -134,26 +107,122 @@ class NodeGraphic(QGraphicsItem, Node):
         # Create a proxy widget to embed the container into the scene
         self.proxy = QGraphicsProxyWidget(self)
         self.proxy.setWidget(self.container)
+        self.proxy.setVisible(False)
+        self.node.width = self.proxy.boundingRect().width()
+        self.node.height = self.proxy.boundingRect().height()
         # Add pins
-        self._input_pin = self.createPin("input")
-        self._output_pin = self.createPin("output")
+        self._input_pin = self.createPin(self.node.input_pin)
+        self._output_pin = self.createPin(self.node.output_pin)
         self.setPinPositions()
+        self.setPos(self.node.x, self.node.y)
         # self.code_editor.show()
         # print("highlighting code")
-        self.highlighter = PygmentsHighlighter(self.code_editor.document())
+        self.highlighter = PygmentsHighlighter(self.code_editor.document(), editor=self.code_editor)
         # print("code highlighted")
 
+    def bind(self, node):
+        """show another node of the model, used when the canvas recycles items"""
+        self.node = node
+        self.editor_loaded = False
+        if self.detail_level != NodeGraphic.DETAIL_BOX:
+            self.loadEditor()
+        self.snapshot = None
+        self.node.width = self.proxy.boundingRect().width()
+        self.node.height = self.proxy.boundingRect().height()
+        self._input_pin.bind(node.input_pin)
+        self._output_pin.bind(node.output_pin)
+        self.setPos(node.x, node.y)
+        self.showRunResult(self.canvas.run_results.get(node.id))
+
+    @property
+    def id(self):
+        return self.node.id
+
+    @property
+    def text(self):
+        return self.node.text
+
+    def getId(self):
+        return self.node.id
+
+    def loadEditor(self):
+        """put the node's code in the editor, for archived projects this is when it is read"""
+        if self.editor_loaded:
+            return
+        self.code_editor.setPlainText(self.node.code)
+        document = self.code_editor.document()
+        self.revision = document.revision()
+        #the code as it is in the editor, a line per block. A new list, the node this item
+        #showed before may still read its code from the old one
+        self.lines = []
+        block = document.firstBlock()
+        while block.isValid():
+            self.lines.append(blockText(block))
+            block = block.next()
+        self.snapshot = None
+        self.editor_loaded = True
+
+    def codeChanged(self, position, removed, added):
+        """every edit is written through to the node, the canvas records what it replaced.
+        Only the blocks of the changed span are read, the node joins the lines when
+        something reads its code"""
+        document = self.code_editor.document()
+        if not self.editor_loaded or document.revision() == self.revision:
+            return#the node's own code being put in the editor, or only its formatting
+        self.revision = document.revision()
+        #the blocks before the change are the same, and so are the ones after it, shifted
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        if not last.isValid():
+            last = document.lastBlock()
+        shift = document.blockCount() - len(self.lines)
+        new_lines = []
+        block = first
+        while True:
+            new_lines.append(blockText(block))
+            if block == last:
+                break
+            block = block.next()
+        start, end = first.blockNumber(), last.blockNumber() - shift + 1
+        old = "\n".join(self.lines[start:end])
+        new = "\n".join(new_lines)
+        if old == new:
+            return
+        self.lines[start:end] = new_lines
+        lines = self.lines
+        self.node.setCodeSource(lambda: "\n".join(lines))
+        self.snapshot = None
+        offset = first.position()
+        delta = textDelta(old, new, position - offset, removed, added)
+        self.canvas.nodeEdited(self, (delta[0] + offset,) + delta[1:])
+
+    def replaceCode(self, start, removed, inserted):
+        """replace the removed text at start with the inserted text, used by undo and redo"""
+        if not self.editor_loaded:
+            code = self.node.code
+            self.node.code = code[:start] + inserted + code[start + len(removed):]
+            self.snapshot = None
+            self.canvas.codeEdited(self.node)
+            return
+        cursor = QTextCursor(self.code_editor.document())
+        cursor.setPosition(start)
+        cursor.setPosition(start + len(removed), QTextCursor.MoveMode.KeepAnchor)
+        cursor.insertText(inserted)
+        self.code_editor.setTextCursor(cursor)
+
+    def toDict(self):
+        return self.node.toDict()
+
     def randomId(self):
         """Generate a time based random id for the node"""
-        return int(time.time() * 1000) + random.randint(1, 1000)
+        return randomId()
 
         
     def type(self):
         return NodeGraphic.Type
     
-    def createPin(self, pin_type):
-        pin = PinGraphic(self.scene, pin_type, graphWidget=self.canvas, parent=self)
-        return pin
+    def createPin(self, pin):
+        return PinGraphic(self.scene, pin, graphWidget=self.canvas, parent=self)
 
     def setPinPositions(self):
         # Vertically center the pins relative to the node
@@ -166,18 +235,88 @@ class NodeGraphic(QGraphicsItem, Node):
         self._output_pin.setPos(self.proxy.boundingRect().width(), output_pin_y - 5)  # Right edge, vertically centered
 
     def itemChange(self, change, value):
-        if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            for pin in [self._input_pin, self._output_pin]:
-                pin.adjust()
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            #the edges are drawn from the node's position in the model, so it is updated
+            #before the canvas adjusts them. Items placed where their node already is
+            #(when they are created or recycled) didn't move it
+            if (value.x(), value.y()) != self.node.pos():
+                self.node.setPos(value.x(), value.y())
+                self.canvas.nodeMoved(self)
         return super().itemChange(change, value)
 
     def boundingRect(self):
+        #the node plus the outline drawn around it after a run
+        return self.contentRect().adjusted(-RUN_OUTLINE, -RUN_OUTLINE, RUN_OUTLINE, RUN_OUTLINE)
+
+    def contentRect(self):
         # Adjust the bounding rectangle to fit the contents including padding
         return QRectF(0, 0, self.proxy.boundingRect().width(), self.proxy.boundingRect().height())
     
+    @staticmethod
+    def detailLevelForScale(scale):
+        if scale >= SCALE_READABLE:
+            return NodeGraphic.DETAIL_FULL
+        if scale >= SCALE_SMALL:
+            return NodeGraphic.DETAIL_PIXMAP
+        return NodeGraphic.DETAIL_BOX
+
+    def setDetailLevel(self, level):
+        """Proxy widgets are expensive to paint, so the editor is only shown when its
+        text is readable. Below that paint() draws a cached picture or a plain box."""
+        if level == self.detail_level:
+            return
+        self.detail_level = level
+        if level != NodeGraphic.DETAIL_BOX:
+            self.loadEditor()
+        self.proxy.setVisible(level == NodeGraphic.DETAIL_FULL)
+        self.update()
+
+    def title(self):
+        title = self.node.text or f"{self.node.class_name} {self.node.id}"
+        if self.node.subgraph is not None:
+            title += f" [{len(self.node.subgraph)}]"#how many nodes are inside
+        return title
+
+    @timed(PAINT)
     def paint(self, painter, option, widget):
+        if self.node.subgraph is not None:
+            #a container is drawn as a stack of nodes
+            painter.setBrush(QBrush(QColor(160, 160, 160)))
+            painter.drawRect(self.contentRect().translated(RUN_OUTLINE, RUN_OUTLINE))
         painter.setBrush(QBrush(QColor(200, 200, 200)))
-        painter.drawRect(self.boundingRect())
+        painter.drawRect(self.contentRect())
+        if self.detail_level == NodeGraphic.DETAIL_PIXMAP:
+            #the picture is taken the first time the node is painted zoomed out, and
+            #again after its code changes
+            if self.snapshot is None:
+                self.snapshot = self.container.grab()
+            painter.drawPixmap(self.contentRect().toRect(), self.snapshot)
+        elif self.detail_level == NodeGraphic.DETAIL_BOX:
+            #the font is sized to the box so the title can still be read when zoomed out
+            font = QFont(painter.font())
+            font.setPixelSize(max(1, int(self.contentRect().height() / 5)))
+            painter.setFont(font)
+            painter.drawText(self.contentRect(), Qt.AlignmentFlag.AlignCenter, self.title())
+        result = self.canvas.run_results.get(self.node.id)
+        if result is not None:
+            #drawn outside the content, the proxy widget covers the content at full detail
+            margin = RUN_OUTLINE / 2
+            color = CACHED_COLOR if result.cached else RUN_COLORS[result.status]
+            painter.setPen(QPen(color, RUN_OUTLINE))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRect(self.contentRect().adjusted(-margin, -margin, margin, margin))
+
+    def showRunResult(self, result):
+        """called by the canvas when the node has been run"""
+        if result is None:
+            self.setToolTip("")
+        elif result.cached:
+            self.setToolTip(f"cached\nresult: {result.value!r:.500}")
+        elif result.succeeded():
+            self.setToolTip(f"{result.status} in {result.duration:.3f}s\nresult: {result.value!r:.500}")
+        else:
+            self.setToolTip(f"{result.status}\n{result.error}")
+        self.update()
 
     def getInputPinPosition(self):
         return self.mapToScene(self._input_pin.pos())
@@ -193,18 +332,27 @@ class NodeGraphic(QGraphicsItem, Node):
         
 
     def mousePressEvent(self, event):
-        print("NodeGraphic.mousePressEvent")
+        CANVAS.debug("NodeGraphic.mousePressEvent")
         if event.button() == Qt.RightButton:
-            print("Right click on node")
+            CANVAS.debug("Right click on node")
             context_menu = NodeContextMenu(canvas = self.canvas, node = self)
             context_menu.exec(event.screenPos())
         else:
             super().mousePressEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        #the editor takes double clicks on the code, the rest of a container opens it.
+        #Opening it deletes this item, that waits until the event is handled
+        if event.button() == Qt.MouseButton.LeftButton and self.node.subgraph is not None:
+            node = self.node
+            QTimer.singleShot(0, lambda: self.canvas.enterSubgraph(node))
+        else:
+            super().mouseDoubleClickEvent(event)
     
 
 class DiffNode(NodeGraphic):
     """for testing purposes only."""
-    def __init__(self, text="", canvas=None, node_number=0):
-        super().__init__(text, canvas=canvas)
+    def __init__(self, scene, text="", canvas=None, node=None):
+        super().__init__(scene, text, canvas=canvas, node=node)
       
 
@@ -1,109 +1,883 @@
+import time
+from contextlib import contextmanager
 from Node import DiffNode, NodeGraphic
 from PySide6.QtWidgets import QGraphicsView, QGraphicsScene
-from PySide6.QtGui import QMouseEvent, QPainter
-from PySide6.QtCore import QDataStream, QIODevice, Qt, QEvent
+from PySide6.QtGui import QMouseEvent, QPainter, QGuiApplication, QCursor
+from PySide6.QtCore import QDataStream, QIODevice, Qt, QEvent, QPointF, QTimer, Signal, QMimeData
 
 from Edge import Edge
+from EdgeLayer import EdgeLayer
+from NodeLayer import NodeLayer
+from ContextMenu import EdgeContextMenu, CanvasContextMenu
 from Pin import PinGraphic
+from GraphModel import GraphModel, Node
+from SpatialIndex import SpatialIndex
+from GraphRunner import GraphRunner
+from AnalysisService import AnalysisService
+from RenderQuality import RenderQuality
+from PerfMonitor import PerfMonitor, FRAME, EVENT
+from Trace import CANVAS, RUN, INFO
+from UndoStack import UndoStack, AddNodes, RemoveNodes, Connect, Disconnect, MoveNodes, EditCode
+from Clipboard import MIME_TYPE, packNodes, unpackNodes, payloadOrigin
+
+
+#projects with more nodes than this are opened with the canvas virtualized
+VIRTUALIZE_ABOVE = 2000
+#how far outside the viewport items are still created when virtualized, in scene units
+VISIBLE_MARGIN = 400.0
+#most released items of each kind kept for reuse
+POOL_SIZE = 256
+#how close to an edge, in pixels of the view, a right click picks it
+EDGE_PICK_DISTANCE = 5.0
+#while nodes are dragged their edges are updated at most once per this many milliseconds
+FRAME_INTERVAL = 16
+#transactions changing more nodes than this suspend the scene's index until they end
+SUSPEND_INDEX_ABOVE = 200
+#how far duplicated nodes are placed from the originals
+DUPLICATE_OFFSET = 40.0
 
 
 class Graph:
-    """This class manages the graph of nodes and edges."""
+    """This class manages the graph of nodes and edges.
+    The nodes and edges themselves are stored in a GraphModel (see GraphModel.py), the
+    graph keeps the NodeGraphic and Edge items that display them, indexed by the same
+    node id and (source id, dest id) edge keys.
+
+    When virtualized, only the nodes and edges near the viewport have items. The rest are
+    found through spatial indexes over the model, and items scrolled out of view are
+    recycled for the ones scrolled into it. The selection is kept as node ids, so nodes
+    without items can be selected too, and the bulk operations (deleteNodes, moveNodes,
+    duplicateNodes, disconnectNodes) work on model nodes whether they have items or not.
+
+    With batched edges (the default) edges have no items, an EdgeLayer draws all of them.
+
+    A container node holds a sub-graph (see GraphModel.setSubgraph). The canvas shows one
+    level at a time: the nodes inside a container get items only while its sub-graph is
+    shown, see enterSubgraph and leaveSubgraph."""
     def __init__(self):
-        self.edges = []
-        self.nodes = []
+        self.model = GraphModel()
+        self.edges = {}#edge key -> Edge item
+        self.nodes = {}#node id -> NodeGraphic item
+        self.node_index = SpatialIndex()#node id -> node rectangle
+        self.edge_index = SpatialIndex()#edge key -> edge bounding rectangle
+        self.virtualized = False
+        self.node_pool = {}#class name -> released NodeGraphic items
+        self.edge_pool = []#released Edge items
+        self.batched_edges = True
+        self.edge_layer = None#EdgeLayer drawing the edges when batched, see addLayers
+        self.node_layer = None#NodeLayer drawing the nodes without items when zoomed out, see addLayers
+        self.loading = False#set while a project is loaded in chunks
+        self.move_depth = 0#above 0 during a move transaction, see beginMove
+        self.moved_nodes = {}#node id -> node moved since the last flushMoves
+        self.transaction_depth = 0#above 0 during a scene transaction, see transaction
+        self.selection = set()#ids of the selected nodes, with or without items
+        self.selecting = False#set while setSelection changes the items
+        self.history = UndoStack()#undo and redo of the edits below, see record
+        #(model, container node, history, view state) of every level above the one shown,
+        #the root model first. Only the shown level has items, see enterSubgraph
+        self.levels = []
         #used in doubleClickEvent here and in PinGraph to track an unfinished connection
         self.connection = {"start": None, "end": None}
+        #level of detail the node items are drawn at, follows the zoom of the view
+        self.detail_level = NodeGraphic.DETAIL_FULL
+        self.run_results = {}#node id -> NodeResult of the last run the node was in
+
+    @staticmethod
+    def edgeKey(pin_a, pin_b):
+        """canonical key of the edge between two pins. Edges always go from an output pin
+        to an input pin, so the key is the same whichever pin the connection started on"""
+        source, dest = GraphModel.orient(pin_a.pin, pin_b.pin)
+        return (source.node.id, dest.node.id)
 
     def addNode(self, node):
-        self.nodes.append(node)
+        """add a NodeGraphic (and the node it displays) to the graph"""
+        if node.id not in self.model.nodes:
+            self.model.addNode(node.node)
+            self.nodesChanged(added=[node.node])
+        self.nodes[node.id] = node
+        self.indexNode(node.node)
+        node.setDetailLevel(self.detail_level)
 
     def addEdge(self, edge):
-        self.edges.append(edge)
+        self.edges[edge.key()] = edge
 
     def removeNode(self, node):
-        if node in self.nodes:
-            self.nodes.remove(node)
+        if self.nodes.get(node.id) is node:
+            del self.nodes[node.id]
 
     def removeEdge(self, edge):
-        if edge in self.edges:
-            self.edges.remove(edge)
+        if self.edges.get(edge.key()) is edge:
+            del self.edges[edge.key()]
+
+    def findEdge(self, pin_a, pin_b):
+        """returns the edge of the model connecting the two pins, or None"""
+        return self.model.findEdge(pin_a.pin, pin_b.pin)
+
+    def pinScenePos(self, pin):
+        """scene position of a pin of the model, the same place setPinPositions puts
+        the PinGraphic of a node item"""
+        node = pin.node
+        if pin.pin_type == "input":
+            return QPointF(node.x - 10, node.y + node.height / 2 - 5)
+        return QPointF(node.x + node.width, node.y + node.height / 2 - 5)
+
+    def indexNode(self, node):
+        self.node_index.insert(node.id, node.x - 10, node.y, node.x + node.width + 10, node.y + node.height)
+        if self.node_layer is not None:
+            self.node_layer.include(node.x - 10, node.y, node.x + node.width + 10, node.y + node.height)
+
+    def indexEdge(self, edge):
+        source = self.pinScenePos(edge.source)
+        dest = self.pinScenePos(edge.dest)
+        #leave room for the arrow heads
+        self.edge_index.insert(edge.key(),
+            min(source.x(), dest.x()) - 15, min(source.y(), dest.y()) - 15,
+            max(source.x(), dest.x()) + 15, max(source.y(), dest.y()) + 15)
+
+    def nodeMoved(self, item):
+        """called by a NodeGraphic after its position changed"""
+        self.markMoved(item.node)
+
+    def markMoved(self, node):
+        """update the indexes and edges of a node of the model after its position changed"""
+        if self.model.nodes.get(node.id) is not node:
+            return
+        self.model.touch(node)
+        self.moved_nodes[node.id] = node
+        if self.move_depth:
+            #the node may move again before the next frame, its edges are updated then
+            self.scheduleMoveFlush()
+        else:
+            self.flushMoves()
+
+    def beginMove(self):
+        """start a move transaction, like dragging a selection. Until endMove the nodes
+        that moved are collected, and their edges are updated once per frame however many
+        times the nodes moved and however many of them share an edge"""
+        self.move_depth += 1
+
+    def endMove(self):
+        if self.move_depth == 0:
+            return
+        self.move_depth -= 1
+        if self.move_depth == 0:
+            self.flushMoves()
+
+    def scheduleMoveFlush(self):
+        """call flushMoves on the next frame. The view waits for the frame, without one
+        the edges are updated right away"""
+        self.flushMoves()
+
+    def flushMoves(self):
+        """index the nodes moved since the last flush, and update each of their edges once"""
+        moved, self.moved_nodes = self.moved_nodes, {}
+        edges = {}
+        for node in moved.values():
+            if self.model.nodes.get(node.id) is not node:
+                continue#deleted since it moved
+            self.indexNode(node)
+            if self.loading:
+                #edges are indexed and adjusted once the load finishes
+                continue
+            for pin in (node.input_pin, node.output_pin):
+                for edge in pin.edges.values():
+                    edges[edge.key()] = edge
+        for key, edge in edges.items():
+            self.indexEdge(edge)
+            if self.batched_edges:
+                self.edge_layer.edgeChanged(edge)
+                continue
+            edge_item = self.edges.get(key)
+            if edge_item is not None:
+                edge_item.adjust()
+
+    def nodeEdited(self, item, delta):
+        """called by a NodeGraphic when the text in its editor changes, delta is the
+        (start, removed, inserted) replacement that changed it"""
+        self.record(EditCode(item.node.id, *delta))
+        self.codeEdited(item.node)
+
+    def codeEdited(self, node):
+        """called after the code of a node of the model changed"""
+        self.model.touch(node)
+
+    def connectPins(self, pin_a, pin_b):
+        """connect two PinGraphics, the direction is fixed up by the model.
+        Returns the new edge of the model or None if the pins are already connected"""
+        edge = self.model.connect(pin_a.pin, pin_b.pin)
+        if edge is None:
+            return None
+        self.showEdge(edge)
+        self.record(Connect([edge.key()]))
+        return edge
+
+    def showEdge(self, edge):
+        """index a new edge of the model and draw it"""
+        self.indexEdge(edge)
+        if self.batched_edges:
+            self.edge_layer.edgeChanged(edge)
+        else:
+            self.createEdgeItem(edge)
+
+    def createEdgeItem(self, edge):
+        """create the Edge item for an edge of the model, reusing a released one if we can"""
+        if self.edge_pool:
+            item = self.edge_pool.pop()
+            item.bind(edge)
+        else:
+            item = Edge(edge, self)
+        self.scene.addItem(item)
+        self.addEdge(item)
+        return item
+
+    def releaseEdgeItem(self, item):
+        """remove an Edge item from the scene and keep it for reuse"""
+        self.removeEdge(item)
+        self.scene.removeItem(item)
+        if len(self.edge_pool) < POOL_SIZE:
+            self.edge_pool.append(item)
 
     def createNode(self, dict):
         """create a node from a dictionary, (used to load a saved project)"""
-        node = self.chooseClass(dict["class_name"])
-        node.setPos(dict["x"], dict["y"])
-        
-        node.id = dict["id"]
-        node.code_editor.setPlainText(dict["code"])
-        node.text = dict["text"]
+        node = self.createNodeItem(Node.fromDict(dict))
         # TODO:node.nodes_within = self.create_nodes_within(dict["nodes_within"], node)
         return node
+
+    def createNodeItem(self, node):
+        """create the NodeGraphic for a node of the model"""
+        return self.chooseClass(node.class_name, node)
+
+    def materializeNode(self, node):
+        """create the item of a node of the model, reusing a released one if we can,
+        and add it to the scene"""
+        pool = self.node_pool.get(node.class_name)
+        if pool:
+            item = pool.pop()
+            item.bind(node)
+        else:
+            item = self.createNodeItem(node)
+        self.scene.addItem(item)
+        self.addNode(item)
+        #a recycled item may still be selected from the node it showed before
+        self.selecting = True
+        item.setSelected(node.id in self.selection)
+        self.selecting = False
+        return item
+
+    def releaseNode(self, item):
+        """remove a NodeGraphic from the scene, its edits are kept in the model"""
+        self.removeNode(item)
+        self.scene.removeItem(item)
+        pool = self.node_pool.setdefault(item.node.class_name, [])
+        if len(pool) < POOL_SIZE:
+            pool.append(item)
     
-    def chooseClass(self, class_name):
+    def chooseClass(self, class_name, node=None):
         """Instantiate a node based on the class name"""
         if class_name == "NodeGraphic":
-            return NodeGraphic(self.scene, canvas=self)
+            return NodeGraphic(self.scene, canvas=self, node=node)
         elif class_name == "DiffNode":
-            return DiffNode(self.scene, canvas=self)
-    
-    def deleteNodeAndEdges(self, node):
-        """used by right click context menu to delete the node and all edges connected to it
-        When a node is deleted, we need to visit the input and output pins of the node
-        to remove all of the edges connected to them"""
-        inpin = node.inputPin()
-        outpin = node.outputPin()
-        for edge in inpin.edges() + outpin.edges():
-            #we also need to visit the other node connected to the edge to remove the 
-            # edge from its list of edges too
-            edge_source = edge.sourceNode()
-            self.removeEdgeFrom(edge_source, edge)
-            
-            edge_dest = edge.destNode()
-            self.removeEdgeFrom(edge_dest, edge)
+            return DiffNode(self.scene, canvas=self, node=node)
+
+    def setModel(self, model):
+        """replace the graph with the contents of a model, and build the items showing it.
+        Large models switch the canvas to virtualized mode"""
+        self.levels = []
+        self.resetHistory()
+        self.showLevel(model)
+        self.projectReset()
+
+    def showLevel(self, model):
+        """show the root model or a sub-graph, the items of the level shown before are
+        deleted and only the new level gets items"""
+        self.clearItems()
+        self.model = model
+        for node in model.nodes.values():
+            self.indexNode(node)
+        for edge in model.edges.values():
+            self.indexEdge(edge)
+        self.edge_layer.reset()
+        self.node_layer.reset()
+        if len(model) > VIRTUALIZE_ABOVE:
+            self.setVirtualized(True)
+        if self.virtualized:
+            self.updateVisibleItems()
+        else:
+            self.materializeAll()
+        self.levelShown()
+
+    def beginLoad(self):
+        """start loading a project in chunks, see loadNodes, loadEdges and endLoad.
+        Scene indexing is suspended until the load finishes"""
+        self.loading = True
+        self.levels = []
+        self.resetHistory()
+        self.clearItems()
+        self.model = GraphModel()
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+
+    def loadNodes(self, nodes):
+        """add a chunk of nodes to the graph being loaded. Items are created for them
+        unless the canvas is (or becomes) virtualized"""
+        for node in nodes:
+            self.model.addNode(node)
+            self.indexNode(node)
+        if not self.virtualized and len(self.model) > VIRTUALIZE_ABOVE:
+            self.setVirtualized(True)
+        elif not self.virtualized:
+            for node in nodes:
+                self.materializeNode(node)
+        else:
+            self.updateVisibleItems()
 
-        self.removeNode(node)
-        self.scene.removeItem(node)
+    def loadEdges(self, edges):
+        """add a chunk of edges, as (source id, dest id) pairs, to the graph being loaded"""
+        for source_id, dest_id in edges:
+            self.model.connectIds(source_id, dest_id)
+
+    def cancelLoad(self, model):
+        """stop a load and show the given model instead"""
+        self.loading = False
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+        self.setModel(model)
+
+    def endLoad(self):
+        self.loading = False
+        self.model.markClean()
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+        for edge in self.model.edges.values():
+            self.indexEdge(edge)
+        self.edge_layer.reset()
+        self.node_layer.reset()
+        if self.virtualized:
+            self.updateVisibleItems()
+        else:
+            self.materializeAll()
+        self.levelShown()
+        self.projectReset()
+
+    def clearItems(self):
+        """remove every item from the scene, the model is left alone"""
+        self.selecting = True#the items are deleted, they can't report their selection
+        self.scene.clear()
+        self.selecting = False
+        self.edges = {}
+        self.nodes = {}
+        self.node_pool = {}
+        self.edge_pool = []
+        self.node_index.clear()
+        self.edge_index.clear()
+        self.selection = set()
+        self.addLayers()
+
+    def addLayers(self):
+        """add a new EdgeLayer and NodeLayer to the scene, clearing the scene deletes the old ones"""
+        self.edge_layer = EdgeLayer(self)
+        self.edge_layer.setVisible(self.batched_edges)
+        self.scene.addItem(self.edge_layer)
+        self.node_layer = NodeLayer(self)
+        self.node_layer.setVisible(self.drawsNodeBoxes())
+        self.scene.addItem(self.node_layer)
+
+    def materializeAll(self):
+        """create the items of every node and edge that doesn't have one yet"""
+        for node in self.model.nodes.values():
+            if node.id not in self.nodes:
+                self.materializeNode(node)
+        if self.batched_edges:
+            return
+        for key, edge in self.model.edges.items():
+            if key not in self.edges:
+                self.createEdgeItem(edge)
+
+    def setVirtualized(self, enabled):
+        if enabled == self.virtualized:
+            return
+        self.virtualized = enabled
+        if enabled:
+            self.updateVisibleItems()
+        else:
+            self.node_layer.setVisible(False)
+            self.materializeAll()
+
+    def setBatchedEdges(self, enabled):
+        """draw the edges with the EdgeLayer, or with an Edge item each"""
+        if enabled == self.batched_edges:
+            return
+        self.batched_edges = enabled
+        self.edge_layer.setVisible(enabled)
+        if enabled:
+            for item in list(self.edges.values()):
+                self.releaseEdgeItem(item)
+            self.edge_pool = []
+            self.edge_layer.reset()
+        else:
+            self.edge_layer.clear()
+            if self.virtualized:
+                self.updateVisibleItems()
+            else:
+                self.materializeAll()
+
+    def visibleSceneRect(self):
+        """the part of the scene items are needed for, (x1, y1, x2, y2). The view gives
+        the part it shows, without one it is the whole graph"""
+        return self.node_index.bounds()
+
+    def drawsNodeBoxes(self):
+        """whether the NodeLayer draws the nodes instead of items. A virtualized canvas
+        zoomed out to boxes would otherwise need an item, and its editor, for nearly every
+        node in view"""
+        return self.virtualized and self.detail_level == NodeGraphic.DETAIL_BOX
+
+    def nodeAt(self, x, y):
+        """a model node whose rectangle contains the scene position, or None"""
+        ids = self.node_index.query(x, y, x, y)
+        return self.model.nodes.get(next(iter(ids))) if ids else None
+
+    def updateVisibleItems(self):
+        """when virtualized, create the items of the nodes and edges near the viewport
+        and release the ones that moved away from it. Selected items are kept"""
+        if self.node_layer is not None:
+            self.node_layer.setVisible(self.drawsNodeBoxes())
+        if not self.virtualized:
+            return
+        x1, y1, x2, y2 = self.visibleSceneRect()
+        #zoomed out to boxes the NodeLayer draws the nodes straight from the index
+        visible_nodes = set() if self.drawsNodeBoxes() else self.node_index.query(x1, y1, x2, y2)
+        #batched edges are drawn straight from the index
+        visible_edges = set() if self.batched_edges else self.edge_index.query(x1, y1, x2, y2)
+        #release first so the pools can serve the items that are created next
+        for key in [key for key in self.edges if key not in visible_edges]:
+            self.releaseEdgeItem(self.edges[key])
+        for id in [id for id in self.nodes if id not in visible_nodes]:
+            #the selection outlives the items, except the ones being dragged
+            if not (self.move_depth and self.nodes[id].isSelected()):
+                self.releaseNode(self.nodes[id])
+        for id in visible_nodes:
+            if id not in self.nodes:
+                self.materializeNode(self.model.nodes[id])
+        for key in visible_edges:
+            if key not in self.edges:
+                self.createEdgeItem(self.model.edges[key])
+
+    def deleteNodeAndEdges(self, node):
+        """delete a NodeGraphic's node and all edges connected to it"""
+        self.deleteNodes([node.node])
 
     def deleteEdge(self, edge):
-        """used by right click context menu to delete an edge"""
-        source_node = edge.sourceNode()
-        dest_node = edge.destNode()
-        self.removeEdgeFrom(source_node, edge)
-        self.removeEdgeFrom(dest_node, edge)
-        self.scene.removeItem(edge)
-
-    def removeEdgeFrom(self, node, edge):
-        """removes the edge from input pin and output pin of the node"""
-        node_edges = node.edges()#get the edges of the source node
-        for pin_edge in node_edges:
-            if pin_edge == edge:
-                self.scene.removeItem(pin_edge)
-                node.removeEdge(pin_edge)
-                self.removeEdge(pin_edge)
+        """used by right click context menu to delete an edge of the model"""
+        self.removeEdges([edge])
 
-    
-    def copyNode(self, node):
-        #TODO: implement copy node action
-        #used by right click context menu to copy the node
+    def record(self, command):
+        """add an edit that was just done to the history"""
+        self.history.push(command)
+        self.historyUpdated()
+
+    def historyUpdated(self):
+        """called when what can be undone or redone changed"""
+
+    def resetHistory(self):
+        """forget the history, when the model it refers to is replaced"""
+        self.history = UndoStack(self.history.budget, self.history.coalesce_time)
+        self.historyUpdated()
+
+    def undo(self):
+        with self.transaction():
+            self.history.undo(self)
+        self.historyUpdated()
+
+    def redo(self):
+        with self.transaction():
+            self.history.redo(self)
+        self.historyUpdated()
+
+    @contextmanager
+    def transaction(self, size=0):
+        """group changes to the scene. Transactions nest, and the scene is updated once the
+        outermost one ends. Large ones (size is how many nodes they change) also suspend
+        the scene's index, so it is built once instead of updated for every item"""
+        self.transaction_depth += 1
+        suspend = size > SUSPEND_INDEX_ABOVE and not self.loading
+        if suspend:
+            self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+        if self.transaction_depth == 1:
+            self.beginTransaction()
+        try:
+            yield
+        finally:
+            self.transaction_depth -= 1
+            if suspend and not self.loading:
+                self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+            if self.transaction_depth == 0:
+                self.endTransaction()
+
+    def beginTransaction(self):
+        """called when the outermost transaction starts, the view stops repainting"""
+
+    def endTransaction(self):
+        """called when the outermost transaction ends"""
+
+    @staticmethod
+    def edgesOf(nodes):
+        """every edge with an end at one of the nodes, once each"""
+        edges = {}
+        for node in nodes:
+            for pin in (node.input_pin, node.output_pin):
+                for edge in pin.edges.values():
+                    edges[edge.key()] = edge
+        return list(edges.values())
+
+    def removeEdges(self, edges):
+        """disconnect edges of the model and remove what shows them"""
+        removed = self.disconnectEdges(edges)
+        if removed:
+            self.record(Disconnect(removed))
+
+    def disconnectEdges(self, edges):
+        """removeEdges without recording it, returns the keys of the removed edges"""
+        removed = []
+        with self.transaction(len(edges)):
+            for edge in edges:
+                if self.model.edges.get(edge.key()) is edge:
+                    self.model.disconnect(edge)
+                    self.removeEdgeItem(edge)
+                    removed.append(edge.key())
+        return removed
+
+    def connectKeys(self, keys):
+        """connect nodes of the model by (source id, dest id) keys, used by undo and redo"""
+        with self.transaction(len(keys)):
+            for source_id, dest_id in keys:
+                if source_id in self.model.nodes and dest_id in self.model.nodes:
+                    edge = self.model.connectIds(source_id, dest_id)
+                    if edge is not None:
+                        self.showEdge(edge)
+
+    def disconnectKeys(self, keys):
+        self.disconnectEdges([self.model.edges[key] for key in keys if key in self.model.edges])
+
+    def deleteNodes(self, nodes):
+        """delete nodes of the model and every edge connected to them. The edges are
+        collected once, so an edge between two deleted nodes is only removed once"""
+        nodes = [node for node in nodes if self.model.nodes.get(node.id) is node]
+        if not nodes:
+            return
+        with self.transaction(len(nodes)):
+            edge_keys = self.disconnectEdges(self.edgesOf(nodes))
+            for node in nodes:
+                self.model.removeNode(node)
+                self.node_index.remove(node.id)
+                self.selection.discard(node.id)
+                self.moved_nodes.pop(node.id, None)
+                item = self.nodes.get(node.id)
+                if item is not None:
+                    self.removeNode(item)
+                    self.scene.removeItem(item)
+        self.nodesChanged(removed=nodes)
+        self.record(RemoveNodes(nodes, edge_keys))
+
+    def restoreNodes(self, nodes, edge_keys):
+        """put deleted nodes of the model back, with the edges between them and the nodes
+        that are still there. Used by undo and redo"""
+        with self.transaction(len(nodes)):
+            nodes = [self.model.addNode(node) for node in nodes if node.id not in self.model.nodes]
+            self.showNodes(nodes)
+            self.connectKeys(edge_keys)
+
+    def showNodes(self, nodes):
+        """index nodes just added to the model and create their items. The canvas is
+        virtualized when they make the graph too big for an item per node"""
+        for node in nodes:
+            self.indexNode(node)
+        if not self.virtualized and len(self.model) > VIRTUALIZE_ABOVE:
+            self.setVirtualized(True)
+        elif self.virtualized:
+            self.updateVisibleItems()
+        else:
+            for node in nodes:
+                self.materializeNode(node)
+        self.nodesChanged(added=nodes)
+
+    def disconnectNodes(self, nodes):
+        """remove every edge connected to the nodes"""
+        self.removeEdges(self.edgesOf(nodes))
+
+    def moveNodes(self, nodes, dx, dy):
+        """move nodes of the model, their edges are updated once at the end"""
+        positions = {node.id: (node.pos(), (node.x + dx, node.y + dy)) for node in nodes}
+        self.placeNodes({id: new for id, (old, new) in positions.items()})
+        self.record(MoveNodes(positions))
+
+    def placeNodes(self, positions):
+        """move nodes of the model to positions, a dict of node id -> (x, y)"""
+        with self.transaction(len(positions)):
+            self.beginMove()
+            try:
+                for id, (x, y) in positions.items():
+                    node = self.model.nodes.get(id)
+                    if node is None:
+                        continue
+                    item = self.nodes.get(id)
+                    if item is not None:
+                        item.setPos(x, y)#the item moves its node, see NodeGraphic.itemChange
+                    else:
+                        node.setPos(x, y)
+                        self.markMoved(node)
+            finally:
+                self.endMove()
+
+    def replaceCode(self, node_id, start, removed, inserted):
+        """replace the removed text at start of a node's code, used by undo and redo"""
+        node = self.model.nodes.get(node_id)
+        if node is None:
+            return
+        item = self.nodes.get(node_id)
+        if item is not None:
+            item.replaceCode(start, removed, inserted)
+        else:
+            code = node.code
+            node.code = code[:start] + inserted + code[start + len(removed):]
+            self.codeEdited(node)
+
+    def duplicateNodes(self, nodes, dx=DUPLICATE_OFFSET, dy=DUPLICATE_OFFSET):
+        """copy nodes, and the edges between them, next to the originals. The copies are
+        selected and returned"""
+        copies = {}
+        edge_keys = []
+        with self.transaction(len(nodes)):
+            for node in nodes:
+                copy = self.model.createNode(class_name=node.class_name, text=node.text, code=node.code,
+                                             x=node.x + dx, y=node.y + dy)
+                copy.nodes_within = list(node.nodes_within)
+                copies[node.id] = copy
+            self.showNodes(list(copies.values()))
+            for node in nodes:
+                for edge in node.output_pin.edges.values():
+                    dest = copies.get(edge.dest.node.id)
+                    if dest is not None:
+                        edge = self.model.connectIds(copies[node.id].id, dest.id)
+                        self.showEdge(edge)
+                        edge_keys.append(edge.key())
+            self.setSelection(copy.id for copy in copies.values())
+        self.record(AddNodes(copies.values(), edge_keys))
+        return list(copies.values())
+
+    def copyNodes(self, nodes):
+        """the clipboard payload of nodes of the model and the edges between them,
+        see Clipboard.py"""
+        return packNodes(nodes)
+
+    def cutNodes(self, nodes):
+        payload = packNodes(nodes)
+        self.deleteNodes(nodes)
+        return payload
+
+    def pasteNodes(self, payload, x=None, y=None):
+        """add the nodes of a clipboard payload with new ids, their top left at x, y or
+        where they were copied from. The new nodes are built in one batch, selected and
+        returned. Raises ValueError if the payload is damaged"""
+        nodes, edge_keys = unpackNodes(self.model, payload, x, y)
+        with self.transaction(len(nodes)):
+            self.showNodes(nodes)
+            for key in edge_keys:
+                self.showEdge(self.model.edges[key])
+            self.setSelection(node.id for node in nodes)
+        self.record(AddNodes(nodes, edge_keys))
+        return nodes
+
+    def rootModel(self):
+        """the model of the whole project, self.model is the level shown"""
+        return self.levels[0][0] if self.levels else self.model
+
+    def levelNames(self):
+        """the titles of the containers from the root down to the level shown"""
+        return [container.text or f"{container.class_name} {container.id}"
+                for model, container, history, view in self.levels]
+
+    def levelShown(self):
+        """called when another level, or another model, is shown"""
+
+    def projectReset(self):
+        """called when the root model was replaced or cleared"""
+
+    def nodesChanged(self, added=(), removed=()):
+        """called when nodes were added to or removed from the model of the level shown"""
+
+    def viewState(self):
+        """what restoreViewState needs to show a level the way it was left"""
+        return None
+
+    def restoreViewState(self, state):
         pass
 
+    def enterSubgraph(self, node):
+        """show the sub-graph of a node of the level shown, making the node a container if
+        it isn't one. Only the nodes of the sub-graph get items, the items of this level are
+        released until leaveSubgraph comes back to it. Every level has a history of its own,
+        dropped when the level is left"""
+        if self.model.nodes.get(node.id) is not node:
+            return
+        if node.subgraph is None:
+            self.model.setSubgraph(node, GraphModel())
+        self.levels.append((self.model, node, self.history, self.viewState()))
+        self.history = UndoStack(self.history.budget, self.history.coalesce_time)
+        self.showLevel(node.subgraph)
+        self.historyUpdated()
+
+    def leaveSubgraph(self):
+        """go back to the level above, with the container of the level left selected"""
+        if not self.levels:
+            return
+        model, container, history, view = self.levels.pop()
+        self.history = history
+        self.showLevel(model)
+        self.restoreViewState(view)
+        self.setSelection([container.id])
+        self.historyUpdated()
+
+    def showNode(self, node, containers=()):
+        """show the level a node is on, given by the containers from the root down to it,
+        then select the node and center the view on it. The levels the two paths share
+        aren't left. Returns False if the node isn't on that level"""
+        shown = [container for model, container, history, view in self.levels]
+        common = 0
+        while common < min(len(shown), len(containers)) and shown[common] is containers[common]:
+            common += 1
+        for _ in range(len(shown) - common):
+            self.leaveSubgraph()
+        for container in containers[common:]:
+            self.enterSubgraph(container)
+        if self.model.nodes.get(node.id) is not node:
+            return False
+        self.setSelection([node.id])
+        self.centerOnNode(node)
+        return True
+
+    def centerOnNode(self, node):
+        pass
+
+    def groupNodes(self, nodes):
+        """move nodes into the sub-graph of a new container placed at their top left. The
+        edges between them move with them, the edges to the rest of the graph are connected
+        to the container instead. Returns the container, the change is undone in one step"""
+        nodes = [node for node in nodes if self.model.nodes.get(node.id) is node]
+        if not nodes:
+            return None
+        ids = {node.id for node in nodes}
+        edges = self.edgesOf(nodes)
+        sources = {edge.source.node.id for edge in edges if edge.source.node.id not in ids}
+        dests = {edge.dest.node.id for edge in edges if edge.dest.node.id not in ids}
+        with self.history.group("Group"), self.transaction(len(nodes)):
+            container = self.model.createNode(text="Group", x=min(node.x for node in nodes),
+                                              y=min(node.y for node in nodes))
+            self.model.setSubgraph(container, GraphModel())
+            unpackNodes(container.subgraph, packNodes(nodes))
+            container.subgraph.markClean()
+            self.deleteNodes(nodes)
+            self.showNodes([container])
+            edge_keys = []
+            for source_id in sources:
+                edge_keys.append(self.model.connectIds(source_id, container.id).key())
+            for dest_id in dests:
+                edge_keys.append(self.model.connectIds(container.id, dest_id).key())
+            for key in edge_keys:
+                self.showEdge(self.model.edges[key])
+            self.setSelection([container.id])
+            self.record(AddNodes([container], edge_keys))
+        return container
+
+    def selectedNodes(self):
+        """the selected nodes of the model"""
+        return [self.model.nodes[id] for id in self.selection if id in self.model.nodes]
+
+    def setSelection(self, ids):
+        """select the nodes with the given ids, and only those"""
+        self.selection = set(ids)
+        if self.node_layer is not None and self.node_layer.isVisible():
+            self.node_layer.update()
+        self.selecting = True
+        try:
+            for id, item in self.nodes.items():
+                item.setSelected(id in self.selection)
+        finally:
+            self.selecting = False
+
+    def selectAll(self):
+        self.setSelection(self.model.nodes)
+
+    def selectionChanged(self):
+        """called when the selection of the scene's items changes, the selected ids of nodes
+        without items are kept"""
+        if self.selecting:
+            return
+        for id, item in self.nodes.items():
+            if item.isSelected():
+                self.selection.add(id)
+            else:
+                self.selection.discard(id)
+
+    def removeEdgeItem(self, edge):
+        """removes the item of an edge of the model from the graph and the scene"""
+        if self.batched_edges:
+            self.edge_layer.edgeRemoved(edge.key())
+        self.edge_index.remove(edge.key())
+        item = self.edges.pop(edge.key(), None)
+        if item is not None:
+            self.scene.removeItem(item)
+
+
     def clear(self):
-        self.edges = []
-        self.nodes = []
+        self.model = self.rootModel()
+        self.model.clear()
+        self.levels = []
+        self.resetHistory()
+        self.clearItems()
+        self.levelShown()
+        self.projectReset()
 
     def getNodeById(self, id):
-        for node in self.nodes:
-            if node.id == id:
-                return node
-        return None
+        return self.nodes.get(id)
+
+    def showRunResult(self, result):
+        """called with the result of every node of a run"""
+        self.run_results[result.node_id] = result
+        item = self.nodes.get(result.node_id)
+        if item is not None:
+            item.showRunResult(result)
+        if not result.succeeded():
+            RUN.warning("node %s %s: %s", result.node_id, result.status, result.error)
     
 class NodeCanvas(QGraphicsView, Graph):
+    virtualizedChanged = Signal(bool)
+    historyChanged = Signal()#what can be undone or redone changed
+    levelChanged = Signal()#another level of sub-graphs, or another project, is shown
+    projectChanged = Signal()#the root model was replaced or cleared
+    graphChanged = Signal(object, object, object)#model, nodes added to it, nodes removed from it
+
     def __init__(self):
         super().__init__()
+        #frame, paint and event timings, shown in an overlay or recorded to a trace.
+        #Created first, viewportEvent and paintEvent use it as soon as the view gets events
+        self.perf = PerfMonitor(self)
+        self.visible_update_pending = False
+        self.move_timer = QTimer(self)
+        self.move_timer.setSingleShot(True)
+        self.move_timer.setInterval(FRAME_INTERVAL)
+        self.move_timer.timeout.connect(self.flushMoves)
+        self.dragging = False#the left button is down, nodes it drags are moved in a transaction
+        self.drag_start = {}#node id -> position when the drag started, of the selected items
+        self.drag_behind = []#ids of the selected nodes without items, moved once the drag ends
+        self.runner = GraphRunner(self)
+        self.runner.nodeFinished.connect(self.showRunResult)
+        self.runner.finished.connect(self.runFinished)
+        self.analyzer = AnalysisService(self)
         self.scene = QGraphicsScene(self)
+        self.scene.selectionChanged.connect(self.selectionChanged)
         self.setScene(self.scene)
+        self.addLayers()
         self.setRenderHints(QPainter.RenderHint.Antialiasing | QPainter.RenderHint.SmoothPixmapTransform)
+        #lowers the render settings above while the user pans, zooms or drags
+        self.quality = RenderQuality(self)
         self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
         self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
         self.setAcceptDrops(True)
@@ -144,10 +918,10 @@ class NodeCanvas(QGraphicsView, Graph):
     
     #override
     def dropEvent(self, event):
-        print("NodeCanvas.dropEvent")
+        CANVAS.debug("NodeCanvas.dropEvent")
         if event.mimeData().hasText():
             node_class_name = event.mimeData().text()
-            print("node_class_name:", node_class_name)
+            CANVAS.debug("node_class_name: %s", node_class_name)
 
             if node_class_name == 'NodeGraphic':
                 new_node = NodeGraphic(self.scene, canvas=self)
@@ -157,24 +931,302 @@ class NodeCanvas(QGraphicsView, Graph):
 
             scene_pos = self.mapToScene(event.position().toPoint())
             new_node.setPos(scene_pos)
-            print("graph scene", self.scene)
             self.scene.addItem(new_node)
-            self.nodes.append(new_node)
+            self.addNode(new_node)
+            self.record(AddNodes([new_node.node]))
             event.acceptProposedAction()
     
+    #override
+    def addNode(self, node):
+        super().addNode(node)
+        self.quality.prepareItem(node)
+
+    #override
+    def paintEvent(self, event):
+        start = time.perf_counter()
+        super().paintEvent(event)
+        duration = time.perf_counter() - start
+        self.quality.frameRendered(duration)
+        if self.perf.isActive():
+            self.perf.record(FRAME, "paintEvent", start, duration)
+
+    #override
+    def viewportEvent(self, event):
+        if not self.perf.isActive() or event.type() == QEvent.Type.Paint:
+            return super().viewportEvent(event)
+        start = time.perf_counter()
+        handled = super().viewportEvent(event)
+        #custom event types have no name
+        name = event.type().name or str(int(event.type()))
+        self.perf.record(EVENT, name, start, time.perf_counter() - start)
+        return handled
+
+    #override
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        if self.perf.overlay:
+            painter.save()
+            painter.resetTransform()
+            self.perf.drawOverlay(painter)
+            painter.restore()
+
     #override
     def wheelEvent(self, event):
+        self.quality.interaction()
         zoom_factor = 1.25
         if event.angleDelta().y() > 0:
             self.scale(zoom_factor, zoom_factor)
         else:
             self.scale(1 / zoom_factor, 1 / zoom_factor)
+        self.updateDetailLevel()
+        self.scheduleVisibleUpdate()
+
+    #override
+    def scrollContentsBy(self, dx, dy):
+        self.quality.interaction()
+        super().scrollContentsBy(dx, dy)
+        if self.perf.overlay:
+            #the overlay stays put, the copy of it scrolled with the contents is redrawn
+            self.viewport().update(self.perf.overlay_rect)
+            self.viewport().update(self.perf.overlay_rect.translated(dx, dy))
+        self.scheduleVisibleUpdate()
+
+    #override
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.scheduleVisibleUpdate()
+
+    def visibleSceneRect(self):
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        rect.adjust(-VISIBLE_MARGIN, -VISIBLE_MARGIN, VISIBLE_MARGIN, VISIBLE_MARGIN)
+        return rect.left(), rect.top(), rect.right(), rect.bottom()
+
+    def setVirtualized(self, enabled):
+        changed = enabled != self.virtualized
+        super().setVirtualized(enabled)
+        if changed:
+            self.virtualizedChanged.emit(enabled)
+
+    #override
+    def codeEdited(self, node):
+        super().codeEdited(node)
+        self.runner.codeEdited(node.id)
+        self.analyzer.schedule(node.id)
+
+    def historyUpdated(self):
+        self.historyChanged.emit()
+
+    #override
+    def showLevel(self, model):
+        #the nodes edited on this level are analyzed before they are out of reach
+        self.analyzer.flush()
+        super().showLevel(model)
+
+    def levelShown(self):
+        #nodes of a sub-graph are analyzed once they are shown
+        self.analyzer.scheduleNew(self.model.nodes.values())
+        self.levelChanged.emit()
+
+    def projectReset(self):
+        self.analyzer.reset()
+        self.analyzer.scheduleNew(self.model.nodes.values())
+        self.projectChanged.emit()
+
+    def nodesChanged(self, added=(), removed=()):
+        self.analyzer.forget(removed)
+        self.analyzer.scheduleNew(added)
+        self.graphChanged.emit(self.model, list(added), list(removed))
+
+    def centerOnNode(self, node):
+        self.centerOn(node.x + node.width / 2, node.y + node.height / 2)
+        self.scheduleVisibleUpdate()
+
+    def viewState(self):
+        return self.transform(), self.mapToScene(self.viewport().rect().center())
+
+    def restoreViewState(self, state):
+        transform, center = state
+        self.setTransform(transform)
+        self.centerOn(center)
+        self.updateDetailLevel()
+        self.scheduleVisibleUpdate()
+
+    def copy(self, nodes=None):
+        """put nodes of the model, the selected ones by default, on the system clipboard"""
+        nodes = self.selectedNodes() if nodes is None else nodes
+        if not nodes:
+            return
+        mime = QMimeData()
+        mime.setData(MIME_TYPE, self.copyNodes(nodes))
+        QGuiApplication.clipboard().setMimeData(mime)
+
+    def cut(self, nodes=None):
+        nodes = self.selectedNodes() if nodes is None else nodes
+        if nodes:
+            self.copy(nodes)
+            self.deleteNodes(nodes)
+
+    def canPaste(self):
+        mime = QGuiApplication.clipboard().mimeData()
+        return mime is not None and mime.hasFormat(MIME_TYPE)
+
+    def paste(self, scene_pos=None):
+        """paste the nodes on the clipboard, copied here or in another instance, at
+        scene_pos, under the mouse, or next to where they were copied from"""
+        if not self.canPaste():
+            return []
+        payload = QGuiApplication.clipboard().mimeData().data(MIME_TYPE).data()
+        if scene_pos is None and self.viewport().underMouse():
+            scene_pos = self.mapToScene(self.viewport().mapFromGlobal(QCursor.pos()))
+        try:
+            if scene_pos is not None:
+                return self.pasteNodes(payload, scene_pos.x(), scene_pos.y())
+            x, y = payloadOrigin(payload)
+            return self.pasteNodes(payload, x + DUPLICATE_OFFSET, y + DUPLICATE_OFFSET)
+        except ValueError as error:
+            CANVAS.warning("paste failed: %s", error)
+            return []
+
+    def runNodes(self, items=None, use_cache=True):
+        """run the given NodeGraphics and everything upstream of them, or the whole graph.
+        Nodes whose code and inputs didn't change since they last ran are taken from the cache"""
+        nodes = None if items is None else [item.node for item in items]
+        if not self.runner.run(nodes, use_cache):
+            RUN.info("a run is already in progress")
+
+    def runFinished(self, results):
+        if not RUN.enabled(INFO):
+            return
+        counts = {}
+        for result in results.values():
+            status = "cached" if result.cached else result.status
+            counts[status] = counts.get(status, 0) + 1
+        RUN.info("run finished: %s", ", ".join(f"{count} {status}" for status, count in counts.items()))
+
+    def scheduleMoveFlush(self):
+        if not self.move_timer.isActive():
+            self.move_timer.start()
+
+    def endMove(self):
+        super().endMove()
+        if self.move_depth == 0:
+            self.move_timer.stop()
+
+    def beginTransaction(self):
+        self.setUpdatesEnabled(False)
+
+    def endTransaction(self):
+        self.setUpdatesEnabled(True)
+        self.viewport().update()
+
+    def dragMoved(self):
+        """how far the selected items were dragged, or None"""
+        for id, (x, y) in self.drag_start.items():
+            node = self.model.nodes.get(id)
+            if node is not None and (node.x, node.y) != (x, y):
+                return node.x - x, node.y - y
+        return None
+
+    def finishDrag(self):
+        """end the move transaction of a drag and record it. Qt only moved the selected
+        nodes with items, the ones scrolled out of view follow them now"""
+        self.dragging = False
+        self.endMove()
+        delta = self.dragMoved()
+        start, self.drag_start = self.drag_start, {}
+        behind, self.drag_behind = self.drag_behind, []
+        if delta is None:
+            return
+        dx, dy = delta
+        positions = {id: (self.model.nodes[id].pos(), (self.model.nodes[id].x + dx, self.model.nodes[id].y + dy))
+                     for id in behind if id in self.model.nodes}
+        self.placeNodes({id: new for id, (old, new) in positions.items()})
+        positions.update((id, (old, self.model.nodes[id].pos())) for id, old in start.items() if id in self.model.nodes)
+        self.record(MoveNodes(positions))
+
+    def scheduleVisibleUpdate(self):
+        """scrolling and zooming send many events per frame, the items are updated once
+        the event loop is idle again"""
+        if self.virtualized and not self.visible_update_pending:
+            self.visible_update_pending = True
+            QTimer.singleShot(0, self.updateVisibleItems)
+
+    def updateVisibleItems(self):
+        self.visible_update_pending = False
+        super().updateVisibleItems()
+
+    def updateDetailLevel(self):
+        """switch the nodes to the level of detail for the current zoom. The nodes are
+        only visited when the zoom crosses one of the thresholds"""
+        level = NodeGraphic.detailLevelForScale(self.transform().m11())
+        if level == self.detail_level:
+            return
+        self.detail_level = level
+        for node in self.nodes.values():
+            node.setDetailLevel(level)
     
+    #override
+    def mousePressEvent(self, event):
+        node = self.boxAt(event)
+        if node is not None and event.button() == Qt.MouseButton.LeftButton:
+            #zoomed out the nodes have no items to take the click, it selects them here
+            if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+                self.setSelection(self.selection ^ {node.id})
+            else:
+                self.setSelection([node.id])
+            return
+        if event.button() == Qt.MouseButton.LeftButton and not self.dragging:
+            #Qt moves every selected node on each mouse move, their edges follow once per frame
+            self.dragging = True
+            self.beginMove()
+        #batched edges have no items to receive the click, look for one under the mouse
+        if (event.button() == Qt.MouseButton.RightButton and self.batched_edges
+                and self.itemAt(event.position().toPoint()) is None):
+            edge = self.edge_layer.edgeAt(self.mapToScene(event.position().toPoint()),
+                                          EDGE_PICK_DISTANCE / self.transform().m11())
+            if edge is not None:
+                context_menu = EdgeContextMenu(canvas=self, edge=edge)
+                context_menu.exec(event.globalPosition().toPoint())
+                return
+        if event.button() == Qt.MouseButton.RightButton and self.itemAt(event.position().toPoint()) is None:
+            context_menu = CanvasContextMenu(canvas=self, scene_pos=self.mapToScene(event.position().toPoint()))
+            context_menu.exec(event.globalPosition().toPoint())
+            return
+        super().mousePressEvent(event)
+        if event.button() == Qt.MouseButton.LeftButton and self.dragging and not self.drag_start:
+            #the press may have changed the selection, what it drags is known now
+            self.drag_start = {id: self.nodes[id].node.pos() for id in self.selection if id in self.nodes}
+            self.drag_behind = [id for id in self.selection if id not in self.nodes]
+
+    #override
+    def mouseMoveEvent(self, event):
+        if event.buttons() != Qt.MouseButton.NoButton:
+            self.quality.interaction()
+        super().mouseMoveEvent(event)
+
+    #override
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if event.button() == Qt.MouseButton.LeftButton and self.dragging:
+            self.finishDrag()
+
+    def boxAt(self, event):
+        """the node drawn by the NodeLayer under the mouse, if the layer draws the nodes"""
+        position = event.position().toPoint()
+        if not self.node_layer.isVisible() or self.itemAt(position) is not None:
+            return None
+        pos = self.mapToScene(position)
+        return self.nodeAt(pos.x(), pos.y())
+
     #override
     def mouseDoubleClickEvent(self, event):
+        node = self.boxAt(event)
+        if node is not None and node.subgraph is not None and event.button() == Qt.MouseButton.LeftButton:
+            self.enterSubgraph(node)
+            return
         #double click the canvas to cancel a connection
         if event.button() == Qt.MouseButton.LeftButton:
             if self.connection["start"] is not None and self.connection["end"] is None:
-                print("NodeCanvas.mouseDoubleClickEvent: Dropping a connection")
+                CANVAS.debug("NodeCanvas.mouseDoubleClickEvent: Dropping a connection")
                 self.connection["start"] = None
         super().mousePressEvent(event)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+This module draws the nodes of a virtualized canvas zoomed out below SCALE_SMALL (see
+Node.py), where a node is only a titled box. The canvas then releases its node items,
+whose editors would cost a QPlainTextEdit each however small they are drawn, and the
+NodeLayer paints the boxes of the nodes in the exposed part of the scene straight from the
+canvas's node index, with one drawRects call per color.
+"""
+
+from PySide6.QtWidgets import QGraphicsItem
+from PySide6.QtCore import Qt, QRectF
+from PySide6.QtGui import QBrush, QColor, QFont, QPainterPath, QPen
+from PerfMonitor import timed, PAINT
+
+
+BOX_BRUSH = QBrush(QColor(200, 200, 200))
+SELECTED_PEN = QPen(QColor(40, 110, 220), 0)
+#titles are drawn when a box is at least this many pixels high on screen
+TITLE_MIN_PIXELS = 12
+#the bounding rectangle grows by at least this much, so it rarely changes while nodes move
+GROWTH = 1000.0
+
+
+class NodeLayer(QGraphicsItem):
+    """Draws the nodes of the canvas's model that have no item. It takes no mouse buttons
+    and has an empty shape, the view finds the node under the mouse with Graph.nodeAt"""
+    Type = QGraphicsItem.UserType + 4
+
+    def __init__(self, canvas):
+        super().__init__()
+        self.canvas = canvas
+        self.bounds = QRectF()
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        #paint gets the exposed rectangle, so only the nodes in it are drawn
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    #override
+    def type(self):
+        return NodeLayer.Type
+
+    def boundingRect(self):
+        return self.bounds
+
+    def shape(self):
+        #empty, so itemAt finds the items under it, or nothing
+        return QPainterPath()
+
+    def include(self, x1, y1, x2, y2):
+        """grow the bounding rectangle to contain a node's rectangle"""
+        rect = QRectF(x1, y1, x2 - x1, y2 - y1)
+        if self.bounds.contains(rect):
+            return
+        self.prepareGeometryChange()
+        self.bounds = self.bounds.united(rect.adjusted(-GROWTH, -GROWTH, GROWTH, GROWTH))
+
+    def reset(self):
+        """fit the bounding rectangle to the node index, after the model was replaced"""
+        rects = self.canvas.node_index.rects.values()
+        self.prepareGeometryChange()
+        self.bounds = QRectF()
+        if rects:
+            x1, y1 = min(rect[0] for rect in rects), min(rect[1] for rect in rects)
+            x2, y2 = max(rect[2] for rect in rects), max(rect[3] for rect in rects)
+            self.bounds = QRectF(x1, y1, x2 - x1, y2 - y1)
+        self.update()
+
+    #override
+    @timed(PAINT)
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect
+        ids = self.canvas.node_index.query(exposed.left(), exposed.top(), exposed.right(), exposed.bottom())
+        nodes = self.canvas.model.nodes
+        items = self.canvas.nodes
+        selection = self.canvas.selection
+        boxes, selected = [], []
+        for id in ids:
+            if id in items or id not in nodes:
+                continue#a node dragged while zoomed out keeps its item
+            node = nodes[id]
+            box = QRectF(node.x, node.y, node.width, node.height)
+            (selected if id in selection else boxes).append((node, box))
+        painter.setBrush(BOX_BRUSH)
+        painter.setPen(QPen(Qt.GlobalColor.black, 0))
+        painter.drawRects([box for node, box in boxes])
+        painter.setPen(SELECTED_PEN)
+        painter.drawRects([box for node, box in selected])
+        shown = boxes + selected
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        if shown and shown[0][1].height() * scale >= TITLE_MIN_PIXELS:
+            #the font is sized to the box, like NodeGraphic draws its title zoomed out
+            painter.setPen(Qt.GlobalColor.black)
+            font = QFont(painter.font())
+            font.setPixelSize(max(1, int(shown[0][1].height() / 5)))
+            painter.setFont(font)
+            for node, box in shown:
+                painter.drawText(box, Qt.AlignmentFlag.AlignCenter,
+                                 node.text or f"{node.class_name} {node.id}")
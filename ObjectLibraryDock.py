@@ -4,6 +4,7 @@ from PySide6.QtWidgets import QApplication, QLabel, QVBoxLayout, QHBoxLayout, QW
 from PySide6.QtCore import Qt,  QMimeData, QByteArray, QDataStream, QIODevice
 from PySide6.QtGui import QDrag, QPixmap
 from Node import NodeGraphic, DiffNode
+from Trace import UI
 
 from PySide6.QtCore import Signal
 
@@ -27,7 +28,7 @@ class DragItem(QLabel):
         self.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.setStyleSheet("border: 1px solid black;")
         # Store data separately from display label, but use label for default.
-        print("DragItem.__init__ node:", type(node))
+        UI.debug("DragItem.__init__ node: %s", type(node))
         self.node = node
 
     def mouseMoveEvent(self, e):
@@ -0,0 +1,175 @@
+"""
+This module measures where the canvas spends its time. While a PerfMonitor is active the
+methods decorated with timed (the paint methods of the items, the highlighter) and the
+canvas's frames and event handling report how long they took. The canvas shows the totals
+of the last REFRESH_INTERVAL in an overlay, and a recorded session can be saved as a
+Chrome trace, which chrome://tracing and https://ui.perfetto.dev open.
+While no monitor is active the timed methods only check for one.
+"""
+
+import functools, json, os, threading, time
+from collections import Counter
+from PySide6.QtCore import QObject, QRect, QTimer, Qt
+from PySide6.QtGui import QColor, QFont, QFontMetrics
+
+
+#what is measured
+FRAME = "frame"#a paint of the canvas's viewport
+PAINT = "paint"#paint of an item, by item class
+HIGHLIGHT = "highlight"#syntax highlighting
+EVENT = "event"#handling of an event of the canvas's viewport, by event type
+
+#milliseconds between refreshes of the overlay
+REFRESH_INTERVAL = 500
+#a recorded session keeps at most this many events, the rest are dropped
+MAX_TRACE_EVENTS = 1000000
+OVERLAY_MARGIN = 8
+OVERLAY_WIDTH = 380
+
+active = None#the PerfMonitor measuring, if any
+
+
+def timed(category, name=None):
+    """decorator reporting how long a method takes to the active monitor, under the name
+    of the class of the object it is called on unless a name is given"""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            monitor = active
+            if monitor is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                monitor.record(category, name or type(self).__name__, start, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class PerfMonitor(QObject):
+    """Collects the timings of one canvas, for the overlay and for a recorded session.
+    Only one monitor measures at a time"""
+    def __init__(self, canvas, interval=REFRESH_INTERVAL):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.overlay = False
+        self.recording = False
+        self.current = {}#(category, name) -> [count, total seconds, longest], since the last refresh
+        self.stats = {}#the same, of the last complete interval
+        self.item_counts = Counter()#item class name -> items in the scene, at the last refresh
+        self.trace = []#(category, name, start, duration, thread id) of the recorded session
+        self.counter_trace = []#(time, item counts) of the recorded session
+        self.trace_start = 0.0
+        self.overlay_rect = QRect()
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+
+    def isActive(self):
+        return self.overlay or self.recording
+
+    def updateActive(self):
+        global active
+        if self.isActive():
+            active = self
+            if not self.timer.isActive():
+                self.current = {}
+                self.timer.start()
+        elif active is self:
+            active = None
+            self.timer.stop()
+
+    def setOverlay(self, shown):
+        self.overlay = shown
+        self.updateActive()
+        if shown:
+            self.refresh()
+        else:
+            self.canvas.viewport().update(self.overlay_rect)
+
+    def startRecording(self):
+        self.trace = []
+        self.counter_trace = []
+        self.trace_start = time.perf_counter()
+        self.recording = True
+        self.updateActive()
+
+    def stopRecording(self):
+        """stop recording, the session is kept until saveTrace or the next recording"""
+        self.recording = False
+        self.updateActive()
+
+    def record(self, category, name, start, duration):
+        """called by whatever was measured, start is a time.perf_counter value"""
+        entry = self.current.get((category, name))
+        if entry is None:
+            entry = self.current[(category, name)] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += duration
+        if duration > entry[2]:
+            entry[2] = duration
+        if self.recording and len(self.trace) < MAX_TRACE_EVENTS:
+            self.trace.append((category, name, start, duration, threading.get_ident()))
+
+    def refresh(self):
+        """start a new interval, and redraw the overlay with the one that ended"""
+        self.stats, self.current = self.current, {}
+        self.item_counts = Counter(type(item).__name__ for item in self.canvas.scene.items())
+        if self.recording:
+            self.counter_trace.append((time.perf_counter(), dict(self.item_counts)))
+        if self.overlay:
+            self.canvas.viewport().update(self.overlay_rect)
+
+    def overlayLines(self):
+        seconds = self.timer.interval() / 1000
+        lines = []
+        frame = self.stats.get((FRAME, "paintEvent"))
+        if frame is not None:
+            count, total, longest = frame
+            lines.append(f"frame {total / count * 1000:.1f} ms avg, {longest * 1000:.1f} ms max, "
+                         f"{count / seconds:.0f} fps")
+        else:
+            lines.append("frame: idle")
+        lines.append("items: " + ", ".join(f"{name} {count}" for name, count in self.item_counts.most_common()))
+        lines.append(f"nodes {len(self.canvas.model.nodes)}, edges {len(self.canvas.model.edges)}")
+        for category in (PAINT, HIGHLIGHT, EVENT):
+            entries = sorted(((name, entry) for (entry_category, name), entry in self.stats.items()
+                              if entry_category == category), key=lambda item: -item[1][1])
+            for name, (count, total, longest) in entries:
+                lines.append(f"{category} {name}: {count}x, {total * 1000:.1f} ms, "
+                             f"{longest * 1000:.2f} ms max")
+        return lines
+
+    def drawOverlay(self, painter):
+        """draw the overlay in the top left corner, the painter is in viewport coordinates"""
+        painter.setFont(QFont("monospace", 8))
+        metrics = QFontMetrics(painter.font())
+        lines = self.overlayLines()
+        height = metrics.lineSpacing() * len(lines) + 2 * OVERLAY_MARGIN
+        rect = QRect(0, 0, OVERLAY_WIDTH, height)
+        #the lines may be fewer than last time, what they covered is redrawn by the caller
+        self.overlay_rect = rect.united(self.overlay_rect)
+        painter.fillRect(rect, QColor(0, 0, 0, 170))
+        painter.setPen(Qt.GlobalColor.white)
+        y = OVERLAY_MARGIN + metrics.ascent()
+        for line in lines:
+            painter.drawText(OVERLAY_MARGIN, y, metrics.elidedText(line, Qt.TextElideMode.ElideRight,
+                                                                    OVERLAY_WIDTH - 2 * OVERLAY_MARGIN))
+            y += metrics.lineSpacing()
+
+    def traceEvents(self):
+        """the recorded session in the Chrome trace event format, times in microseconds"""
+        pid = os.getpid()
+        events = [{"name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread,
+                   "ts": (start - self.trace_start) * 1e6, "dur": duration * 1e6}
+                  for category, name, start, duration, thread in self.trace]
+        events.extend({"name": "items", "ph": "C", "pid": pid, "tid": 0,
+                       "ts": (moment - self.trace_start) * 1e6, "args": counts}
+                      for moment, counts in self.counter_trace)
+        return events
+
+    def saveTrace(self, path):
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.traceEvents(), "displayTimeUnit": "ms",
+                       "otherData": {"dropped": len(self.trace) >= MAX_TRACE_EVENTS}}, file)
@@ -1,15 +1,16 @@
 from PySide6.QtCore import Qt, QPointF
 from PySide6.QtWidgets import QGraphicsItem, QGraphicsEllipseItem
 from PySide6.QtGui import QBrush
-from Edge import Edge
+from PerfMonitor import timed, PAINT
+from Trace import CANVAS
 
 class PinGraphic(QGraphicsEllipseItem):
+    """Graphic representation of a GraphModel.Pin, the pin record keeps the edges."""
     Type = QGraphicsItem.UserType + 1
 
-    def __init__(self, scene,pin_type, graphWidget=None, parent=None):
+    def __init__(self, scene, pin, graphWidget=None, parent=None):
         super().__init__(-5, -5, 15, 15, parent=parent)
-        self.pin_type = pin_type
-        self.edgeList = []
+        self.bind(pin)
         self.newPos = QPointF()
         self.graph = graphWidget
         # print(f"PinGraphic: {self.pin_type} pin created")
@@ -29,7 +30,7 @@ class PinGraphic(QGraphicsEllipseItem):
        
     def mousePressEvent(self, event):
         """Clicking a pin will start a connection or finish making a connection if one is already started."""
-        print(f"{self.pin_type} pin was clicked")
+        CANVAS.debug("%s pin was clicked", self.pin_type)
         start = self.graph.connection["start"]
         end = self.graph.connection["end"]
         if start is None:#I want to start a connection
@@ -38,53 +39,42 @@ class PinGraphic(QGraphicsEllipseItem):
         elif end is None and start != self:#a connection is already started and I want to finish the connection
             # print("Finishing a connection")
             end = self
-            # The Edge init function adds the edge to the source and destination pin
+            # The graph adds the edge to the source and destination pin
             # check the source and end pin to see if the edge already exists before 
             # making the Edge
-            found = False
-            for pin in [start, end]:
-                for edge in pin.edgeList:
-                    if (edge.sourceNode() == start and edge.destNode() == end) or \
-                        (edge.sourceNode() == end and edge.destNode() == start):
-                        print("Edge already exists")
-                        found = True
+            found = self.graph.findEdge(start, end) is not None
+            if found:
+                CANVAS.info("Edge already exists")
 
             if not found:
                 #if a user starts a connection on an input put, and then ends with a 
-                #connection on an output pin, swap the direction of the connection. The 
+                #connection on an output pin, the graph swaps the direction of the connection. The 
                 #wants to start a connection between these two nodes, but we need to ensure that it 
                 #goes in the correct direction.
-                if start.pin_type == "input" and end.pin_type == "output":
-                    start, end = end, start
-                elif (start.pin_type == "output" and end.pin_type == "output") or \
-                    (start.pin_type == "input" and end.pin_type == "input"):
-                    raise ValueError("Cannot connect two pins of the same type")
-                
-                edge = Edge(start, end, self.graph)
-                self.scene.addItem(edge)
-                # print("pin scene:", self.scene)
-                self.graph.addEdge(edge)
+                self.graph.connectPins(start, end)
             self.graph.connection = {"start": None, "end": None}
 
         super().mousePressEvent(event)    
 
     
-    def addEdge(self, edge):
-        for otr_edge in self.edgeList:
-            # two edges are equal if they connect the same pins, regardless of the dircetion
-            if (otr_edge.sourceNode() == edge.sourceNode() and otr_edge.destNode() == edge.destNode()) or \
-                (otr_edge.sourceNode() == edge.destNode() and otr_edge.destNode() == edge.sourceNode()):
-                print("Pin.addEdge: Edge already exists")
-                return
-            
-
-        self.edgeList.append(edge)
+    def bind(self, pin):
+        self.pin = pin
+        self.pin_type = pin.pin_type
 
     def edges(self):
-        return self.edgeList
+        """the Edge items connected to this pin. Edges without an item are skipped: node
+        items are created before the edge items, and a node placed while a project loads
+        moves its pins before its edges have items"""
+        items = (self.graph.edges.get(edge.key()) for edge in self.pin.edges.values())
+        return [item for item in items if item is not None]
 
     def type(self):
         return PinGraphic.Type
+
+    #override, only to measure it. Pins are cached, so this runs when the cache is redrawn
+    @timed(PAINT)
+    def paint(self, painter, option, widget=None):
+        super().paint(painter, option, widget)
     
     def advancePosition(self):
         # if the nodes postion changes, return True, else return False
@@ -95,18 +85,11 @@ class PinGraphic(QGraphicsEllipseItem):
     
     def adjust(self):
         # print(f"PinGraphic: Adjusting pin position for {self.pin_type} pin")
-        for edge in self.edgeList:
+        for edge in self.edges():
             edge.adjust()
 
     def itemChange(self, change, value):
         if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            for edge in self.edgeList:
+            for edge in self.edges():
                 edge.adjust()
         return super().itemChange(change, value)
-    
-    def removeEdge(self, edge):
-        self.edgeList.remove(edge)
-        
-
-    
-    
\ No newline at end of file
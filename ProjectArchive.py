@@ -0,0 +1,211 @@
+"""
+This module reads and writes the binary project format (.nbk). A project archive is one
+file laid out as
+
+    header      magic, format version, node/edge/class counts, offset of the blob area
+    classes     the node class names, each a u16 length and utf-8 bytes
+    node table  one fixed size record per node: id, x, y, class index, and the offset and
+                length of the node's text, code and sub-graph in the blob area
+    edge table  one (source node id, dest node id) record per edge
+    blob area   the utf-8 text and code of every node, back to back, and the sub-graph of
+                every container node as a JSON project (length 0 for other nodes)
+
+The tables are unpacked when the archive is opened, the blob area is memory-mapped and a
+node's code is only decoded the first time something reads Node.code. Archives convert
+to and from the JSON project format without losing anything. It does not import Qt.
+"""
+
+import json, mmap, os, struct
+from GraphModel import GraphModel, Node
+
+
+MAGIC = b"NBKP"
+FORMAT_VERSION = 2#1 had no sub-graphs
+ARCHIVE_EXTENSION = ".nbk"
+
+# magic, version, flags, node count, edge count, class count, blob area offset
+HEADER = struct.Struct("<4sHHIIIQ")
+CLASS_LENGTH = struct.Struct("<H")
+# id, x, y, class index, text offset, text length, code offset, code length,
+# sub-graph offset, sub-graph length
+NODE_RECORD = struct.Struct("<qddIQIQIQI")
+NODE_RECORD_V1 = struct.Struct("<qddIQIQI")
+# source node id, dest node id
+EDGE_RECORD = struct.Struct("<qq")
+
+
+class ProjectArchive:
+    """An open project archive. It keeps the file mapped for as long as nodes that were
+    loaded from it may still read their code, so it is closed when the last of them is gone."""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = open(file_path, "rb")
+        try:
+            self.readTables()
+        except Exception:
+            self.file.close()
+            raise
+
+    def readTables(self):
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:4] != MAGIC:
+            raise ValueError(f"{self.file_path} is not a NodeBook project archive")
+        magic, version, flags, node_count, edge_count, class_count, blob_offset = HEADER.unpack(header)
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{self.file_path} was saved by a newer version of NodeBook (format {version})")
+        self.version = version
+
+        self.class_names = []
+        for _ in range(class_count):
+            length, = CLASS_LENGTH.unpack(self.file.read(CLASS_LENGTH.size))
+            self.class_names.append(self.file.read(length).decode("utf-8"))
+        record = NODE_RECORD if version >= 2 else NODE_RECORD_V1
+        node_table = self.file.read(node_count * record.size)
+        edge_table = self.file.read(edge_count * EDGE_RECORD.size)
+        if len(node_table) != node_count * record.size or len(edge_table) != edge_count * EDGE_RECORD.size:
+            raise ValueError(f"{self.file_path} is truncated")
+        self.node_records = list(record.iter_unpack(node_table))
+        if version < 2:
+            self.node_records = [fields + (0, 0) for fields in self.node_records]
+        self.edge_records = list(EDGE_RECORD.iter_unpack(edge_table))
+
+        self.blob_offset = blob_offset
+        file_size = os.fstat(self.file.fileno()).st_size
+        if file_size > blob_offset:
+            #mmap offsets have to be a multiple of the allocation granularity
+            start = blob_offset - blob_offset % mmap.ALLOCATIONGRANULARITY
+            self.blob = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ, offset=start)
+            self.blob_start = blob_offset - start
+        else:
+            self.blob = b""
+            self.blob_start = 0
+
+    def raw(self, offset, length):
+        """the encoded bytes of a string in the blob area"""
+        start = self.blob_start + offset
+        return self.blob[start:start + length]
+
+    def read(self, offset, length):
+        return self.raw(offset, length).decode("utf-8")
+
+    def toModel(self):
+        """build a GraphModel from the archive, the code of every node stays in the file"""
+        model = GraphModel()
+        class_names = self.class_names
+        for (node_id, x, y, class_index, text_offset, text_length, code_offset, code_length,
+                subgraph_offset, subgraph_length) in self.node_records:
+            node = Node(text=self.read(text_offset, text_length), code=None, node_number=node_id,
+                        class_name=class_names[class_index], x=x, y=y)
+            node.code_ref = (self, code_offset, code_length)
+            if subgraph_length:
+                #sub-graphs are small next to the code, they are decoded up front
+                node.subgraph = GraphModel().loadDict(json.loads(self.read(subgraph_offset, subgraph_length)))
+            model.addNode(node)
+        for source_id, dest_id in self.edge_records:
+            model.connectIds(source_id, dest_id)
+        model.markClean()
+        return model
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.file.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except (AttributeError, BufferError):
+            pass
+
+
+def loadArchive(file_path):
+    """read a project archive into a new GraphModel"""
+    return ProjectArchive(file_path).toModel()
+
+
+def saveArchive(model, file_path):
+    """write a GraphModel to a project archive. The code of nodes that was never loaded is
+    copied from the archive it came from without being decoded. The archive is written to
+    a temporary file first, so the file being replaced can still be mapped while we read it."""
+    nodes = list(model.nodes.values())
+    edges = list(model.edges.values())
+    class_index = {}
+    for node in nodes:
+        if type(node.id) is not int or not -2**63 <= node.id < 2**63:
+            raise ValueError(f"Cannot save node id {node.id!r} in an archive, ids have to be 64 bit integers")
+        class_index.setdefault(node.class_name, len(class_index))
+    classes = b"".join(CLASS_LENGTH.pack(len(encoded)) + encoded
+                       for encoded in (name.encode("utf-8") for name in class_index))
+    blob_offset = HEADER.size + len(classes) + len(nodes) * NODE_RECORD.size + len(edges) * EDGE_RECORD.size
+
+    temp_path = file_path + ".tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            #the tables are written after the blob area, once the offsets are known
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(nodes), len(edges), len(class_index), blob_offset))
+            file.write(classes)
+            file.seek(blob_offset)
+            node_table = bytearray()
+            offset = 0
+            for node in nodes:
+                text = node.text.encode("utf-8")
+                file.write(text)
+                code = node.rawCode()
+                file.write(code)
+                subgraph = b""
+                if node.subgraph is not None:
+                    subgraph = json.dumps(node.subgraph.toDict(), separators=(",", ":")).encode("utf-8")
+                    file.write(subgraph)
+                node_table += NODE_RECORD.pack(node.id, float(node.x), float(node.y), class_index[node.class_name],
+                                               offset, len(text), offset + len(text), len(code),
+                                               offset + len(text) + len(code), len(subgraph))
+                offset += len(text) + len(code) + len(subgraph)
+            file.seek(HEADER.size + len(classes))
+            file.write(node_table)
+            for edge in edges:
+                source_id, dest_id = edge.key()
+                file.write(EDGE_RECORD.pack(source_id, dest_id))
+        try:
+            os.replace(temp_path, file_path)
+        except PermissionError:
+            #windows can't replace a file that is mapped, read the code out of it first
+            releaseArchive(model, file_path)
+            os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def releaseArchive(model, file_path):
+    """load the code every node still reads from the archive at file_path, and close it"""
+    file_path = os.path.abspath(file_path)
+    archives = set()
+    for node in model.nodes.values():
+        if node.code_ref is not None and os.path.abspath(node.code_ref[0].file_path) == file_path:
+            archives.add(node.code_ref[0])
+            node.code = node.code
+    for archive in archives:
+        archive.close()
+
+
+def jsonToArchive(json_path, archive_path):
+    with open(json_path, "r") as file:
+        saveArchive(GraphModel.fromDict(json.load(file)), archive_path)
+
+
+def archiveToJson(archive_path, json_path):
+    with open(json_path, "w") as file:
+        json.dump(loadArchive(archive_path).toDict(), file, indent=4)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a project between the JSON and archive formats")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+    if args.source.endswith(ARCHIVE_EXTENSION):
+        archiveToJson(args.source, args.destination)
+    else:
+        jsonToArchive(args.source, args.destination)
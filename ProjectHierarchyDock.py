@@ -1,8 +1,338 @@
+"""
+This module shows the project as a tree: the nodes of the root graph, under a container
+the nodes of its sub-graph, and under every node the functions, classes and variables
+found in its code (see AnalysisService.py).
+
+The tree is lazy. An entry's children are only made into rows when the entry is expanded,
+FETCH_BATCH at a time as the view scrolls to them, so a project of 100k nodes costs rows
+for what was looked at. The canvas reports the nodes it adds and removes, and the tree
+applies them, batched every UPDATE_INTERVAL, as row insertions and removals instead of
+being rebuilt.
+"""
+
 from PySide6 import QtWidgets
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt, QTimer
+from CodeAnalysis import FUNCTION, CLASS
+from GraphModel import Node
+from Trace import UI
+
+
+#rows made at a time when an entry is expanded or the view scrolls to its end
+FETCH_BATCH = 1000
+#milliseconds the changes of the graph are collected before the tree applies them
+UPDATE_INTERVAL = 100
+
+
+class Entry:
+    """A row of the tree: the root, a node of the model or a symbol found in a node's code.
+    children is None until the entry is expanded, pending holds the nodes and symbols not
+    made into rows yet, the next one last"""
+    __slots__ = ("parent", "node", "symbol", "row", "children", "pending", "expandable")
+
+    def __init__(self, parent, row, node=None, symbol=None):
+        self.parent = parent
+        self.row = row
+        self.node = node
+        self.symbol = symbol
+        self.children = None
+        self.pending = []
+        self.expandable = self.hasSources()#whether the view was told it has children
+
+    def hasSources(self):
+        if self.symbol is not None:
+            return bool(self.symbol.children)
+        return bool(self.node.nodes_within) or bool(self.node.subgraph is not None and self.node.subgraph.nodes)
+
+    def sources(self):
+        """what the children of the entry show: the symbols of a node's code first, then
+        the nodes of its sub-graph"""
+        if self.symbol is not None:
+            return list(self.symbol.children)
+        symbols = list(self.node.nodes_within)
+        if self.node.subgraph is not None:
+            return symbols + list(self.node.subgraph.nodes.values())
+        return symbols
+
+    def title(self):
+        if self.symbol is not None:
+            if self.symbol.kind == FUNCTION:
+                return f"def {self.symbol.name}"
+            if self.symbol.kind == CLASS:
+                return f"class {self.symbol.name}"
+            return self.symbol.name
+        return self.node.text or f"{self.node.class_name} {self.node.id}"
+
+
+class RootEntry(Entry):
+    """The invisible parent of the nodes of the root model"""
+    __slots__ = ("model",)
+
+    def __init__(self, model):
+        self.model = model
+        super().__init__(None, 0)
+
+    def hasSources(self):
+        return bool(self.model.nodes)
+
+    def sources(self):
+        return list(self.model.nodes.values())
+
+
+class HierarchyModel(QAbstractItemModel):
+    """The lazy tree of a canvas's project"""
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.root = RootEntry(canvas.rootModel())
+        self.entries = {}#node id -> Entry of the node, for the nodes that have one
+        self.changes = []#(model, nodes added, nodes removed) not applied yet, in order
+        self.analyzed = set()#ids of the nodes whose symbols changed since the last update
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(UPDATE_INTERVAL)
+        self.timer.timeout.connect(self.applyChanges)
+        canvas.projectChanged.connect(self.reset)
+        canvas.graphChanged.connect(self.graphChanged)
+        canvas.analyzer.nodeAnalyzed.connect(self.nodeAnalyzed)
+
+    def entry(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def indexOf(self, entry):
+        if entry is self.root:
+            return QModelIndex()
+        return self.createIndex(entry.row, 0, entry)
+
+    def index(self, row, column, parent=QModelIndex()):
+        entry = self.entry(parent)
+        if entry.children is None or not 0 <= row < len(entry.children) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, 0, entry.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.indexOf(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        entry = self.entry(parent)
+        return 0 if entry.children is None else len(entry.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        entry = self.entry(parent)
+        if entry.children is None:
+            return entry.expandable
+        return bool(entry.children or entry.pending)
+
+    def canFetchMore(self, parent):
+        entry = self.entry(parent)
+        return entry.children is None or bool(entry.pending)
+
+    def fetchMore(self, parent):
+        entry = self.entry(parent)
+        if entry.children is None:
+            entry.children = []
+            entry.pending = entry.sources()[::-1]
+        batch = entry.pending[-FETCH_BATCH:][::-1]
+        if not batch:
+            return
+        del entry.pending[-FETCH_BATCH:]
+        self.insertEntries(entry, len(entry.children), batch)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = index.internalPointer()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return entry.title()
+        if role == Qt.ItemDataRole.ToolTipRole and entry.symbol is not None:
+            return f"{entry.symbol.kind}, line {entry.symbol.line}"
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return "Project"
+        return None
+
+    def makeEntry(self, parent, row, source):
+        if isinstance(source, Node):
+            entry = Entry(parent, row, node=source)
+            self.entries[source.id] = entry
+            return entry
+        return Entry(parent, row, node=parent.node, symbol=source)#the node the symbol is in
+
+    def insertEntries(self, parent, row, sources):
+        """make rows of sources at row of a fetched entry"""
+        self.beginInsertRows(self.indexOf(parent), row, row + len(sources) - 1)
+        parent.children[row:row] = [self.makeEntry(parent, row + i, source) for i, source in enumerate(sources)]
+        self.renumber(parent, row + len(sources))
+        self.endInsertRows()
+
+    def removeEntries(self, parent, rows):
+        """remove rows of a fetched entry, in contiguous runs from the last one up"""
+        rows = sorted(rows, reverse=True)
+        if not rows:
+            return
+        index = self.indexOf(parent)
+        i = 0
+        while i < len(rows):
+            last = first = rows[i]
+            i += 1
+            while i < len(rows) and rows[i] == first - 1:
+                first = rows[i]
+                i += 1
+            self.beginRemoveRows(index, first, last)
+            for entry in parent.children[first:last + 1]:
+                self.forget(entry)
+            del parent.children[first:last + 1]
+            self.endRemoveRows()
+        #renumbered once, not after every run. The view lays itself out after the removals
+        self.renumber(parent, first)
+
+    @staticmethod
+    def renumber(parent, start):
+        for row in range(start, len(parent.children)):
+            parent.children[row].row = row
+
+    def forget(self, entry):
+        """drop the node ids of an entry and the entries under it"""
+        if entry.symbol is None and self.entries.get(entry.node.id) is entry:
+            del self.entries[entry.node.id]
+        for child in entry.children or ():
+            self.forget(child)
+
+    def reset(self):
+        """show another project, or the project after it was cleared"""
+        self.timer.stop()
+        self.changes = []
+        self.analyzed = set()
+        self.beginResetModel()
+        self.root = RootEntry(self.canvas.rootModel())
+        self.entries = {}
+        self.endResetModel()
+
+    def graphChanged(self, model, added, removed):
+        self.changes.append((model, added, removed))
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def nodeAnalyzed(self, node_id):
+        self.analyzed.add(node_id)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def parentEntry(self, model):
+        """the entry whose children are the nodes of a model, None if it has none yet"""
+        if model is self.root.model:
+            return self.root
+        if model.parent is None:
+            return None
+        graph, container = model.parent
+        entry = self.entries.get(container.id)
+        return entry if entry is not None and entry.node is container else None
+
+    def applyChanges(self):
+        changes, self.changes = self.changes, []
+        analyzed, self.analyzed = self.analyzed, set()
+        for model, added, removed in changes:
+            if removed:
+                self.nodesRemoved(model, removed)
+            if added:
+                self.nodesAdded(model, added)
+        for node_id in analyzed:
+            self.symbolsChanged(node_id)
+
+    def nodesRemoved(self, model, nodes):
+        rows = {}#parent entry -> rows of the removed nodes
+        gone = {node.id for node in nodes if model.nodes.get(node.id) is not node}
+        for node in nodes:
+            entry = self.entries.get(node.id)
+            if node.id in gone and entry is not None and entry.node is node:
+                rows.setdefault(entry.parent, []).append(entry.row)
+        for parent, parent_rows in rows.items():
+            self.removeEntries(parent, parent_rows)
+        parent = self.parentEntry(model)
+        if parent is not None and parent.pending:
+            parent.pending = [source for source in parent.pending
+                              if not isinstance(source, Node) or source.id not in gone]
+
+    def nodesAdded(self, model, nodes):
+        parent = self.parentEntry(model)
+        if parent is None:
+            return
+        nodes = [node for node in nodes if model.nodes.get(node.id) is node and node.id not in self.entries]
+        if not nodes:
+            return
+        if parent.children is None:
+            self.refreshExpandable(parent)
+        elif parent.pending:
+            parent.pending[0:0] = nodes[::-1]#they come after the ones not shown yet
+        else:
+            self.insertEntries(parent, len(parent.children), nodes)
+
+    def refreshExpandable(self, entry):
+        """an entry that wasn't expanded yet and gained its first children shows them"""
+        if entry is None or entry.children is not None or entry.expandable:
+            return
+        sources = entry.sources()
+        if not sources:
+            return
+        entry.expandable = True
+        entry.children = []
+        entry.pending = sources[::-1]
+        self.fetchMore(self.indexOf(entry))
+
+    def symbolsChanged(self, node_id):
+        """replace the symbol rows of a node whose code was analyzed again"""
+        entry = self.entries.get(node_id)
+        if entry is None:
+            return
+        if entry.children is None:
+            self.refreshExpandable(entry)
+            return
+        symbols = [row for row, child in enumerate(entry.children) if child.symbol is not None]
+        entry.pending = [source for source in entry.pending if isinstance(source, Node)]
+        self.removeEntries(entry, symbols)
+        if entry.node.nodes_within:
+            self.insertEntries(entry, 0, list(entry.node.nodes_within))
+
+    def locate(self, index):
+        """the node an entry belongs to and the containers from the root down to it"""
+        entry = index.internalPointer()
+        while entry.symbol is not None:
+            entry = entry.parent
+        node = entry.node
+        containers = []
+        while entry.parent is not self.root:
+            entry = entry.parent
+            containers.append(entry.node)
+        return node, containers[::-1]
+
 
 class ProjectHierarchyDock(QtWidgets.QDockWidget):
     def __init__(self, parent=None):
         super().__init__("Project Hierarchy", parent)
         self.setAllowedAreas(Qt.DockWidgetArea.RightDockWidgetArea)
-        # You can add a widget here, like a QTreeWidget, to display the project hierarchy
+        self.canvas = None
+        self.model = None
+        self.tree = QtWidgets.QTreeView()
+        self.tree.setHeaderHidden(True)
+        #every row has the same height, the view doesn't measure them one by one
+        self.tree.setUniformRowHeights(True)
+        self.tree.clicked.connect(self.entryClicked)
+        self.setWidget(self.tree)
+
+    def setCanvas(self, canvas):
+        """show the project of a canvas"""
+        self.canvas = canvas
+        self.model = HierarchyModel(canvas, self)
+        self.tree.setModel(self.model)
+
+    def entryClicked(self, index):
+        """show the node of the entry on the canvas"""
+        node, containers = self.model.locate(index)
+        if not self.canvas.showNode(node, containers):
+            UI.debug("node %s is no longer in the project", node.id)
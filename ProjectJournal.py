@@ -0,0 +1,109 @@
+"""
+This module implements the save journal of a project. Saves append the records of what
+changed since the previous save (GraphModel.takeChanges) to a journal file next to the
+project, one JSON line per save, so a save costs as much as the edit that is being saved.
+Opening a project replays its journal, and once the journal grows past a fraction of the
+project it is compacted: replayed into the project file, which is rewritten, and removed.
+Whoever saves decides when to compact, an archive can only be replaced once the open
+project no longer maps it (see ProjectArchive.releaseArchive).
+It does not import Qt, the journal is written on a worker thread.
+"""
+
+import json, os
+from GraphModel import loadProjectFile, saveProjectFile
+from ProjectArchive import ARCHIVE_EXTENSION, loadArchive, saveArchive
+
+
+JOURNAL_SUFFIX = ".journal"
+#the journal is compacted once it is bigger than this fraction of the project file
+COMPACT_RATIO = 0.5
+#and bigger than this (bytes), so small projects aren't rewritten on every save
+COMPACT_MIN_SIZE = 1 << 20
+
+
+class ProjectJournal:
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.path = project_path + JOURNAL_SUFFIX
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, changes):
+        """append the records of one save, they are on disk when this returns"""
+        line = json.dumps(changes, separators=(",", ":")) + "\n"
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def batches(self):
+        """the saves in the journal, in order. A save that was cut off by a crash is the
+        last line and doesn't decode, it is skipped"""
+        if not self.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    changes = json.loads(line)
+                except ValueError:
+                    continue
+                yield changes
+
+    def replay(self, model):
+        """apply the journal to a model loaded from the project file, returns the number
+        of saves that were applied"""
+        count = 0
+        for changes in self.batches():
+            model.applyChanges(changes)
+            count += 1
+        model.markClean()
+        return count
+
+    def needsCompaction(self):
+        journal_size = self.size()
+        try:
+            project_size = os.path.getsize(self.project_path)
+        except OSError:
+            project_size = 0
+        return journal_size > COMPACT_MIN_SIZE and journal_size > project_size * COMPACT_RATIO
+
+    def compact(self):
+        """rewrite the project file with the journal applied and remove the journal.
+        Only the files are read, so this can run while the graph is being edited"""
+        if not self.exists():
+            return
+        if self.project_path.endswith(ARCHIVE_EXTENSION):
+            model = loadArchive(self.project_path)
+            self.replay(model)
+            saveArchive(model, self.project_path)
+        else:
+            model = loadProjectFile(self.project_path)
+            self.replay(model)
+            saveProjectFile(model, self.project_path)
+        os.remove(self.path)
+
+    def discard(self):
+        if self.exists():
+            os.remove(self.path)
+
+
+def saveChanges(project_path, changes, compact=False):
+    """append a save to the journal of a project, and compact it if asked. Runs on the save
+    worker thread. Raises if the changes could not be appended. A compaction that failed
+    leaves them in the journal, its error is returned instead"""
+    journal = ProjectJournal(project_path)
+    if changes is not None:
+        journal.append(changes)
+    if compact:
+        try:
+            journal.compact()
+        except Exception as error:
+            return error
+    return None
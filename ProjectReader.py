@@ -0,0 +1,116 @@
+"""
+This module reads a JSON project file incrementally. The file is read in chunks and the
+elements of its "nodes" and "edges" arrays are decoded one at a time, so a loader can
+build the graph while the file is still being read. It does not import Qt.
+"""
+
+import json, os
+
+WHITESPACE = " \t\n\r"
+
+
+class ProjectReader:
+    """Yields ("nodes", node dict) and ("edges", edge dict) records from a project file
+    in the order they appear in it. Other top level keys are decoded whole and yielded as
+    (key, value)."""
+    def __init__(self, file, chunk_size=1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.read_count = 0
+        self.decoder = json.JSONDecoder()
+        try:
+            self.size = os.fstat(file.fileno()).st_size
+        except (AttributeError, OSError):
+            self.size = 0
+
+    def bytesRead(self):
+        """how far into the file the reader is, used for progress. Counts characters, so
+        it is only an estimate for files that aren't ascii"""
+        return self.read_count
+
+    def fill(self):
+        """read another chunk, returns False at the end of the file"""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.read_count += len(chunk)
+        #drop what has been consumed so the buffer doesn't grow with the file
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """the next non whitespace character, or "" at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == "" or char not in chars:
+            raise ValueError(f"Invalid project file: expected {chars!r} at {self.bytesRead()}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def decodeValue(self):
+        """decode the JSON value at the current position, reading more of the file until
+        the whole value is in the buffer"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            #a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.decodeValue()
+            self.expect(":")
+            if key in ("nodes", "edges") and self.peek() == "[":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.decodeValue()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                yield key, self.decodeValue()
+            if self.expect(",}") == "}":
+                return
+
+
+def readProject(file_path):
+    """read a whole project file through ProjectReader, into the same dict json.load makes"""
+    project = {"nodes": [], "edges": []}
+    with open(file_path, "r") as file:
+        for key, value in ProjectReader(file):
+            if key in ("nodes", "edges"):
+                project[key].append(value)
+            else:
+                project[key] = value
+    return project
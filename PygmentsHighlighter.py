@@ -1,183 +1,335 @@
 #this module uses text mate to parse the code for highlighting
 #syntax
+import json, os, time
+from concurrent.futures import ThreadPoolExecutor
 from PySide6 import QtGui, QtCore
+from PySide6.QtCore import QTimer, Signal
 from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor
-from pygments import highlight
-from pygments.lexers import PythonLexer
-from pygments.formatter import Formatter
+from pygments.token import Token, string_to_tokentype
+from LineLexer import LineLexer
+from PerfMonitor import timed, HIGHLIGHT
 
 
 #TODO: operators, delimiters, numbers, braces, brackets
 
-KEYWORDS_PURPLE = ['as', 'assert', 'async', 'await', 'break', 'continue', 'del', 'elif', 
-            'else', 'except', 'finally', 'for', 'from', 'if', 'import', 
-            'pass', 'raise', 'return', 'try', 'while', 'with', 'yield']
-
-KEYWORDS_BLUE = ['False', 'None', 'True', 'and','lambda','not', 'or','is', 'def', 'nonlocal', 'class', 
-        'global', 'in']
-
-STYLE = {
-    "keyword_p": "#7A6AC0",#pastel purple
-    'keyword_b': "#2666CB",#pastel blue
-    'string' : "#AC9178",#pastel brown
-    'comment': "#6A9955",#olive drab
-    "class_name" : "#34BCB0",#pastel green, modules in the import statements are also this color
-    "function_name" : "#DCDC9D",#pastel yellow
-    "variable_name" : "#50B9FE",#sky blue
-    "defualt_parentheses" : "#1F1F1F",#gold
-    "format_string" : "#4FC1FF",#pastel blue, (f'somestring') for the f
-    "regex_string" : "#D16969",#salmon, (r'\bself\b') for the r
+THEME_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "themes")
+DEFAULT_THEME = "default"
+
+#documents with more blocks than this are lexed in the background
+ASYNC_BLOCK_COUNT = 1000
+#how long the GUI thread may lex in one burst of highlightBlock calls, and how long it may
+#spend applying background results per timer tick (seconds)
+SYNC_BUDGET = 0.008
+#highlightBlock calls closer together than this belong to the same burst
+BURST_GAP = 0.002
+#lines lexed by the worker between reports to the GUI thread
+CHUNK_LINES = 256
+#block state of a block waiting for its background lexing result
+PENDING_STATE = -2
+
+# token types whose color depends on the token's value or on names seen earlier in the
+# document, they are handled by PygmentsHighlighter.getFormat
+RULE_KEYWORD = "keyword"
+RULE_NAME = "name"
+RULE_FUNCTION = "function"
+RULE_CLASS = "class"
+RULE_NAMESPACE = "namespace"
+RULES = {
+    Token.Keyword: RULE_KEYWORD,
+    Token.Name: RULE_NAME,#it could be a class name or function name
+    Token.Name.Function: RULE_FUNCTION,#only see Name.Function at definition
+    Token.Name.Class: RULE_CLASS,#only see Name.Class at definition
+    Token.Name.Namespace: RULE_NAMESPACE,#module names in import statements
 }
 
-class QFormatter(Formatter):
-    def __init__(self, *args, **kwargs):
-        Formatter.__init__(self, *args, **kwargs)
-        self.data = []
 
-    def format(self, tokensource, outfile):
-        for ttype, value in tokensource:
-            self.data.append((ttype, value))
+def makeFormat(color) -> QTextCharFormat:
+    _format = QTextCharFormat()
+    _format.setForeground(QColor(color))
+    return _format
+
+
+class CompiledStyle:
+    """A theme compiled for highlighting. Every pygments token type is resolved once,
+    walking up its parent types, to a shared QTextCharFormat and to the rule (if any)
+    that picks the format from the token's value instead."""
+    def __init__(self, theme):
+        self.name = theme.get("name", "")
+        self.formats = {name: makeFormat(color) for name, color in theme["styles"].items()}
+        self.token_styles = {string_to_tokentype(ttype): name for ttype, name in theme["tokens"].items()}
+        self.keyword_formats = {keyword: self.formats[name]
+                                for name, keywords in theme["keywords"].items() for keyword in keywords}
+        self.table = {}#token type -> (format or None, rule or None)
+        self.compileAll(Token)
+
+    def compileAll(self, ttype):
+        self.table[ttype] = self.compile(ttype)
+        for subtype in ttype.subtypes:
+            self.compileAll(subtype)
+
+    def compile(self, ttype):
+        """the closest type that has a style or a rule decides the rule, and the closest
+        type that has a style decides the format"""
+        rule = style = None
+        ruled = False
+        while ttype is not None and style is None:
+            if not ruled and (ttype in RULES or ttype in self.token_styles):
+                rule = RULES.get(ttype)
+                ruled = True
+            style = self.token_styles.get(ttype)
+            ttype = ttype.parent
+        return self.formats.get(style), rule
+
+    def resolve(self, ttype):
+        entry = self.table.get(ttype)
+        if entry is None:
+            #a type created after the theme was compiled
+            entry = self.table[ttype] = self.compile(ttype)
+        return entry
+
+
+_styles = {}#theme name -> CompiledStyle, shared by every highlighter
+_executor = None#worker thread shared by every highlighter
+
+def backgroundExecutor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="highlighter")
+    return _executor
+
+def loadStyle(name=DEFAULT_THEME):
+    """load a theme from THEME_DIR, it is compiled the first time it is used"""
+    style = _styles.get(name)
+    if style is None:
+        with open(os.path.join(THEME_DIR, name + ".json"), "r") as file:
+            style = _styles[name] = CompiledStyle(json.load(file))
+    return style
 
 class PygmentsHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent: QtGui.QTextDocument) -> None:
+    """Highlights a document one block (line) at a time.
+    The block state stored by Qt is the id of the lexer state at the end of the block, so
+    every block is lexed starting from where the previous one left off. Lexed blocks are
+    cached by (entry state, text), and when an edit changes a block's end state Qt carries
+    on to the next block, so an edit re-lexes blocks only until the state converges.
+
+    Large documents are highlighted asynchronously. The GUI thread only lexes for a few
+    milliseconds per burst of edits, the remaining blocks are marked pending and a worker
+    thread lexes a snapshot of them. Its results are applied in small timed batches,
+    visible blocks first, and results for an older version of the document are dropped."""
+    # (generation, first block, entry states of the lexed blocks), emitted by the worker
+    linesLexed = Signal(int, int, list)
+
+    def __init__(self, parent: QtGui.QTextDocument, theme=DEFAULT_THEME, editor=None) -> None:
         super().__init__(parent)
-        self.lexer = PythonLexer()
-        self.formatter = QFormatter()
+        self.style = loadStyle(theme)
+        self.line_lexer = LineLexer()
+        self.editor = editor#used to find the visible blocks
+        self.tokens = []#tokens of the block being highlighted
         self.function_names = set()
         self.class_names = set()
         self.module_names = set()
         self.variable_names = set()
-        self.multitline_open = False#used to track multiline strings and comments
+        #background highlighting
+        self.generation = 0#bumped on every edit, older worker results are stale
+        self.revision = parent.revision()#document revision the entry states belong to
+        self.entry_states = {}#block number -> lexer state at the start of it, from the worker
+        self.ready = set()#pending blocks the worker has lexed
+        self.applying = None#block number being applied from a background result
+        self.first_pending = None#lowest block number marked pending since the last pass
+        self.burst_end = 0.0
+        self.last_call = 0.0
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setInterval(0)
+        self.apply_timer.timeout.connect(self.applyBatch)
+        self.linesLexed.connect(self.onLinesLexed)
+        parent.contentsChange.connect(self.onContentsChange)
 
+    @timed(HIGHLIGHT, "highlightBlock")
     def highlightBlock(self, text: str | None) -> None:
         if text is None:
             return
-        
-        if self.previousBlockState() == 1:#the previous block whats to stay open
-            self.multitline_open = True
-
-        # Reset current block state
-        self.setCurrentBlockState(0)
-        
-        highlight(text, self.lexer, self.formatter)
-
-        # print("formatter data", self.formatter.data)
-        self.applyHighlighting(text)
-
-        # Check if the current block contains the end of a multi-line string
-        if self.multitline_open:
-            if self.endsMultilineString(text):
-                self.multitline_open = False
-            else:
-                #keep the block open
-                self.setCurrentBlockState(1)
-    
-    def endsMultilineString(self, text):
-        return text.endswith('"""') or text.endswith("'''")
 
+        if self.applying is None:
+            #our own rehighlightBlock changes the revision too, it is recorded in applyBatch
+            self.checkRevision()
+        block_number = self.currentBlock().blockNumber()
+        state = self.previousBlockState()
+        if state == PENDING_STATE:
+            state = self.entry_states.get(block_number, PENDING_STATE)
+        if state != PENDING_STATE and (block_number == self.applying or self.canLexNow()):
+            self.tokens, state = self.line_lexer.lex(text, state)
+            self.applyHighlighting(text)
+            self.setCurrentBlockState(state)
+            return
+
+        #highlighting this block now would block the GUI
+        self.setCurrentBlockState(PENDING_STATE)
+        if state != PENDING_STATE and self.line_lexer.peek(text, state) is not None:
+            #already lexed, it is applied in a later batch
+            self.entry_states[block_number] = state
+            self.ready.add(block_number)
+            self.apply_timer.start()
+        elif self.first_pending is None or block_number < self.first_pending:
+            self.first_pending = block_number
+            QTimer.singleShot(0, self.startBackgroundPass)
+
+    def checkRevision(self):
+        """block numbers and texts of older worker snapshots no longer match the document"""
+        revision = self.document().revision()
+        if revision != self.revision:
+            self.revision = revision
+            self.generation += 1
+            self.entry_states = {}
+            self.ready = set()
+
+    def canLexNow(self):
+        """small documents are always lexed right away, large ones for SYNC_BUDGET per burst"""
+        if self.document().blockCount() <= ASYNC_BLOCK_COUNT:
+            return True
+        now = time.perf_counter()
+        if now - self.last_call > BURST_GAP:
+            self.burst_end = now + SYNC_BUDGET
+        self.last_call = now
+        return now <= self.burst_end
+
+    def onContentsChange(self, position, removed, added):
+        self.checkRevision()
+        #pending blocks after the edit have moved, the next pass starts at the edit at the latest
+        block_number = self.document().findBlock(position).blockNumber()
+        if self.first_pending is not None and block_number < self.first_pending:
+            self.first_pending = block_number
+
+    def startBackgroundPass(self):
+        """lex a snapshot of the document from the first pending block to the end"""
+        if self.first_pending is None:
+            return
+        first = self.first_pending
+        self.first_pending = None
+        block = self.document().findBlockByNumber(first)
+        if not block.isValid():
+            return
+        state = block.previous().userState() if first > 0 else -1
+        if state == PENDING_STATE:
+            state = self.entry_states.get(first, PENDING_STATE)
+        if state == PENDING_STATE:
+            #the block before it hasn't been lexed either, start from the top
+            first, block, state = 0, self.document().firstBlock(), -1
+        lines = []
+        while block.isValid():
+            lines.append(block.text())
+            block = block.next()
+        backgroundExecutor().submit(self.lexSnapshot, self.generation, first, state, lines)
+
+    def lexSnapshot(self, generation, first, state, lines):
+        """runs on the worker thread"""
+        entry_states = []
+        chunk_start = first
+        try:
+            for line in lines:
+                if generation != self.generation:
+                    return#the document changed again
+                entry_states.append(state)
+                state = self.line_lexer.lex(line, state)[1]
+                if len(entry_states) == CHUNK_LINES:
+                    self.linesLexed.emit(generation, chunk_start, entry_states)
+                    chunk_start += len(entry_states)
+                    entry_states = []
+            if entry_states:
+                self.linesLexed.emit(generation, chunk_start, entry_states)
+        except RuntimeError:
+            pass#the highlighter was deleted while we were lexing
+
+    def onLinesLexed(self, generation, first, entry_states):
+        if generation != self.generation:
+            return
+        for offset, state in enumerate(entry_states):
+            self.entry_states[first + offset] = state
+            self.ready.add(first + offset)
+        self.apply_timer.start()
+
+    def visibleBlockRange(self):
+        if self.editor is None:
+            return 0, -1
+        first = self.editor.firstVisibleBlock().blockNumber()
+        line_height = max(1, self.editor.fontMetrics().height())
+        return first, first + self.editor.viewport().height() // line_height + 1
+
+    @timed(HIGHLIGHT, "applyBatch")
+    def applyBatch(self):
+        """rehighlight lexed blocks for SYNC_BUDGET, visible blocks first"""
+        deadline = time.perf_counter() + SYNC_BUDGET
+        first_visible, last_visible = self.visibleBlockRange()
+        visible = [number for number in range(first_visible, last_visible + 1) if number in self.ready]
+        order = visible + sorted(self.ready.difference(visible))
+        document = self.document()
+        for number in order:
+            if time.perf_counter() > deadline:
+                return
+            self.ready.discard(number)
+            block = document.findBlockByNumber(number)
+            if block.isValid() and block.userState() == PENDING_STATE:
+                self.applying = number
+                self.rehighlightBlock(block)
+                self.applying = None
+                #the new formats bumped the revision, that isn't an edit
+                self.revision = document.revision()
+        self.apply_timer.stop()
 
     def applyHighlighting(self, text):
         idx = 0
         offset = 0
-        for ttype, value in self.formatter.data:
+        for ttype, value in self.tokens:
             # print("ttype", ttype, "value", value)
             length = len(value)
             # print("text length", length)
             # print("getting color")
-            color = self.getColor(idx, ttype, value)
-            if color:
+            _format = self.getFormat(idx, ttype, value)
+            if _format is not None:
                 #text.index(value) causes weird behavior when a parameter is one character long,
                 #it changes the color of that character throught the entire document
                 #instead we use offset to track the token 'window' in the text
-                self.setFormat(offset, length, self.makeFormat(color))
+                self.setFormat(offset, length, _format)
             idx += 1
             offset += length
 
-        self.formatter.data = []
+    def setTheme(self, theme):
+        self.style = loadStyle(theme)
+        self.rehighlight()
 
-    def getColor(self, idx, ttype, value):
-        # print("ttype in get_color", ttype, "value", value)
-        if self.multitline_open:
-            #we are on a new line of a multiline string, all of the tokens from here to the end need to be highlighted.
-            if value in ('"""', "'''"):#end of the multiline string
-                self.multitline_open = False
-                self.setCurrentBlockState(0)
-            #iterate through the rest of the tokens and set their colors
-            return STYLE['string']
+    def getFormat(self, idx, ttype, value):
+        _format, rule = self.style.resolve(ttype)
+        if rule is None:
+            return _format
 
-        if 'Keyword' in str(ttype):
-            
+        formats = self.style.formats
+        if rule == RULE_KEYWORD:
             if value == 'import':
                 self.handleImportStatement(idx)
+            return self.style.keyword_formats.get(value)
 
-            if value in KEYWORDS_PURPLE:
-                return STYLE['keyword_p']
-            elif value in KEYWORDS_BLUE:
-                return STYLE['keyword_b']
-            
-        elif str(ttype) == 'Token.Name.Function':#only see Name.Function at definition
-            # print("function name", value)
-            self.function_names.add(value)#track it so we can add color to this symbol when it is used
-            # print("function names", self.function_names)
-            return STYLE['function_name']
-        
-        elif str(ttype) == 'Token.Name.Class':#only see Name.Function at definition
-            # print("class name", value)
-            self.class_names.add(value)#track it so we can add color to this symbol when it is used
-            # print("class names", self.class_names)
-            return STYLE['class_name']
-        
-        elif str(ttype) == "Token.Name.Namespace":#module names in import statements                     
-            self.module_names.add(value)
-            return STYLE['class_name']#VsCode uses the same colors as class names
-        
-        elif str(ttype) == 'Token.Name.Builtin.Pseudo':#self
-            return STYLE['variable_name']
-
-        elif str(ttype) == 'Token.Name.Function.Magic':#init
-            return STYLE['function_name']
-        
-        elif str(ttype) == 'Token.Name.Builtin':#built in functions
-            return STYLE['class_name']
-        
-        elif str(ttype) == 'Token.Name':#it could be a class name or function name
-            # print("token.name", value)
+        elif rule == RULE_NAME:
             if value in self.function_names:
-                return STYLE['function_name']
-            elif value in self.class_names:
-                return STYLE['class_name']
-            elif value in self.module_names:
-                return STYLE['class_name']
+                return formats['function_name']
+            elif value in self.class_names or value in self.module_names:
+                return formats['class_name']
             #if it is not a function or class name it is a variable name
-            # print("returning variable color")
-            return STYLE['variable_name']
-        
-        elif 'String' in str(ttype):
-            # print("string value", value)
-            if value in ('"""', "'''"):
-                self.setCurrentBlockState(1)#keep the block open
-            return STYLE['string']
-        
-        elif 'Comment' in str(ttype):
-            return STYLE['comment']
-        
-        # print("no color found")
-        return None
-    
+            return _format
+
+        elif rule == RULE_FUNCTION:
+            self.function_names.add(value)#track it so we can add color to this symbol when it is used
+        elif rule == RULE_CLASS:
+            self.class_names.add(value)
+        elif rule == RULE_NAMESPACE:
+            self.module_names.add(value)#VsCode uses the same colors as class names
+        return _format
+
     def handleImportStatement(self, idx: int):
         #if the value is import we need to add the module names to the class_names set
         #for some reason import statements like - "from module import name1, name2" - name1 and name2 
         # are not being highlighted as Token.Name.Namespace but as Token.Name, we add all of the symbols now
         #so that when its time to handle Token.Name we can color them correctly
-        for i in range(idx+1, len(self.formatter.data)):
-            # print("i", i, "data", self.formatter.data[i])
-            if str(self.formatter.data[i][0]) == 'Token.Name':
-                # print("adding module name", self.formatter.data[i][1])
-                self.module_names.add(self.formatter.data[i][1])
-
-    
-
-    def makeFormat(self, color) -> QTextCharFormat:
-        _format = QTextCharFormat()
-        _format.setForeground(QColor(color))
-        return _format
+        for i in range(idx+1, len(self.tokens)):
+            # print("i", i, "data", self.tokens[i])
+            if self.tokens[i][0] is Token.Name:
+                # print("adding module name", self.tokens[i][1])
+                self.module_names.add(self.tokens[i][1])
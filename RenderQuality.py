@@ -0,0 +1,113 @@
+"""
+This module lowers the canvas's render quality while the user pans, zooms or drags, and
+restores it once the input has been idle for a moment. What each quality level turns on
+is a QualityPolicy, and the setting decides when the fast one is used: adaptively when
+frames take longer than the target frame time, always, or never.
+"""
+
+from PySide6.QtCore import QObject, QTimer, Signal
+from PySide6.QtGui import QPainter
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsView
+
+
+#quality levels the canvas can be drawn at
+FULL = "full"
+INTERACTIVE = "interactive"
+
+#settings choosing when INTERACTIVE is used
+ADAPTIVE = "adaptive"#while interacting, if frames take longer than the target
+ALWAYS_FAST = "always fast"#while interacting
+ALWAYS_FULL = "always full"#never
+
+#milliseconds without input before full quality comes back
+IDLE_DELAY = 250
+#frame time the adaptive setting tries to hold, in seconds
+TARGET_FRAME_TIME = 1 / 60
+
+
+class QualityPolicy:
+    """The render settings of a quality level"""
+    __slots__ = ("antialiasing", "smooth_pixmaps", "update_mode", "node_cache")
+
+    def __init__(self, antialiasing, smooth_pixmaps, update_mode, node_cache):
+        self.antialiasing = antialiasing
+        self.smooth_pixmaps = smooth_pixmaps
+        self.update_mode = update_mode#QGraphicsView.ViewportUpdateMode
+        self.node_cache = node_cache#QGraphicsItem.CacheMode of the node items
+
+
+def defaultPolicies():
+    return {
+        FULL: QualityPolicy(True, True, QGraphicsView.ViewportUpdateMode.MinimalViewportUpdate,
+                            QGraphicsItem.CacheMode.NoCache),
+        #nodes are cached in item coordinates, so zooming scales the cached picture
+        #instead of painting them again
+        INTERACTIVE: QualityPolicy(False, False, QGraphicsView.ViewportUpdateMode.BoundingRectViewportUpdate,
+                                   QGraphicsItem.CacheMode.ItemCoordinateCache),
+    }
+
+
+class RenderQuality(QObject):
+    """Switches a NodeCanvas between the quality levels. The canvas reports input with
+    interaction and the time it took to paint with frameRendered"""
+    modeChanged = Signal(str)#FULL or INTERACTIVE
+
+    def __init__(self, canvas, setting=ADAPTIVE, idle_delay=IDLE_DELAY, target_frame_time=TARGET_FRAME_TIME):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.policies = defaultPolicies()
+        self.setting = setting
+        self.target_frame_time = target_frame_time
+        self.mode = None
+        self.frame_time = 0.0#seconds the last paint took
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(idle_delay)
+        self.timer.timeout.connect(lambda: self.setMode(FULL))
+        self.setMode(FULL)
+
+    def setSetting(self, setting):
+        self.setting = setting
+        if setting == ALWAYS_FULL:
+            self.timer.stop()
+            self.setMode(FULL)
+
+    def setPolicy(self, mode, policy):
+        """change what a quality level turns on, applied right away if it is active"""
+        self.policies[mode] = policy
+        if mode == self.mode:
+            self.apply()
+
+    def interaction(self):
+        """called on every pan, zoom and drag event. Full quality comes back once these
+        stop for the idle delay"""
+        if self.setting == ALWAYS_FULL:
+            return
+        if self.mode == INTERACTIVE:
+            self.timer.start()
+        elif self.setting == ALWAYS_FAST or self.frame_time > self.target_frame_time:
+            self.setMode(INTERACTIVE)
+            self.timer.start()
+
+    def frameRendered(self, seconds):
+        self.frame_time = seconds
+
+    def setMode(self, mode):
+        if mode == self.mode:
+            return
+        self.mode = mode
+        self.apply()
+        self.modeChanged.emit(mode)
+
+    def apply(self):
+        policy = self.policies[self.mode]
+        self.canvas.setRenderHint(QPainter.RenderHint.Antialiasing, policy.antialiasing)
+        self.canvas.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, policy.smooth_pixmaps)
+        self.canvas.setViewportUpdateMode(policy.update_mode)
+        for item in self.canvas.nodes.values():
+            item.setCacheMode(policy.node_cache)
+        self.canvas.viewport().update()
+
+    def prepareItem(self, item):
+        """give a node item created during an interaction the active cache mode"""
+        item.setCacheMode(self.policies[self.mode].node_cache)
@@ -0,0 +1,160 @@
+"""
+This module caches the results of running nodes, so a run only executes the nodes whose
+code or inputs changed. Results are content addressed: a node's key is a hash of its code
+and of the digests of the results it received (see Executor.py), so editing a node changes
+its key and, once its result changes, the keys of everything downstream of it.
+
+Results are kept in a least recently used memory tier, and optionally in a directory on
+disk that is trimmed to a size limit, least recently used first. It does not import Qt.
+"""
+
+import hashlib, os, pickle, threading
+from collections import OrderedDict
+
+
+#most results kept in memory
+MEMORY_ITEMS = 256
+#most bytes the disk tier may use
+DISK_BYTES = 1 << 30
+
+
+def resultDigest(value):
+    """hash of a result, or None if it can't be pickled (then nothing downstream of it is cached)"""
+    try:
+        return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        return None
+
+
+def nodeKey(code, input_digests):
+    """key of running the code on inputs with the given digests, None if one is unknown"""
+    if None in input_digests:
+        return None
+    key = hashlib.sha256(code.encode("utf-8"))
+    for digest in input_digests:
+        key.update(b"\0" + digest.encode("ascii"))
+    return key.hexdigest()
+
+
+class ResultCache:
+    """Maps node keys to (pickled result, result digest)"""
+    def __init__(self, max_items=MEMORY_ITEMS, directory=None, max_disk_bytes=DISK_BYTES):
+        self.max_items = max_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.directory = None
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_files = OrderedDict()#key -> file size, least recently used first
+        self.disk_bytes = 0
+        if directory is not None:
+            self.setDirectory(directory)
+
+    def setDirectory(self, directory):
+        """use a directory as the disk tier, or turn it off with None. The entries already
+        in the directory are kept, in the order they were last used"""
+        with self.lock:
+            self.directory = directory
+            self.disk_files = OrderedDict()
+            self.disk_bytes = 0
+            if directory is None:
+                return
+            os.makedirs(directory, exist_ok=True)
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".pickle")]
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries:
+                size = entry.stat().st_size
+                self.disk_files[entry.name[:-len(".pickle")]] = size
+                self.disk_bytes += size
+            self.trimDisk()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def get(self, key):
+        """returns (value, digest), or None if the key isn't cached. The value is a new
+        copy every time, so a node that changes its inputs doesn't change the cache"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+            elif self.directory is None or key not in self.disk_files:
+                return None
+            else:
+                try:
+                    with open(self.path(key), "rb") as file:
+                        entry = pickle.load(file)
+                    os.utime(self.path(key))
+                except Exception:
+                    self.forget(key)
+                    return None
+                self.disk_files.move_to_end(key)
+                self.remember(key, entry)
+        data, digest = entry
+        try:
+            return pickle.loads(data), digest
+        except Exception:
+            #e.g. a class the result is an instance of was changed, or a file of an older cache
+            with self.lock:
+                self.memory.pop(key, None)
+                if self.directory is not None:
+                    self.forget(key)
+            return None
+
+    def put(self, key, value, digest):
+        """cache a copy of a result. Results that can't be pickled aren't cached"""
+        try:
+            #the entry keeps the pickled value, a result changed after it was cached doesn't
+            #change the entry
+            entry = (pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), digest)
+        except Exception:
+            return
+        with self.lock:
+            self.remember(key, entry)
+            if self.directory is not None and key not in self.disk_files:
+                data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+                temp_path = self.path(key) + ".tmp"
+                try:
+                    with open(temp_path, "wb") as file:
+                        file.write(data)
+                    os.replace(temp_path, self.path(key))
+                except OSError:
+                    #a full disk or a read only directory, the result is still served from memory
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+                    return
+                self.disk_files[key] = len(data)
+                self.disk_bytes += len(data)
+                self.trimDisk()
+
+    def remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def forget(self, key):
+        """remove a key from the disk tier"""
+        size = self.disk_files.pop(key, None)
+        if size is not None:
+            self.disk_bytes -= size
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def trimDisk(self):
+        while self.disk_bytes > self.max_disk_bytes and self.disk_files:
+            self.forget(next(iter(self.disk_files)))
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.directory is not None:
+                for key in list(self.disk_files):
+                    self.forget(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.memory or key in self.disk_files
@@ -0,0 +1,96 @@
+"""
+This module implements a spatial index over rectangles, used by the canvas to find the
+nodes and edges near the viewport without looking at every item of the graph.
+It does not import Qt.
+"""
+
+
+class SpatialIndex:
+    """Uniform grid of square cells, every rectangle is stored in the cells it overlaps.
+    Inserting, moving and removing a rectangle costs O(cells it covers) and a query costs
+    O(cells in the query + rectangles found). Rectangles that would cover a lot of cells
+    (a long edge across the canvas) are kept in a separate list that every query checks."""
+    def __init__(self, cell_size=512.0, max_cells=64):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells = {}#(column, row) -> set of keys
+        self.rects = {}#key -> (x1, y1, x2, y2)
+        self.large = set()#keys of rectangles not stored in the grid
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, key):
+        return key in self.rects
+
+    def cellRange(self, x1, y1, x2, y2):
+        size = self.cell_size
+        return int(x1 // size), int(y1 // size), int(x2 // size), int(y2 // size)
+
+    def insert(self, key, x1, y1, x2, y2):
+        """add or move the rectangle stored under key"""
+        if key in self.rects:
+            if self.rects[key] == (x1, y1, x2, y2):
+                return
+            self.remove(key)
+        self.rects[key] = (x1, y1, x2, y2)
+        c1, r1, c2, r2 = self.cellRange(x1, y1, x2, y2)
+        if (c2 - c1 + 1) * (r2 - r1 + 1) > self.max_cells:
+            self.large.add(key)
+            return
+        for column in range(c1, c2 + 1):
+            for row in range(r1, r2 + 1):
+                cell = self.cells.get((column, row))
+                if cell is None:
+                    cell = self.cells[(column, row)] = set()
+                cell.add(key)
+
+    def remove(self, key):
+        rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        if key in self.large:
+            self.large.discard(key)
+            return
+        c1, r1, c2, r2 = self.cellRange(*rect)
+        for column in range(c1, c2 + 1):
+            for row in range(r1, r2 + 1):
+                cell = self.cells.get((column, row))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del self.cells[(column, row)]
+
+    def bounds(self):
+        """(x1, y1, x2, y2) around every rectangle, all 0 when there are none"""
+        rects = self.rects.values()
+        if not rects:
+            return 0.0, 0.0, 0.0, 0.0
+        return (min(rect[0] for rect in rects), min(rect[1] for rect in rects),
+                max(rect[2] for rect in rects), max(rect[3] for rect in rects))
+
+    def clear(self):
+        self.cells = {}
+        self.rects = {}
+        self.large = set()
+
+    def query(self, x1, y1, x2, y2):
+        """the keys of every rectangle intersecting the query rectangle"""
+        found = set()
+        c1, r1, c2, r2 = self.cellRange(x1, y1, x2, y2)
+        if (c2 - c1 + 1) * (r2 - r1 + 1) > len(self.cells):
+            #the query covers more cells than are in use, visit the used ones instead
+            cells = [cell for (column, row), cell in self.cells.items()
+                     if c1 <= column <= c2 and r1 <= row <= r2]
+        else:
+            cells = [self.cells[(column, row)] for column in range(c1, c2 + 1)
+                     for row in range(r1, r2 + 1) if (column, row) in self.cells]
+        for cell in cells:
+            found.update(cell)
+        found.update(self.large)
+        rects = self.rects
+        return {key for key in found if self.intersects(rects[key], x1, y1, x2, y2)}
+
+    @staticmethod
+    def intersects(rect, x1, y1, x2, y2):
+        return rect[0] <= x2 and rect[2] >= x1 and rect[1] <= y2 and rect[3] >= y1
@@ -0,0 +1,182 @@
+"""
+This module carries the app's diagnostics, in place of print. Every message belongs to a
+category (CANVAS, FILES, RUN, UI) and has a level. A category's methods for the levels it
+doesn't record are a no-op, so a disabled message costs a call and its arguments are never
+formatted:
+
+    CANVAS.debug("pin clicked: %s", pin_type)
+    if FILES.enabled(DEBUG):
+        ...loops that only exist to trace...
+
+Recorded messages go to every sink: by default a RingBuffer of the last RING_SIZE
+messages and stderr, plus a file when NODEBOOK_TRACE_FILE is set. Levels are set with
+setLevel or configure, or from the environment: NODEBOOK_TRACE="canvas=debug,*=info".
+It does not import Qt.
+"""
+
+import os, sys, threading, time
+from collections import deque
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": OFF}
+LEVEL_NAMES = {level: name for name, level in LEVELS.items()}
+
+#categories record warnings and errors unless configured otherwise
+DEFAULT_LEVEL = WARNING
+#messages kept by the default ring buffer
+RING_SIZE = 2000
+
+
+def noop(message, *args):
+    pass
+
+
+class Record:
+    """One traced message"""
+    __slots__ = ("time", "category", "level", "message", "thread")
+
+    def __init__(self, category, level, message):
+        self.time = time.time()
+        self.category = category
+        self.level = level
+        self.message = message
+        self.thread = threading.current_thread().name
+
+    def __str__(self):
+        return (time.strftime("%H:%M:%S", time.localtime(self.time)) + f".{int(self.time % 1 * 1000):03d} "
+                f"{LEVEL_NAMES[self.level]} {self.category}: {self.message}")
+
+
+class RingBuffer:
+    """Keeps the last messages in memory, to be looked at or saved after something went wrong"""
+    def __init__(self, size=RING_SIZE):
+        self.records = deque(maxlen=size)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def save(self, path):
+        with open(path, "w") as file:
+            for record in list(self.records):
+                file.write(f"{record}\n")
+
+
+class StreamSink:
+    """Writes messages to a stream, stderr unless another one is given"""
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, record):
+        print(record, file=self.stream or sys.stderr)
+
+
+class FileSink:
+    """Appends messages to a file, a line at a time"""
+    def __init__(self, path):
+        self.file = open(path, "a", buffering=1)
+
+    def write(self, record):
+        self.file.write(f"{record}\n")
+
+    def close(self):
+        self.file.close()
+
+
+class Category:
+    """The messages of one part of the app. debug, info, warning and error take a message
+    and the arguments it is %-formatted with"""
+    __slots__ = ("name", "level", "debug", "info", "warning", "error")
+
+    def __init__(self, name, level=DEFAULT_LEVEL):
+        self.name = name
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        self.level = level
+        self.debug = self.method(DEBUG)
+        self.info = self.method(INFO)
+        self.warning = self.method(WARNING)
+        self.error = self.method(ERROR)
+
+    def method(self, level):
+        if level < self.level:
+            return noop
+        name = self.name
+
+        def emit(message, *args):
+            write(Record(name, level, message % args if args else message))
+        return emit
+
+    def enabled(self, level):
+        return level >= self.level
+
+
+categories = {}#name -> Category
+levels = {}#name or "*" -> level, of categories configured before or after they exist
+ring = RingBuffer()
+sinks = [ring, StreamSink()]
+lock = threading.Lock()
+
+
+def write(record):
+    with lock:
+        for sink in sinks:
+            sink.write(record)
+
+
+def category(name):
+    """the category with a name, created at its configured level the first time"""
+    if name not in categories:
+        categories[name] = Category(name, levels.get(name, levels.get("*", DEFAULT_LEVEL)))
+    return categories[name]
+
+
+def setLevel(name, level):
+    """record a category's messages from level up. "*" sets the level of every category
+    whose level wasn't set by name"""
+    levels[name] = level
+    if name == "*":
+        for other in categories.values():
+            other.setLevel(levels.get(other.name, level))
+    else:
+        category(name).setLevel(level)
+
+
+def configure(spec):
+    """set levels from a string like "canvas=debug,files=info,*=warning" """
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, level = item.partition("=")
+        level = level.strip().lower()
+        if level not in LEVELS:
+            raise ValueError(f"unknown trace level {level!r}, use one of {', '.join(LEVELS)}")
+        setLevel(name.strip(), LEVELS[level])
+
+
+def addSink(sink):
+    with lock:
+        sinks.append(sink)
+
+
+def removeSink(sink):
+    with lock:
+        sinks.remove(sink)
+
+
+try:
+    configure(os.environ.get("NODEBOOK_TRACE", ""))
+except ValueError as error:
+    write(Record("trace", WARNING, f"NODEBOOK_TRACE ignored: {error}"))
+if os.environ.get("NODEBOOK_TRACE_FILE"):
+    addSink(FileSink(os.environ["NODEBOOK_TRACE_FILE"]))
+
+CANVAS = category("canvas")#mouse and drag and drop handling, node and edge items
+FILES = category("files")#opening, saving and autosaving projects
+RUN = category("run")#running the graph
+UI = category("ui")#docks and menus
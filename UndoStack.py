@@ -0,0 +1,352 @@
+"""
+This module keeps the undo history of the canvas. Every edit is pushed as a command that
+stores only what it changed: the nodes and edge keys it added or removed, the old and new
+positions of what it moved, or the replaced span of a node's code. Undoing or redoing a
+command costs as much as the change did, whatever the size of the project.
+
+A command pushed soon after one it can merge with (the next keystrokes in the same place,
+the same nodes moved again) is merged into it. The history is kept under a memory budget
+by dropping its oldest commands. The commands call back into the canvas (see the Graph
+methods they use), and it does not import Qt.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+#bytes the history may hold before the oldest commands are dropped
+DEFAULT_BUDGET = 32 << 20
+#seconds within which consecutive commands that can merge are merged
+COALESCE_TIME = 1.0
+#rough bytes a command spends per node, edge key and position it keeps
+NODE_COST = 400
+EDGE_COST = 100
+MOVE_COST = 150
+COMMAND_COST = 200
+
+
+def codeCost(node):
+    #archived code is only a reference into the archive until it is read
+    cost = 0 if node.code_ref is not None else len(node.code or "")
+    if node.subgraph is not None:
+        cost += sum(NODE_COST + codeCost(inner) for inner in node.subgraph.nodes.values())
+    return cost
+
+
+class Command:
+    """An edit that can be undone and redone on a graph"""
+    label = ""
+
+    def undo(self, graph):
+        raise NotImplementedError
+
+    def redo(self, graph):
+        raise NotImplementedError
+
+    def cost(self):
+        """roughly how many bytes the command keeps alive"""
+        return COMMAND_COST
+
+    def merge(self, other):
+        """absorb a command pushed right after this one, returns False if it can't"""
+        return False
+
+    def empty(self):
+        """whether the command no longer changes anything, after merges"""
+        return False
+
+
+class Batch(Command):
+    """Commands done together, undone together in reverse order"""
+    def __init__(self, label, commands=None):
+        self.label = label
+        self.commands = commands or []
+
+    def undo(self, graph):
+        for command in reversed(self.commands):
+            command.undo(graph)
+
+    def redo(self, graph):
+        for command in self.commands:
+            command.redo(graph)
+
+    def cost(self):
+        return COMMAND_COST + sum(command.cost() for command in self.commands)
+
+
+class AddNodes(Command):
+    """Nodes of the model were added, with the edges between them"""
+    label = "Add Nodes"
+
+    def __init__(self, nodes, edge_keys=()):
+        self.nodes = list(nodes)#the model nodes themselves, they are put back as they were
+        self.edge_keys = list(edge_keys)
+
+    def undo(self, graph):
+        graph.deleteNodes([graph.model.nodes[node.id] for node in self.nodes if node.id in graph.model.nodes])
+
+    def redo(self, graph):
+        graph.restoreNodes(self.nodes, self.edge_keys)
+
+    def cost(self):
+        return (COMMAND_COST + sum(NODE_COST + codeCost(node) for node in self.nodes)
+                + EDGE_COST * len(self.edge_keys))
+
+
+class RemoveNodes(AddNodes):
+    """Nodes of the model were deleted, with every edge connected to them"""
+    label = "Delete Nodes"
+
+    def undo(self, graph):
+        AddNodes.redo(self, graph)
+
+    def redo(self, graph):
+        AddNodes.undo(self, graph)
+
+
+class Connect(Command):
+    """Edges were added, by their (source id, dest id) keys"""
+    label = "Connect"
+
+    def __init__(self, edge_keys):
+        self.edge_keys = list(edge_keys)
+
+    def undo(self, graph):
+        graph.disconnectKeys(self.edge_keys)
+
+    def redo(self, graph):
+        graph.connectKeys(self.edge_keys)
+
+    def cost(self):
+        return COMMAND_COST + EDGE_COST * len(self.edge_keys)
+
+
+class Disconnect(Connect):
+    """Edges were removed"""
+    label = "Disconnect"
+
+    def undo(self, graph):
+        Connect.redo(self, graph)
+
+    def redo(self, graph):
+        Connect.undo(self, graph)
+
+
+class MoveNodes(Command):
+    """Nodes were moved. Moving the same nodes again soon after is merged into this"""
+    label = "Move"
+
+    def __init__(self, positions):
+        self.positions = positions#node id -> ((old x, old y), (new x, new y))
+
+    def undo(self, graph):
+        graph.placeNodes({id: old for id, (old, new) in self.positions.items()})
+
+    def redo(self, graph):
+        graph.placeNodes({id: new for id, (old, new) in self.positions.items()})
+
+    def cost(self):
+        return COMMAND_COST + MOVE_COST * len(self.positions)
+
+    def merge(self, other):
+        if type(other) is not MoveNodes or other.positions.keys() != self.positions.keys():
+            return False
+        for id, (old, new) in other.positions.items():
+            self.positions[id] = (self.positions[id][0], new)
+        return True
+
+    def empty(self):
+        return all(old == new for old, new in self.positions.values())
+
+
+class EditCode(Command):
+    """The removed text at start of a node's code was replaced with the inserted text.
+    Typing or deleting next to the last edit of the same node is merged into it"""
+    label = "Edit Code"
+
+    def __init__(self, node_id, start, removed, inserted):
+        self.node_id = node_id
+        self.start = start
+        self.removed = removed
+        self.inserted = inserted
+
+    def undo(self, graph):
+        graph.replaceCode(self.node_id, self.start, self.inserted, self.removed)
+
+    def redo(self, graph):
+        graph.replaceCode(self.node_id, self.start, self.removed, self.inserted)
+
+    def cost(self):
+        return COMMAND_COST + len(self.removed) + len(self.inserted)
+
+    def merge(self, other):
+        """compose the two replacements when the later one touches the text the first
+        one inserted"""
+        if type(other) is not EditCode or other.node_id != self.node_id:
+            return False
+        start, end = self.start, self.start + len(self.inserted)
+        other_end = other.start + len(other.removed)
+        if other.start > end or other_end < start:
+            return False
+        removed = self.removed
+        inserted = other.inserted
+        if other.start < start:
+            removed = other.removed[:start - other.start] + removed
+        else:
+            inserted = self.inserted[:other.start - start] + inserted
+        if other_end > end:
+            removed = removed + other.removed[end - other.start:]
+        else:
+            inserted = inserted + self.inserted[other_end - start:]
+        self.start = min(start, other.start)
+        self.removed = removed
+        self.inserted = inserted
+        return True
+
+    def empty(self):
+        return self.removed == self.inserted
+
+
+def textDelta(old, new, start=0, removed=None, added=None):
+    """(start, removed text, inserted text) turning old into new. start, removed and added
+    are where the change is known to be and how many characters it replaced with how many,
+    like QTextDocument.contentsChange reports them. They are checked, and found by
+    comparing the texts when they are wrong or missing"""
+    if removed is None or added is None or len(old) - removed != len(new) - added or \
+            old[:start] != new[:start] or old[start + removed:] != new[start + added:]:
+        start = 0
+        while start < len(old) and start < len(new) and old[start] == new[start]:
+            start += 1
+        removed, added = len(old) - start, len(new) - start
+    #an editor may report more than it changed, trim what stayed the same
+    while removed and added and old[start + removed - 1] == new[start + added - 1]:
+        removed -= 1
+        added -= 1
+    while removed and added and old[start] == new[start]:
+        start += 1
+        removed -= 1
+        added -= 1
+    return start, old[start:start + removed], new[start:start + added]
+
+
+class UndoStack:
+    """The undo and redo history of a graph. Commands are pushed after they were done,
+    and the stack ignores the ones pushed while it is undoing or redoing"""
+    def __init__(self, budget=DEFAULT_BUDGET, coalesce_time=COALESCE_TIME):
+        self.budget = budget
+        self.coalesce_time = coalesce_time
+        self.done = []#commands that can be undone, oldest first
+        self.undone = []#commands that can be redone, the next one last
+        self.total_cost = 0#of the commands in both lists
+        self.costs = {}#id of a command -> its cost when it was added
+        self.applying = False
+        self.last_push = 0.0
+        self.evicted = 0#commands dropped to stay under the budget
+        self.batches = []#Batch commands being collected, see group
+
+    def __len__(self):
+        return len(self.done)
+
+    def canUndo(self):
+        return bool(self.done)
+
+    def canRedo(self):
+        return bool(self.undone)
+
+    def undoLabel(self):
+        return self.done[-1].label if self.done else ""
+
+    def redoLabel(self):
+        return self.undone[-1].label if self.undone else ""
+
+    def account(self, command, sign):
+        if sign > 0:
+            self.costs[id(command)] = command.cost()
+            self.total_cost += self.costs[id(command)]
+        else:
+            self.total_cost -= self.costs.pop(id(command))
+
+    @contextmanager
+    def group(self, label):
+        """collect the commands pushed in the with block into one entry"""
+        self.batches.append(Batch(label))
+        try:
+            yield
+        finally:
+            batch = self.batches.pop()
+            if batch.commands:
+                self.push(batch)
+
+    def push(self, command):
+        if self.applying:
+            return
+        if self.batches:
+            self.batches[-1].commands.append(command)
+            return
+        for undone in self.undone:
+            self.account(undone, -1)
+        self.undone = []
+        now = time.monotonic()
+        top = self.done[-1] if self.done else None
+        if top is not None and now - self.last_push < self.coalesce_time and top.merge(command):
+            self.account(top, -1)
+            if top.empty():
+                self.done.pop()
+            else:
+                self.account(top, 1)
+        else:
+            self.done.append(command)
+            self.account(command, 1)
+        self.last_push = now
+        self.evict()
+
+    def breakMerge(self):
+        """the next command starts a new entry, even if it could be merged"""
+        self.last_push = 0.0
+
+    def evict(self):
+        """drop the oldest commands until the history fits the budget. The newest one is
+        kept whatever it costs, so the last edit can always be undone"""
+        drop = 0
+        while len(self.done) - drop > 1 and self.total_cost > self.budget:
+            self.account(self.done[drop], -1)
+            drop += 1
+        if drop:
+            del self.done[:drop]
+            self.evicted += drop
+
+    def setBudget(self, budget):
+        self.budget = budget
+        self.evict()
+
+    def undo(self, graph):
+        if not self.done:
+            return None
+        command = self.done.pop()
+        self.applying = True
+        try:
+            command.undo(graph)
+        finally:
+            self.applying = False
+        self.undone.append(command)
+        self.breakMerge()
+        return command
+
+    def redo(self, graph):
+        if not self.undone:
+            return None
+        command = self.undone.pop()
+        self.applying = True
+        try:
+            command.redo(graph)
+        finally:
+            self.applying = False
+        self.done.append(command)
+        self.breakMerge()
+        return command
+
+    def clear(self):
+        self.done = []
+        self.undone = []
+        self.costs = {}
+        self.total_cost = 0
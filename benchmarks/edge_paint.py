@@ -0,0 +1,118 @@
+"""
+Benchmark of drawing edges, in milliseconds per frame while panning over a generated graph.
+
+"before" is an Edge item per edge doing the per paint trigonometry Edge.paint did before,
+"items" is an Edge item per edge drawing its cached EdgeGeometry, and "layer" is the
+batched EdgeLayer the canvas uses by default. Only edges are in the scene.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/edge_paint.py [--nodes N] [--frames F]
+"""
+
+import argparse, math, os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication, QGraphicsScene
+from PySide6.QtGui import QImage, QPainter, QPolygonF
+from PySide6.QtCore import Qt, QLineF, QPointF, QRectF
+from Edge import Edge
+from EdgeLayer import EdgeLayer
+from NodeCanvas import Graph
+
+
+FRAME_WIDTH = 1600
+FRAME_HEIGHT = 1000
+
+
+class LegacyEdge(Edge):
+    """draws like Edge.paint did before the geometry was cached"""
+    def paint(self, painter, option, widget):
+        line = QLineF(self.geometry.line)
+        if line.length() == 0.0:
+            return
+        painter.setPen(Qt.PenStyle.SolidLine)
+        painter.setBrush(Qt.GlobalColor.black)
+        painter.drawLine(line)
+        arrowSize = 20
+        angle = math.atan2(-line.dy(), line.dx())
+        p1, p2 = line.p1(), line.p2()
+        sourceArrowP1 = p1 + QPointF(math.sin(angle + math.pi / 3) * arrowSize, math.cos(angle + math.pi / 3) * arrowSize)
+        sourceArrowP2 = p1 + QPointF(math.sin(angle + math.pi - math.pi / 3) * arrowSize, math.cos(angle + math.pi - math.pi / 3) * arrowSize)
+        destArrowP1 = p2 + QPointF(math.sin(angle - math.pi / 3) * arrowSize, math.cos(angle - math.pi / 3) * arrowSize)
+        destArrowP2 = p2 + QPointF(math.sin(angle - math.pi + math.pi / 3) * arrowSize, math.cos(angle - math.pi + math.pi / 3) * arrowSize)
+        painter.setBrush(Qt.GlobalColor.black)
+        painter.drawPolygon(QPolygonF([p1, sourceArrowP1, sourceArrowP2]))
+        painter.drawPolygon(QPolygonF([p2, destArrowP1, destArrowP2]))
+
+
+class EdgeGraph(Graph):
+    """a graph without node items, the edges are drawn in a scene of their own"""
+    def __init__(self, nodes, edges_per_node, seed=1):
+        super().__init__()
+        self.scene = QGraphicsScene()
+        random.seed(seed)
+        columns = int(math.sqrt(nodes))
+        ids = [self.model.createNode(x=(i % columns) * 300.0, y=(i // columns) * 200.0, node_id=i + 1).id
+               for i in range(nodes)]
+        for i, source_id in enumerate(ids):
+            for _ in range(edges_per_node):
+                #mostly short edges to the next columns and rows, like a real graph
+                j = i + random.randint(1, 3) + columns * random.randint(-2, 2)
+                if 0 <= j < nodes and j != i:
+                    self.model.connectIds(source_id, ids[j])
+        for edge in self.model.edges.values():
+            self.indexEdge(edge)
+
+    def build(self, mode):
+        self.scene.clear()
+        if mode == "layer":
+            self.edge_layer = EdgeLayer(self)
+            self.scene.addItem(self.edge_layer)
+            self.edge_layer.reset()
+        else:
+            item_class = LegacyEdge if mode == "before" else Edge
+            for edge in self.model.edges.values():
+                self.scene.addItem(item_class(edge, self))
+
+
+def frames(graph, count):
+    """source rectangles of a pan across the middle of the graph"""
+    rect = graph.scene.itemsBoundingRect()
+    x = rect.center().x() - FRAME_WIDTH
+    y = rect.center().y() - FRAME_HEIGHT / 2
+    step = 2 * FRAME_WIDTH / count
+    return [QRectF(x + i * step, y, FRAME_WIDTH, FRAME_HEIGHT) for i in range(count)]
+
+
+def run(nodes=20000, edges_per_node=2, frame_count=60):
+    app = QApplication.instance() or QApplication(sys.argv)
+    graph = EdgeGraph(nodes, edges_per_node)
+    image = QImage(FRAME_WIDTH, FRAME_HEIGHT, QImage.Format.Format_ARGB32_Premultiplied)
+    target = QRectF(0, 0, FRAME_WIDTH, FRAME_HEIGHT)
+    results = {}
+    for mode in ("before", "items", "layer"):
+        graph.build(mode)
+        sources = frames(graph, frame_count)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        graph.scene.render(painter, target, sources[0])#warm up the scene index and the geometry
+        start = time.perf_counter()
+        for source in sources:
+            image.fill(Qt.GlobalColor.white)
+            graph.scene.render(painter, target, source)
+        painter.end()
+        results[mode] = (time.perf_counter() - start) * 1000 / frame_count
+    return len(graph.model.edges), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--edges-per-node", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=60)
+    args = parser.parse_args()
+    count, results = run(args.nodes, args.edges_per_node, args.frames)
+    print(f"{count} edges")
+    for name, ms in results.items():
+        print(f"{name:>6}: {ms:.2f} ms/frame")
+    print(f"speedup: {results['before'] / results['layer']:.1f}x")
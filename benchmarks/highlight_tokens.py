@@ -0,0 +1,140 @@
+"""
+Micro-benchmark of the highlighter's token -> format step, in tokens per second.
+
+"before" replays the old PygmentsHighlighter.getColor logic (str(ttype) checks and a new
+QTextCharFormat for every colored token), "after" is the compiled style table used now.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/highlight_tokens.py [--lines N]
+"""
+
+import argparse, json, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtGui import QGuiApplication, QTextDocument, QTextCharFormat, QColor
+from LineLexer import LineLexer
+from PygmentsHighlighter import PygmentsHighlighter, THEME_DIR, DEFAULT_THEME
+
+
+SAMPLE = '''import os, sys
+from collections import OrderedDict
+
+class Cache(object):
+    """least recently used cache"""
+    def __init__(self, size=128):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key, default=None):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        return default  # not cached
+
+def build(path):
+    cache = Cache(size=len(sys.argv))
+    for name in os.listdir(path):
+        cache.items[name] = f"{path}/{name}"
+    return cache
+'''
+
+with open(os.path.join(THEME_DIR, DEFAULT_THEME + ".json")) as _file:
+    THEME = json.load(_file)
+STYLE = THEME["styles"]
+KEYWORDS_PURPLE = THEME["keywords"]["keyword_p"]
+KEYWORDS_BLUE = THEME["keywords"]["keyword_b"]
+
+
+def legacyColor(state, ttype, value):
+    """the classification the highlighter did before the compiled table"""
+    if 'Keyword' in str(ttype):
+        if value in KEYWORDS_PURPLE:
+            return STYLE['keyword_p']
+        elif value in KEYWORDS_BLUE:
+            return STYLE['keyword_b']
+    elif str(ttype) == 'Token.Name.Function':
+        state["functions"].add(value)
+        return STYLE['function_name']
+    elif str(ttype) == 'Token.Name.Class':
+        state["classes"].add(value)
+        return STYLE['class_name']
+    elif str(ttype) == "Token.Name.Namespace":
+        return STYLE['class_name']
+    elif str(ttype) == 'Token.Name.Builtin.Pseudo':
+        return STYLE['variable_name']
+    elif str(ttype) == 'Token.Name.Function.Magic':
+        return STYLE['function_name']
+    elif str(ttype) == 'Token.Name.Builtin':
+        return STYLE['class_name']
+    elif str(ttype) == 'Token.Name':
+        if value in state["functions"]:
+            return STYLE['function_name']
+        elif value in state["classes"]:
+            return STYLE['class_name']
+        return STYLE['variable_name']
+    elif 'String' in str(ttype):
+        return STYLE['string']
+    elif 'Comment' in str(ttype):
+        return STYLE['comment']
+    return None
+
+
+def makeFormat(color):
+    _format = QTextCharFormat()
+    _format.setForeground(QColor(color))
+    return _format
+
+
+def tokenize(lines):
+    lexer = LineLexer()
+    state = 0
+    result = []
+    for line in lines:
+        tokens, state = lexer.lex(line, state)
+        result.append(tokens)
+    return result
+
+
+def before(token_lines):
+    state = {"functions": set(), "classes": set()}
+    for tokens in token_lines:
+        for ttype, value in tokens:
+            color = legacyColor(state, ttype, value)
+            if color:
+                makeFormat(color)
+
+
+def after(token_lines, highlighter):
+    for tokens in token_lines:
+        highlighter.tokens = tokens
+        for idx, (ttype, value) in enumerate(tokens):
+            highlighter.getFormat(idx, ttype, value)
+
+
+def run(lines=5000):
+    app = QGuiApplication.instance() or QGuiApplication(sys.argv)
+    source_lines = (SAMPLE * (lines // SAMPLE.count("\n") + 1)).split("\n")[:lines]
+    token_lines = tokenize(source_lines)
+    count = sum(len(tokens) for tokens in token_lines)
+    document = QTextDocument()
+    highlighter = PygmentsHighlighter(document)
+
+    results = {}
+    for name, fn in (("before", lambda: before(token_lines)),
+                     ("after", lambda: after(token_lines, highlighter))):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        results[name] = count / elapsed
+    return count, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=5000)
+    args = parser.parse_args()
+    count, results = run(args.lines)
+    print(f"{count} tokens")
+    for name, rate in results.items():
+        print(f"{name:>6}: {rate:,.0f} tokens/s")
+    print(f"speedup: {results['after'] / results['before']:.1f}x")
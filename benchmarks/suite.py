@@ -0,0 +1,365 @@
+"""
+Benchmark suite of the canvas and the project files, run headless on the offscreen Qt
+platform against a generated project.
+
+Every benchmark is run --repeat times on a fresh canvas and the fastest run is reported.
+Results are written as JSON, and compared with a baseline written earlier with
+--save-baseline. A benchmark that raises, or is more than --threshold slower than its
+baseline, fails the suite (exit status 1). Baselines are only comparable on the same
+machine and settings.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/suite.py [--nodes N] [--only load_dict,zoom]
+        [--output results.json] [--baseline benchmarks/baseline.json] [--save-baseline]
+"""
+
+import argparse, contextlib, json, math, os, platform, random, shutil, statistics, sys, tempfile, time, traceback
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import PySide6
+from PySide6.QtWidgets import QApplication, QPlainTextEdit
+from PySide6.QtCore import QModelIndex
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+from FileManager import FileManager
+from ProjectHierarchyDock import HierarchyModel
+from PygmentsHighlighter import PygmentsHighlighter, PENDING_STATE
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+VIEW_WIDTH = 1600
+VIEW_HEIGHT = 1000
+#how long the asynchronous highlighter may take before the benchmark gives up (seconds)
+HIGHLIGHT_TIMEOUT = 120
+
+NODE_CODE = '''import math
+
+def area{0}(radius):
+    """area of a circle"""
+    return math.pi * radius ** 2
+
+class Shape{0}:
+    def __init__(self, sides):
+        self.sides = sides
+
+result = [area{0}(value) for value in inputs]
+'''
+
+
+class Stopwatch:
+    """adds up the time spent in its with blocks, the setup around them isn't measured"""
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self.start
+
+
+def generateProject(nodes, edges_per_node, seed=1):
+    """a project dictionary of nodes laid out in a grid, mostly connected to their neighbours"""
+    random.seed(seed)
+    model = GraphModel()
+    columns = max(1, int(math.sqrt(nodes)))
+    ids = [model.createNode(code=NODE_CODE.format(i), x=(i % columns) * 400.0, y=(i // columns) * 300.0,
+                            node_id=i + 1).id for i in range(nodes)]
+    for i, source_id in enumerate(ids):
+        for _ in range(edges_per_node):
+            j = i + random.randint(1, 3) + columns * random.randint(-2, 2)
+            if 0 <= j < nodes and j != i:
+                model.connectIds(source_id, ids[j])
+    return model.toDict()
+
+
+class Environment:
+    """what the benchmarks share: the application, the generated project and a scratch directory"""
+    def __init__(self, args):
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self.args = args
+        self.project = generateProject(args.nodes, args.edges_per_node)
+        self.directory = tempfile.mkdtemp(prefix="nodebook-bench-")
+        self.canvases = []
+
+    def canvas(self, load=True):
+        """a new canvas shown at a fixed size, with the generated project loaded"""
+        canvas = NodeCanvas()
+        canvas.resize(VIEW_WIDTH, VIEW_HEIGHT)
+        canvas.show()
+        file_man = FileManager(canvas=canvas)
+        if load:
+            file_man.loadProjectFromDict(self.project)
+        self.app.processEvents()
+        self.canvases.append(canvas)
+        return canvas, file_man
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def cleanUp(self):
+        """close the canvases of a run"""
+        for canvas in self.canvases:
+            canvas.runner.shutdown()
+            canvas.analyzer.shutdown()
+            canvas.close()
+            canvas.deleteLater()
+        self.canvases = []
+        self.app.processEvents()
+
+    def close(self):
+        self.cleanUp()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+#every benchmark measures part of its work with the stopwatch and returns how many
+#units (nodes, lines, frames) it processed
+
+def benchLoadDict(env, watch):
+    canvas, file_man = env.canvas(load=False)
+    with watch:
+        file_man.loadProjectFromDict(env.project)
+        env.app.processEvents()
+    return len(env.project["nodes"])
+
+
+def benchSave(extension):
+    def bench(env, watch):
+        canvas, file_man = env.canvas()
+        path = env.path(f"project-{time.perf_counter_ns()}{extension}")
+        with watch:
+            file_man.saveProject(path)
+        file_man.flush()
+        return len(env.project["nodes"])
+    return bench
+
+
+def benchHighlight(env, watch):
+    """time until a large document is completely highlighted, background lexing included"""
+    lines = env.args.highlight_lines
+    source = "".join(NODE_CODE.format(i) for i in range(lines // NODE_CODE.count("\n") + 1))
+    source = "\n".join(source.split("\n")[:lines])
+    #an editor like the nodes' one, a document without a layout is only highlighted in part
+    editor = QPlainTextEdit()
+    editor.document().setUndoRedoEnabled(False)
+    editor.resize(VIEW_WIDTH // 2, VIEW_HEIGHT)
+    editor.show()
+    document = editor.document()
+    highlighter = PygmentsHighlighter(document, editor=editor)
+    deadline = time.perf_counter() + HIGHLIGHT_TIMEOUT
+    with watch:
+        editor.setPlainText(source)
+        #blocks are only ever highlighted once here, so the search for a pending one goes on
+        #from the last one found
+        block = document.firstBlock()
+        while True:
+            env.app.processEvents()
+            while block.isValid() and block.userState() != PENDING_STATE:
+                block = block.next()
+            if not block.isValid():
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError("the document was not highlighted in time")
+    editor.close()
+    del highlighter
+    return lines
+
+
+def benchCreateNodes(env, watch):
+    canvas, file_man = env.canvas(load=False)
+    with watch:
+        for node_dict in env.project["nodes"]:
+            item = canvas.createNode(node_dict)
+            canvas.scene.addItem(item)
+            canvas.addNode(item)
+        env.app.processEvents()
+    return len(env.project["nodes"])
+
+
+def benchDrag(env, watch):
+    """move a selection of nodes in small steps, repainting after every frame the way a
+    mouse drag does"""
+    canvas, file_man = env.canvas()
+    items = list(canvas.nodes.values())[:env.args.selection]
+    for item in items:
+        item.setSelected(True)
+    frames = env.args.frames
+    with watch:
+        canvas.beginMove()
+        for frame in range(frames):
+            #Qt moves each selected item on every mouse move, a few per frame
+            for step in range(3):
+                for item in items:
+                    item.moveBy(2.0, 1.0)
+            canvas.flushMoves()
+            canvas.viewport().repaint()
+        canvas.endMove()
+    return frames
+
+
+def benchZoom(env, watch):
+    """zoom out and back in, repainting the whole view at every step"""
+    canvas, file_man = env.canvas()
+    steps = env.args.frames // 2
+    with watch:
+        for factor in [1 / 1.25] * steps + [1.25] * steps:
+            canvas.scale(factor, factor)
+            canvas.updateDetailLevel()
+            canvas.updateVisibleItems()
+            canvas.viewport().repaint()
+    return 2 * steps
+
+
+def benchDelete(env, watch):
+    canvas, file_man = env.canvas()
+    with watch:
+        canvas.deleteNodes(list(canvas.model.nodes.values()))
+        env.app.processEvents()
+    return len(env.project["nodes"])
+
+
+def benchCopyPaste(env, watch):
+    """copy every node of the project and paste the copies next to them, in one batch"""
+    canvas, file_man = env.canvas()
+    nodes = list(canvas.model.nodes.values())
+    with watch:
+        payload = canvas.copyNodes(nodes)
+        canvas.pasteNodes(payload)
+        env.app.processEvents()
+    return len(nodes)
+
+
+def benchHierarchy(env, watch):
+    """fetch every row of the project tree, then apply the removal of a tenth of the
+    nodes to it"""
+    canvas, file_man = env.canvas()
+    tree = HierarchyModel(canvas)
+    root = QModelIndex()
+    nodes = list(canvas.model.nodes.values())
+    with watch:
+        while tree.canFetchMore(root):
+            tree.fetchMore(root)
+        canvas.deleteNodes(nodes[::10])
+        tree.applyChanges()
+    return len(nodes)
+
+
+BENCHMARKS = {
+    "load_dict": benchLoadDict,
+    "save_json": benchSave(".json"),
+    "save_archive": benchSave(".nbk"),
+    "highlight": benchHighlight,
+    "create_nodes": benchCreateNodes,
+    "drag_selection": benchDrag,
+    "zoom_repaint": benchZoom,
+    "delete_nodes": benchDelete,
+    "copy_paste": benchCopyPaste,
+    "hierarchy_tree": benchHierarchy,
+}
+
+
+def runBenchmarks(env, names, repeat):
+    """returns the results of the benchmarks that ran, and name -> error of the ones that raised"""
+    results = {}
+    failures = {}
+    for name in names:
+        runs = []
+        units = 0
+        try:
+            for _ in range(repeat):
+                watch = Stopwatch()
+                #the code under test prints a lot, that is measured but not shown
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    try:
+                        units = BENCHMARKS[name](env, watch)
+                    finally:
+                        env.cleanUp()
+                runs.append(watch.seconds)
+        except Exception as error:
+            #where it was raised, the rest of the traceback is the suite's own code
+            frame = traceback.extract_tb(error.__traceback__)[-1]
+            failures[name] = f"{type(error).__name__}: {error} ({frame.filename}:{frame.lineno})"
+            print(f"{name:>15}: FAILED, {failures[name]}")
+            continue
+        best = min(runs)
+        results[name] = {"seconds": best, "median": statistics.median(runs), "runs": runs,
+                         "units": units, "us_per_unit": best * 1e6 / units if units else None}
+        print(f"{name:>15}: {best * 1000:10.2f} ms  ({results[name]['us_per_unit']:.1f} us/unit)")
+    return results, failures
+
+
+def compare(results, config, baseline, threshold):
+    """names of the benchmarks more than threshold slower than the baseline"""
+    if baseline.get("config") != config:
+        print("the baseline was recorded with other settings, it is not compared:", baseline.get("config"))
+        return []
+    regressions = []
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        result["baseline_seconds"] = before["seconds"]
+        result["change"] = change
+        status = "REGRESSION" if change > threshold else "ok"
+        print(f"{name:>15}: {change * 100:+7.1f}% against the baseline  {status}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--edges-per-node", type=int, default=2)
+    parser.add_argument("--selection", type=int, default=300, help="nodes dragged by drag_selection")
+    parser.add_argument("--frames", type=int, default=40, help="frames of drag_selection and zoom_repaint")
+    parser.add_argument("--highlight-lines", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="comma separated benchmarks to run: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    config = {"nodes": args.nodes, "edges_per_node": args.edges_per_node, "selection": args.selection,
+              "frames": args.frames, "highlight_lines": args.highlight_lines}
+
+    env = Environment(args)
+    try:
+        results, failures = runBenchmarks(env, names, args.repeat)
+    finally:
+        env.close()
+
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, config, json.load(file), args.threshold)
+    report = {"config": config, "results": results,
+              "environment": {"python": platform.python_version(), "pyside": PySide6.__version__,
+                              "platform": platform.platform(), "qpa": os.environ.get("QT_QPA_PLATFORM")},
+              "regressions": regressions, "failures": failures}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    if args.save_baseline and failures:
+        print("the baseline is not saved, benchmarks failed")
+    elif args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=4)
+        print("baseline saved to", args.baseline)
+    if failures:
+        print("failed:", ", ".join(failures))
+    if regressions:
+        print("regressions:", ", ".join(regressions))
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
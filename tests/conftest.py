@@ -0,0 +1,25 @@
+"""
+The tests run headless on the offscreen Qt platform, from the repository's root:
+
+    python -m pytest -q tests
+"""
+
+import gc, os, sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PySide6.QtWidgets import QApplication
+
+
+@pytest.fixture(scope="session")
+def app():
+    return QApplication.instance() or QApplication(sys.argv)
+
+
+@pytest.fixture(autouse=True)
+def collectWidgets():
+    """the widgets of a test are collected on the GUI thread, not by whichever thread
+    the garbage collector happens to run on next, like the highlighter's worker"""
+    yield
+    gc.collect()
@@ -0,0 +1,34 @@
+import time
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+from FileManager import FileManager
+
+
+def waitFor(app, condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    return condition()
+
+
+def test_loaded_pasted_and_deleted_nodes_are_analyzed(app):
+    model = GraphModel()
+    model.createNode(code="def loaded():\n    pass\n")
+    canvas = NodeCanvas()
+    FileManager(canvas=canvas).loadProjectFromDict(model.toDict())
+    loaded = next(iter(canvas.model.nodes.values()))
+    assert waitFor(app, lambda: [symbol.name for symbol in loaded.nodes_within] == ["loaded"])
+
+    payload = canvas.copyNodes([loaded])
+    pasted = canvas.pasteNodes(payload)[0]
+    pasted.nodes_within = []
+    assert waitFor(app, lambda: [symbol.name for symbol in pasted.nodes_within] == ["loaded"])
+
+    canvas.deleteNodes([pasted])
+    analyzer = canvas.analyzer
+    assert pasted.id not in analyzer.versions
+    assert pasted.id not in analyzer.caches
+    assert pasted.id not in analyzer.sent
+    canvas.runner.shutdown()
+    analyzer.shutdown()
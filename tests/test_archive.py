@@ -0,0 +1,115 @@
+import os
+import pytest
+import ProjectArchive
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+from FileManager import FileManager
+from ProjectArchive import loadArchive, saveArchive
+from ProjectJournal import ProjectJournal
+
+
+def sampleModel():
+    model = GraphModel()
+    source = model.createNode(text="source", code="result = [1, 2]", x=10.0, y=20.0)
+    dest = model.createNode(text="dest", code="result = sum(inputs[0])", x=400.0, y=20.0)
+    model.connect(source.output_pin, dest.input_pin)
+    return model
+
+
+def containerModel():
+    """sampleModel with unicode text and a container holding a sub-graph"""
+    model = sampleModel()
+    container = model.createNode(class_name="DiffNode", text="größe", code="# ünïcode\nresult = 'ok'", x=-5.5, y=7.25)
+    subgraph = GraphModel()
+    inner = subgraph.createNode(text="inner", code="result = 1", node_id=container.id + 100)
+    subgraph.connect(inner.output_pin, subgraph.createNode(text="inner dest", node_id=container.id + 101).input_pin)
+    model.setSubgraph(container, subgraph)
+    return model
+
+
+def test_archive_round_trip(tmp_path):
+    model = containerModel()
+    path = str(tmp_path / "project.nbk")
+    saveArchive(model, path)
+    loaded = loadArchive(path)
+    assert loaded.toDict() == model.toDict()
+    #and back through the JSON format
+    json_path = str(tmp_path / "project.json")
+    ProjectArchive.archiveToJson(path, json_path)
+    converted_path = str(tmp_path / "converted.nbk")
+    ProjectArchive.jsonToArchive(json_path, converted_path)
+    assert loadArchive(converted_path).toDict() == model.toDict()
+
+
+def test_archive_code_is_read_when_it_is_needed(tmp_path):
+    model = sampleModel()
+    path = str(tmp_path / "project.nbk")
+    saveArchive(model, path)
+    loaded = loadArchive(path)
+    node = next(node for node in loaded.nodes.values() if node.text == "source")
+    assert node.code_ref is not None and node._code is None
+    #saving copies the code that was never read without decoding it
+    copy_path = str(tmp_path / "copy.nbk")
+    saveArchive(loaded, copy_path)
+    assert node._code is None
+    assert node.code == "result = [1, 2]"
+    assert node.code_ref is not None#read, but still the same as in the archive
+    node.code = "result = [3]"
+    assert node.code_ref is None
+    assert {node.text: node.code for node in loadArchive(copy_path).nodes.values()} == {
+        "source": "result = [1, 2]", "dest": "result = sum(inputs[0])"}
+
+
+def test_damaged_archives_are_refused(tmp_path):
+    path = str(tmp_path / "project.nbk")
+    saveArchive(sampleModel(), path)
+    with open(path, "rb") as file:
+        data = file.read()
+    for name, damaged in (("magic.nbk", b"JUNK" + data[4:]), ("truncated.nbk", data[:ProjectArchive.HEADER.size + 10])):
+        damaged_path = str(tmp_path / name)
+        with open(damaged_path, "wb") as file:
+            file.write(damaged)
+        with pytest.raises(ValueError):
+            loadArchive(damaged_path)
+
+
+def test_compacting_an_archive_the_open_project_maps(app, tmp_path, monkeypatch):
+    #like windows, a file can't be replaced while an open archive maps it
+    opened = []
+    open_archive = ProjectArchive.ProjectArchive.__init__
+
+    def trackArchive(archive, file_path):
+        open_archive(archive, file_path)
+        opened.append(archive)
+
+    replace = os.replace
+
+    def windowsReplace(source, destination):
+        for archive in opened:
+            if not archive.file.closed and os.path.abspath(archive.file_path) == os.path.abspath(destination):
+                raise PermissionError(f"{destination} is mapped")
+        replace(source, destination)
+
+    monkeypatch.setattr(ProjectArchive.ProjectArchive, "__init__", trackArchive)
+    monkeypatch.setattr(os, "replace", windowsReplace)
+    path = str(tmp_path / "project.nbk")
+    saveArchive(sampleModel(), path)
+    canvas = NodeCanvas()
+    file_man = FileManager(canvas=canvas)
+    model = loadArchive(path)
+    canvas.setModel(model)
+    file_man.setProjectPath(path)
+    source = next(node for node in model.nodes.values() if node.text == "source")
+    source.setPos(50.0, 60.0)
+    model.touch(source)
+    file_man.saveProject(path)
+    file_man.checkPendingSave(wait=True)
+    assert not ProjectJournal(path).exists()
+    saved = {node.text: node for node in loadArchive(path).nodes.values()}
+    assert (saved["source"].x, saved["source"].y) == (50.0, 60.0)
+    assert saved["dest"].code == "result = sum(inputs[0])"
+    #the open project kept its code
+    assert {node.text: node.code for node in model.nodes.values()} == {
+        "source": "result = [1, 2]", "dest": "result = sum(inputs[0])"}
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
@@ -0,0 +1,82 @@
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+from FileManager import FileManager
+
+
+def twoNodeProject():
+    model = GraphModel()
+    source = model.createNode(code="a = 1", x=300.0, y=200.0)
+    dest = model.createNode(code="b = 2", x=800.0, y=450.0)
+    model.connect(source.output_pin, dest.input_pin)
+    return model.toDict()
+
+
+def test_load_project_with_edge_off_origin(app):
+    for batched in (True, False):
+        canvas = NodeCanvas()
+        canvas.setBatchedEdges(batched)
+        FileManager(canvas=canvas).loadProjectFromDict(twoNodeProject())
+        app.processEvents()
+        assert len(canvas.nodes) == 2
+        assert len(canvas.model.edges) == 1
+        canvas.runner.shutdown()
+        canvas.analyzer.shutdown()
+
+
+def test_zoomed_out_virtualized_canvas_has_no_node_items(app):
+    model = GraphModel()
+    for i in range(300):
+        model.createNode(code=f"n = {i}", x=(i % 20) * 400.0, y=(i // 20) * 300.0)
+    canvas = NodeCanvas()
+    canvas.resize(1600, 1000)
+    canvas.show()
+    canvas.setModel(model)
+    canvas.setVirtualized(True)
+    canvas.scale(0.05, 0.05)
+    canvas.updateDetailLevel()
+    canvas.updateVisibleItems()
+    canvas.viewport().repaint()
+    assert canvas.nodes == {}
+    assert canvas.node_layer.isVisible()
+    canvas.resetTransform()
+    canvas.updateDetailLevel()
+    canvas.updateVisibleItems()
+    assert canvas.nodes
+    assert not canvas.node_layer.isVisible()
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
+
+
+def test_virtualized_canvas_only_has_items_near_the_view(app):
+    model = GraphModel()
+    for i in range(400):
+        model.createNode(code=f"n = {i}", x=(i % 20) * 400.0, y=(i // 20) * 300.0)
+    canvas = NodeCanvas()
+    canvas.resize(1200, 800)
+    canvas.show()
+    canvas.setModel(model)
+    canvas.setVirtualized(True)
+    #the view picks up the scene rect when it handles its events
+    app.processEvents()
+    canvas.updateVisibleItems()
+
+    def nearView():
+        x1, y1, x2, y2 = canvas.visibleSceneRect()
+        return canvas.node_index.query(x1, y1, x2, y2)
+
+    assert 0 < len(canvas.nodes) < len(model.nodes)
+    assert set(canvas.nodes) == nearView()
+    first = set(canvas.nodes)
+    canvas.centerOn(7000.0, 5000.0)
+    canvas.updateVisibleItems()
+    assert set(canvas.nodes) == nearView()
+    assert not first & set(canvas.nodes)
+    #edits made to a node while it had no item are kept
+    node = model.nodes[next(iter(first))]
+    assert canvas.getNodeById(node.id) is None
+    canvas.moveNodes([node], 7000.0 - node.x, 5000.0 - node.y)
+    assert (node.x, node.y) == (7000.0, 5000.0)
+    canvas.updateVisibleItems()
+    assert canvas.getNodeById(node.id) is not None
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
@@ -0,0 +1,67 @@
+import os
+import pytest
+from CodeCache import CodeCache, MAGIC
+from Executor import Executor, Plan, THREADS
+from GraphModel import GraphModel
+
+
+def test_code_is_compiled_once_per_source():
+    cache = CodeCache()
+    first = cache.get(1, "result = 1")
+    assert cache.get(1, "result = 1") is first
+    assert cache.compiled == 1
+    namespace = {}
+    exec(first.code, namespace)
+    assert namespace["result"] == 1
+    cache.get(1, "result = 2")
+    assert cache.compiled == 2
+
+
+def test_compiled_code_persists_next_to_the_project(tmp_path):
+    directory = str(tmp_path / "__nbcache__")
+    cache = CodeCache(directory)
+    entry = cache.get(1, "result = 1")
+    with open(cache.path(entry.key), "rb") as file:
+        assert file.read(len(MAGIC)) == MAGIC
+    #a fresh cache, as after reopening the project, loads instead of compiling
+    reopened = CodeCache(directory)
+    assert reopened.get(1, "result = 1").key == entry.key
+    assert reopened.compiled == 0
+    #a file that doesn't unmarshal is compiled again
+    with open(cache.path(entry.key), "wb") as file:
+        file.write(MAGIC + b"junk")
+    damaged = CodeCache(directory)
+    damaged.get(1, "result = 1")
+    assert damaged.compiled == 1
+
+
+def test_editing_a_node_drops_its_old_file_once_it_compiles_again(tmp_path):
+    cache = CodeCache(str(tmp_path))
+    old = cache.get(1, "result = 1")
+    cache.invalidate(1)
+    assert os.path.exists(cache.path(old.key))#the edit may still be reverted
+    new = cache.get(1, "result = 2")
+    assert not os.path.exists(cache.path(old.key))
+    assert os.path.exists(cache.path(new.key))
+
+
+def test_syntax_errors_are_raised_and_not_cached():
+    cache = CodeCache()
+    with pytest.raises(SyntaxError):
+        cache.get(1, "result = (")
+    assert 1 not in cache.entries
+
+
+def test_repeated_runs_compile_nothing():
+    model = GraphModel()
+    source = model.createNode(code="result = 2")
+    model.connect(source.output_pin, model.createNode(code="result = inputs[0] * 3").input_pin)
+    code_cache = CodeCache()
+    executor = Executor(workers=2, mode=THREADS, code_cache=code_cache)
+    try:
+        for run in range(3):
+            results = executor.run(Plan(model))
+            assert sorted(result.value for result in results.values()) == [2, 6]
+    finally:
+        executor.shutdown()
+    assert code_cache.compiled == 2
@@ -0,0 +1,23 @@
+import json
+from PySide6 import QtWidgets
+from NodeCanvas import NodeCanvas
+from FileManager import ProjectLoader
+
+
+def test_malformed_node_record_fails_the_load(app, tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(QtWidgets.QMessageBox, "warning", lambda parent, title, text: warnings.append(text))
+    path = tmp_path / "broken.json"
+    path.write_text(json.dumps({"nodes": [{"id": 1, "text": "no code", "x": 0, "y": 0}], "edges": []}))
+    canvas = NodeCanvas()
+    results = []
+    loader = ProjectLoader(canvas, str(path), parent=canvas)
+    loader.finished.connect(results.append)
+    loader.start()
+    while not results:
+        app.processEvents()
+    assert results == [False]
+    assert len(warnings) == 1 and "broken.json" in warnings[0]
+    assert canvas.model.nodes == {}
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
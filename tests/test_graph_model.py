@@ -0,0 +1,72 @@
+import os, subprocess, sys
+import pytest
+from GraphModel import GraphModel
+
+
+def chain(count):
+    model = GraphModel()
+    nodes = [model.createNode(code=f"n = {i}") for i in range(count)]
+    for source, dest in zip(nodes, nodes[1:]):
+        model.connect(source.output_pin, dest.input_pin)
+    return model, nodes
+
+
+def test_the_graph_core_does_not_import_qt():
+    #run in a fresh interpreter, the tests have Qt loaded already
+    code = "import sys, GraphModel, Executor, ProjectArchive, ProjectJournal, UndoStack; print(any(name.startswith('PySide6') for name in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    assert output.strip() == "False"
+
+
+def test_edges_go_from_output_to_input():
+    model, (first, second) = chain(2)
+    edge, = model.edges.values()
+    assert (edge.sourceNode(), edge.destNode()) == (first, second)
+    #connecting from the input pin makes the same edge, so it isn't added twice
+    assert model.connect(second.input_pin, first.output_pin) is None
+    with pytest.raises(ValueError):
+        model.connect(first.input_pin, second.input_pin)
+
+
+def test_removing_a_node_removes_its_edges():
+    model, (first, middle, last) = chain(3)
+    removed = model.removeNode(middle)
+    assert len(removed) == 2
+    assert model.edges == {}
+    assert first.output_pin.edges == {} and last.input_pin.edges == {}
+
+
+def test_ids_are_not_reused():
+    model, nodes = chain(3)
+    model.removeNode(nodes[-1])
+    assert model.newId() not in [node.id for node in nodes]
+    model.createNode(node_id=100)
+    assert model.newId() > 100
+
+
+def test_traversal_and_cycles():
+    model, (first, second, third) = chain(3)
+    assert [node.id for node in model.walk(first)] == [first.id, second.id, third.id]
+    assert [node.id for node in model.walk(third, downstream=False)] == [third.id, second.id, first.id]
+    order, blocked = model.topologicalOrder()
+    assert order == [first, second, third] and blocked == []
+    model.connect(third.output_pin, second.input_pin)
+    order, blocked = model.topologicalOrder()
+    assert order == [first] and set(blocked) == {second, third}
+
+
+def test_dict_round_trip_and_replayed_changes():
+    model, nodes = chain(3)
+    copy = GraphModel.fromDict(model.toDict())
+    assert copy.toDict() == model.toDict()
+    model.markClean()
+    nodes[0].setCode("n = 10")
+    model.touch(nodes[0])
+    model.removeNode(nodes[2])
+    added = model.createNode(code="new")
+    model.connect(nodes[0].output_pin, added.input_pin)
+    changes = model.takeChanges()
+    assert not model.isDirty()
+    copy.applyChanges(changes)
+    assert copy.toDict() == model.toDict()
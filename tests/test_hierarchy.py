@@ -0,0 +1,81 @@
+import ProjectHierarchyDock
+from PySide6.QtCore import QModelIndex
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+from ProjectHierarchyDock import HierarchyModel
+
+
+def projectCanvas(count):
+    model = GraphModel()
+    for i in range(count):
+        model.createNode(text=f"node {i}", code=f"n = {i}", x=i * 400.0)
+    canvas = NodeCanvas()
+    canvas.setModel(model)
+    return canvas
+
+
+def titles(tree, parent=QModelIndex()):
+    return [tree.data(tree.index(row, 0, parent)) for row in range(tree.rowCount(parent))]
+
+
+def closeCanvas(canvas):
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
+
+
+def test_rows_are_made_a_batch_at_a_time(app, monkeypatch):
+    monkeypatch.setattr(ProjectHierarchyDock, "FETCH_BATCH", 4)
+    canvas = projectCanvas(10)
+    tree = HierarchyModel(canvas)
+    root = QModelIndex()
+    assert tree.rowCount(root) == 0 and tree.hasChildren(root)
+    fetched = []
+    while tree.canFetchMore(root):
+        tree.fetchMore(root)
+        fetched.append(tree.rowCount(root))
+    assert fetched == [4, 8, 10]
+    assert titles(tree) == [f"node {i}" for i in range(10)]
+    closeCanvas(canvas)
+
+
+def test_added_and_removed_nodes_become_row_changes(app):
+    canvas = projectCanvas(5)
+    tree = HierarchyModel(canvas)
+    tree.fetchMore(QModelIndex())
+    resets = []
+    tree.modelReset.connect(lambda: resets.append(True))
+    nodes = list(canvas.model.nodes.values())
+    canvas.deleteNodes([nodes[1], nodes[3]])
+    added = canvas.duplicateNodes([nodes[0]])
+    added[0].text = "copy"
+    tree.applyChanges()
+    assert titles(tree) == ["node 0", "node 2", "node 4", "copy"]
+    assert [tree.index(row, 0).internalPointer().row for row in range(4)] == [0, 1, 2, 3]
+    #undo puts the deleted nodes back
+    canvas.undo()
+    canvas.undo()
+    tree.applyChanges()
+    assert sorted(titles(tree)) == [f"node {i}" for i in range(5)]
+    assert resets == []
+    closeCanvas(canvas)
+
+
+def test_symbols_of_a_node_show_under_it(app):
+    canvas = projectCanvas(1)
+    tree = HierarchyModel(canvas)
+    tree.fetchMore(QModelIndex())
+    node_index = tree.index(0, 0)
+    node = node_index.internalPointer().node
+    node.code = "def f():\n    pass\n\nclass C:\n    def method(self):\n        pass\n"
+    canvas.analyzer.schedule(node.id)
+    canvas.analyzer.flush()
+    canvas.analyzer.worker.submit(lambda: None).result()
+    app.processEvents()#the analysis result is handed to the GUI thread
+    tree.applyChanges()
+    tree.fetchMore(node_index)
+    assert titles(tree, node_index) == ["def f", "class C"]
+    class_index = tree.index(1, 0, node_index)
+    tree.fetchMore(class_index)
+    assert titles(tree, class_index) == ["def method"]
+    assert tree.locate(tree.index(0, 0, class_index)) == (node, [])
+    closeCanvas(canvas)
@@ -0,0 +1,39 @@
+import time
+from PySide6.QtWidgets import QPlainTextEdit
+from PygmentsHighlighter import PygmentsHighlighter, PENDING_STATE, ASYNC_BLOCK_COUNT
+
+
+def pendingBlocks(document):
+    count = 0
+    block = document.firstBlock()
+    while block.isValid():
+        count += block.userState() == PENDING_STATE
+        block = block.next()
+    return count
+
+
+def waitUntilHighlighted(app, document, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while pendingBlocks(document) and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    return pendingBlocks(document)
+
+
+def test_large_document_is_fully_highlighted(app):
+    code = "".join(f"def function_{i}(x):\n    return x + {i}\n\n" for i in range(ASYNC_BLOCK_COUNT * 2))
+    editor = QPlainTextEdit()
+    editor.document().setUndoRedoEnabled(False)
+    editor.resize(600, 800)
+    editor.show()
+    highlighter = PygmentsHighlighter(editor.document(), editor=editor)
+    editor.setPlainText(code)
+    assert pendingBlocks(editor.document()) > 0
+    assert waitUntilHighlighted(app, editor.document()) == 0
+    #an edit after the background results were applied is highlighted as well
+    cursor = editor.textCursor()
+    cursor.setPosition(0)
+    cursor.insertText('"""\n')
+    assert waitUntilHighlighted(app, editor.document()) == 0
+    editor.close()
+    del highlighter
@@ -0,0 +1,127 @@
+import ProjectJournal
+from PySide6 import QtWidgets
+from GraphModel import GraphModel, loadProjectFile, saveProjectFile
+from NodeCanvas import NodeCanvas
+from FileManager import FileManager
+from ProjectArchive import ARCHIVE_EXTENSION, loadArchive, saveArchive
+
+
+def openProject(tmp_path, name="project.json"):
+    """a canvas with a saved project of two nodes open, and its file manager"""
+    model = GraphModel()
+    model.createNode(text="first", code="a = 1")
+    model.createNode(text="second", code="b = 2")
+    path = str(tmp_path / name)
+    if path.endswith(ARCHIVE_EXTENSION):
+        saveArchive(model, path)
+        model = loadArchive(path)#the code stays in the file
+    else:
+        saveProjectFile(model, path)
+        model.markClean()
+    canvas = NodeCanvas()
+    file_man = FileManager(canvas=canvas)
+    canvas.setModel(model)
+    file_man.setProjectPath(path)
+    return canvas, file_man, path
+
+
+def closeProject(canvas, file_man):
+    file_man.autosave_timer.stop()
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
+
+
+def editNode(canvas, text, code):
+    node = next(node for node in canvas.model.nodes.values() if node.text == text)
+    node.setCode(code)
+    canvas.model.touch(node)
+    return node
+
+
+def failing(*args):
+    raise OSError("disk full")
+
+
+def test_failed_append_restores_the_changes(app, tmp_path, monkeypatch):
+    canvas, file_man, path = openProject(tmp_path)
+    editNode(canvas, "first", "a = 10")
+    monkeypatch.setattr(ProjectJournal.ProjectJournal, "append", failing)
+    file_man.autosave()
+    file_man.checkPendingSave(wait=True)
+    assert canvas.model.isDirty()
+    closeProject(canvas, file_man)
+
+
+def test_failed_compaction_keeps_the_changes_in_the_journal(app, tmp_path, monkeypatch):
+    canvas, file_man, path = openProject(tmp_path)
+    editNode(canvas, "first", "a = 10")
+    monkeypatch.setattr(ProjectJournal.ProjectJournal, "compact", failing)
+    file_man.autosave(compact=True)
+    file_man.checkPendingSave(wait=True)
+    assert not canvas.model.isDirty()
+    journal = ProjectJournal.ProjectJournal(path)
+    assert len(list(journal.batches())) == 1
+    #the next save only appends what changed since
+    editNode(canvas, "second", "b = 20")
+    file_man.autosave()
+    file_man.checkPendingSave(wait=True)
+    batches = list(journal.batches())
+    assert [[node["text"] for node in batch["nodes"]] for batch in batches] == [["first"], ["second"]]
+    closeProject(canvas, file_man)
+
+
+def test_saving_to_the_open_file_reports_failures(app, tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(QtWidgets.QMessageBox, "warning", lambda parent, title, text: warnings.append(text))
+    canvas, file_man, path = openProject(tmp_path)
+    editNode(canvas, "first", "a = 10")
+    with monkeypatch.context() as patch:
+        patch.setattr(ProjectJournal.ProjectJournal, "compact", failing)
+        file_man.saveProject(path)
+    assert len(warnings) == 1 and "disk full" in warnings[0]
+    file_man.saveProject(path)
+    assert len(warnings) == 1
+    assert not ProjectJournal.ProjectJournal(path).exists()
+    closeProject(canvas, file_man)
+
+
+def reopen(path):
+    model = loadArchive(path) if path.endswith(ARCHIVE_EXTENSION) else loadProjectFile(path)
+    ProjectJournal.ProjectJournal(path).replay(model)
+    return model
+
+
+def test_autosaved_changes_replay_on_the_saved_project(app, tmp_path):
+    for name in ("project.json", "project" + ARCHIVE_EXTENSION):
+        canvas, file_man, path = openProject(tmp_path, name)
+        model = canvas.model
+        first = editNode(canvas, "first", "a = 10")
+        second = next(node for node in model.nodes.values() if node.text == "second")
+        model.connect(first.output_pin, second.input_pin)
+        file_man.autosave()
+        file_man.checkPendingSave(wait=True)
+        model.removeNode(second)
+        third = model.createNode(text="third", code="c = 3")
+        file_man.flush()
+        assert len(list(ProjectJournal.ProjectJournal(path).batches())) == 2
+        replayed = reopen(path)
+        assert {node.text: node.code for node in replayed.nodes.values()} == {"first": "a = 10", "third": "c = 3"}
+        assert replayed.edges == {}
+        assert third.id in replayed.nodes
+        closeProject(canvas, file_man)
+
+
+def test_compaction_folds_the_journal_into_the_project(app, tmp_path):
+    for name in ("project.json", "project" + ARCHIVE_EXTENSION):
+        canvas, file_man, path = openProject(tmp_path, name)
+        editNode(canvas, "first", "a = 10")
+        file_man.autosave()
+        file_man.checkPendingSave(wait=True)
+        journal = ProjectJournal.ProjectJournal(path)
+        assert journal.exists()
+        file_man.saveProject(path)
+        assert file_man.save_error is None
+        assert not journal.exists()
+        model = reopen(path)
+        assert {node.text: node.code for node in model.nodes.values()} == {"first": "a = 10", "second": "b = 2"}
+        closeProject(canvas, file_man)
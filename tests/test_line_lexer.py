@@ -0,0 +1,85 @@
+from pygments.lexers import PythonLexer
+from pygments.token import String
+from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QPlainTextEdit
+from LineLexer import LineLexer, ROOT_STATE
+from PygmentsHighlighter import PygmentsHighlighter
+
+SOURCE = '''def f(x):
+    doc = """a string
+    over three lines"""
+    text = ("open bracket",
+            'carried on')
+    return x
+'''
+
+
+def lexLines(lexer, lines):
+    """the tokens of every line, each line starting in the state the previous one ended in"""
+    state = ROOT_STATE
+    tokens = []
+    for line in lines:
+        line_tokens, state = lexer.lex(line, state)
+        tokens.append(line_tokens)
+    return tokens, state
+
+
+def characterTypes(tokens):
+    """the token type of every character but whitespace, which pygments types differently
+    at the start of a line it lexes whole"""
+    return [ttype for ttype, value in tokens for char in value if not char.isspace()]
+
+
+def test_lines_lexed_one_at_a_time_match_the_whole_document():
+    lexer = LineLexer()
+    tokens, state = lexLines(lexer, SOURCE.split("\n"))
+    by_line = characterTypes(token for line in tokens for token in line)
+    whole = characterTypes(PythonLexer().get_tokens(SOURCE))
+    assert by_line == whole
+    assert state == ROOT_STATE
+
+
+def test_an_open_string_carries_on_to_the_next_line():
+    lexer = LineLexer()
+    first, state = lexer.lex('    """a docstring', ROOT_STATE)
+    assert state != ROOT_STATE
+    middle, middle_state = lexer.lex("    still in the string", state)
+    assert all(ttype in String for ttype, value in middle)
+    assert middle_state == state
+    last, end_state = lexer.lex('    the end"""', middle_state)
+    assert end_state == ROOT_STATE
+    #the same line is lexed differently outside the string
+    outside, _ = lexer.lex("    still in the string", ROOT_STATE)
+    assert not all(ttype in String for ttype, value in outside if value.strip())
+
+
+def test_lexed_lines_are_cached_per_entry_state():
+    lexer = LineLexer()
+    assert lexer.peek("x = 1", ROOT_STATE) is None
+    result = lexer.lex("x = 1", ROOT_STATE)
+    assert lexer.peek("x = 1", ROOT_STATE) is result
+    _, string_state = lexer.lex('"""', ROOT_STATE)
+    assert lexer.peek("x = 1", string_state) is None
+    #unknown states, like Qt's -1 for a block never highlighted, start at the root
+    assert lexer.lex("x = 1", -1) is result
+
+
+def test_highlighter_carries_state_across_blocks(app):
+    editor = QPlainTextEdit()
+    highlighter = PygmentsHighlighter(editor.document(), editor=editor)
+    editor.setPlainText("a = 1\nb = 2\nc = 3")
+    blocks = lambda: [editor.document().findBlockByNumber(i).userState() for i in range(3)]
+    assert blocks() == [ROOT_STATE] * 3
+    cursor = QTextCursor(editor.document())
+    cursor.insertText('"""')
+    #the string opened on the first line runs to the end of the document
+    assert all(state != ROOT_STATE for state in blocks())
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    cursor.insertText('"""')
+    assert blocks()[:2] != [ROOT_STATE] * 2 and blocks()[2] == ROOT_STATE
+    cursor.setPosition(0)
+    cursor.setPosition(3, QTextCursor.MoveMode.KeepAnchor)
+    cursor.removeSelectedText()
+    assert blocks()[:2] == [ROOT_STATE] * 2
+    editor.close()
+    del highlighter
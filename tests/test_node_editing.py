@@ -0,0 +1,57 @@
+from PySide6.QtGui import QTextCursor
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+
+
+def editorCanvas(codes):
+    model = GraphModel()
+    for i, code in enumerate(codes):
+        model.createNode(code=code, x=i * 400.0)
+    canvas = NodeCanvas()
+    canvas.setModel(model)
+    for item in canvas.nodes.values():
+        item.loadEditor()
+    return canvas
+
+
+def replace(item, start, length, text):
+    cursor = QTextCursor(item.code_editor.document())
+    cursor.setPosition(start)
+    cursor.setPosition(start + length, QTextCursor.MoveMode.KeepAnchor)
+    cursor.insertText(text)
+
+
+def test_edits_are_recorded_from_the_changed_span(app):
+    code = "def f(x):\n    return x\n\nprint(f(1))"
+    canvas = editorCanvas([code])
+    item = next(iter(canvas.nodes.values()))
+    canvas.history.coalesce_time = 0#every edit is its own command
+    edits = [(13, 6, "yield"), (10, 0, "    y = x\n"), (4, 20, "g(y):\n  pass"), (0, 0, "#été\n")]
+    for start, length, text in edits:
+        expected = item.node.code[:start] + text + item.node.code[start + length:]
+        replace(item, start, length, text)
+        assert item.node.code_source is not None#the code is read when it is needed
+        assert item.node.code == expected == item.code_editor.toPlainText()
+    assert [command.inserted for command in canvas.history.done] == [text for start, length, text in edits]
+    for _ in edits:
+        canvas.undo()
+    assert item.node.code == code == item.code_editor.toPlainText()
+    for _ in edits:
+        canvas.redo()
+    assert item.node.code == item.code_editor.toPlainText()
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
+
+
+def test_rebound_item_keeps_the_code_of_the_node_it_showed(app):
+    canvas = editorCanvas(["a = 1", "b = 2"])
+    first, second = canvas.nodes.values()
+    replace(first, 4, 1, "10\nc = 3")
+    node = first.node
+    first.bind(second.node)
+    first.loadEditor()
+    replace(first, 0, 1, "d")
+    assert node.code == "a = 10\nc = 3"
+    assert second.node.code == "d = 2"
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()
@@ -0,0 +1,47 @@
+import os
+from Executor import Executor, Plan, THREADS, SUCCEEDED
+from GraphModel import GraphModel
+from ResultCache import ResultCache
+
+
+def test_cache_serves_copies(tmp_path):
+    for directory in (None, str(tmp_path)):
+        cache = ResultCache(directory=directory)
+        value = [1, 2]
+        cache.put("key", value, "digest")
+        value.append(3)
+        first, digest = cache.get("key")
+        first.append(4)
+        assert cache.get("key") == ([1, 2], "digest")
+        assert digest == "digest"
+
+
+def test_node_mutating_its_input_keeps_the_cache(app):
+    model = GraphModel()
+    source = model.createNode(code="result = [1, 2]")
+    dest = model.createNode()
+    model.connect(source.output_pin, dest.input_pin)
+    executor = Executor(workers=2, mode=THREADS, cache=ResultCache())
+    try:
+        for run in range(2):
+            #the node that changes its input runs every time, the one upstream is cached
+            dest.setCode(f"inputs[0].append(3)\nresult = len(inputs[0])#run {run}")
+            results = executor.run(Plan(model))
+            assert results[source.id].status == SUCCEEDED
+            assert results[source.id].cached == (run == 1)
+            assert results[dest.id].value == 3
+    finally:
+        executor.shutdown()
+
+
+def test_unwritable_disk_tier_keeps_the_memory_entry(tmp_path, monkeypatch):
+    cache = ResultCache(directory=str(tmp_path))
+
+    def fullDisk(source, destination):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", fullDisk)
+    cache.put("key", [1, 2], "digest")
+    assert cache.get("key") == ([1, 2], "digest")
+    assert cache.disk_files == {} and cache.disk_bytes == 0
+    assert os.listdir(tmp_path) == []
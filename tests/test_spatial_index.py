@@ -0,0 +1,42 @@
+import random
+from SpatialIndex import SpatialIndex
+
+
+def bruteForce(rects, x1, y1, x2, y2):
+    return {key for key, rect in rects.items() if SpatialIndex.intersects(rect, x1, y1, x2, y2)}
+
+
+def test_queries_match_a_brute_force_search():
+    random.seed(4)
+    index = SpatialIndex(cell_size=100.0, max_cells=16)
+    rects = {}
+    for step in range(2000):
+        key = random.randrange(300)
+        if random.random() < 0.2:
+            index.remove(key)
+            rects.pop(key, None)
+        else:
+            x, y = random.uniform(-2000, 2000), random.uniform(-2000, 2000)
+            #some long, thin rectangles like edges across the canvas
+            width, height = random.choice([(random.uniform(1, 300), random.uniform(1, 300)),
+                                           (random.uniform(1000, 3000), 2.0)])
+            index.insert(key, x, y, x + width, y + height)
+            rects[key] = (x, y, x + width, y + height)
+        if step % 50 == 0:
+            x, y = random.uniform(-2500, 2500), random.uniform(-2500, 2500)
+            query = (x, y, x + random.uniform(0, 1500), y + random.uniform(0, 1500))
+            assert index.query(*query) == bruteForce(rects, *query)
+    assert len(index) == len(rects)
+    assert index.large#the long rectangles aren't stored in the grid
+
+
+def test_moved_and_removed_rectangles_leave_no_cells():
+    index = SpatialIndex(cell_size=100.0)
+    index.insert("a", 0, 0, 250, 250)
+    index.insert("a", 1000, 1000, 1010, 1010)
+    assert index.query(0, 0, 300, 300) == set()
+    assert index.query(990, 990, 1000, 1000) == {"a"}
+    assert index.bounds() == (1000, 1000, 1010, 1010)
+    index.remove("a")
+    assert index.cells == {} and len(index) == 0
+    assert index.bounds() == (0.0, 0.0, 0.0, 0.0)
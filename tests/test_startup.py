@@ -0,0 +1,10 @@
+from MainWindow import MainWindow
+
+
+def test_main_window_starts(app):
+    window = MainWindow()
+    window.show()
+    app.processEvents()
+    assert window.node_canvas.perf is not None
+    window.close()
+    app.processEvents()
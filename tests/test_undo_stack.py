@@ -0,0 +1,79 @@
+from GraphModel import GraphModel
+from NodeCanvas import NodeCanvas
+from UndoStack import UndoStack, EditCode, MoveNodes, COMMAND_COST, textDelta
+
+
+def test_typing_in_one_place_is_merged():
+    stack = UndoStack(coalesce_time=60)
+    for i, char in enumerate("abc"):
+        stack.push(EditCode(1, i, "", char))
+    stack.push(EditCode(1, 2, "c", ""))#backspace
+    assert len(stack) == 1
+    command = stack.done[0]
+    assert (command.start, command.removed, command.inserted) == (0, "", "ab")
+    #another node, or a place away from the last edit, starts a new entry
+    stack.push(EditCode(2, 0, "", "x"))
+    stack.push(EditCode(2, 10, "", "y"))
+    assert len(stack) == 3
+
+
+def test_merge_stops_after_the_coalesce_time_or_an_undo():
+    stack = UndoStack(coalesce_time=0)
+    stack.push(EditCode(1, 0, "", "a"))
+    stack.push(EditCode(1, 1, "", "b"))
+    assert len(stack) == 2
+    stack = UndoStack(coalesce_time=60)
+    stack.push(MoveNodes({1: ((0, 0), (5, 5))}))
+    stack.push(MoveNodes({1: ((5, 5), (9, 9))}))
+    assert len(stack) == 1 and stack.done[0].positions == {1: ((0, 0), (9, 9))}
+    stack.breakMerge()
+    stack.push(MoveNodes({1: ((9, 9), (0, 0))}))
+    assert len(stack) == 2
+
+
+def test_edits_that_cancel_out_leave_no_entry():
+    stack = UndoStack(coalesce_time=60)
+    stack.push(EditCode(1, 4, "", "x"))
+    stack.push(EditCode(1, 4, "x", ""))
+    assert len(stack) == 0 and stack.total_cost == 0
+
+
+def test_oldest_commands_are_evicted_over_the_budget():
+    stack = UndoStack(budget=3 * (COMMAND_COST + 100), coalesce_time=0)
+    for i in range(5):
+        stack.push(EditCode(i, 0, "", "x" * 100))
+    assert [command.node_id for command in stack.done] == [2, 3, 4]
+    assert stack.evicted == 2
+    assert stack.total_cost == sum(command.cost() for command in stack.done)
+    #the newest command is kept whatever it costs
+    stack.push(EditCode(9, 0, "", "x" * 10000))
+    assert [command.node_id for command in stack.done] == [9]
+    stack.setBudget(10 ** 6)
+    assert len(stack) == 1
+
+
+def test_text_delta_is_trimmed_to_what_changed():
+    assert textDelta("hello world", "hello there world") == (6, "", "there ")
+    #a wrong report from the editor is found by comparing
+    assert textDelta("abc", "abXc", 0, 3, 4) == (2, "", "X")
+    assert textDelta("abc", "abXc", 0, 1, 1) == (2, "", "X")
+
+
+def test_canvas_undo_and_redo_of_added_and_moved_nodes(app):
+    model = GraphModel()
+    original = model.createNode(code="a = 1")
+    canvas = NodeCanvas()
+    canvas.setModel(model)
+    canvas.history.coalesce_time = 0
+    copy, = canvas.duplicateNodes([original], 10.0, 10.0)
+    canvas.moveNodes([copy], 30.0, 40.0)
+    assert copy.pos() == (40.0, 50.0)
+    canvas.undo()
+    assert copy.pos() == (10.0, 10.0)
+    canvas.undo()
+    assert list(canvas.model.nodes) == [original.id]
+    canvas.redo()
+    canvas.redo()
+    assert canvas.model.nodes[copy.id] is copy and copy.pos() == (40.0, 50.0)
+    canvas.runner.shutdown()
+    canvas.analyzer.shutdown()